@@ -1,7 +1,36 @@
-from fastapi import APIRouter, HTTPException, Request, Query
-from app.models.rdp import RdpSessionsGroupedResponse
-from app.services.rdp_service import get_rdp_sessions
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Iterator, Optional
+from app.models.rdp import (
+    AvailableDatesResponse,
+    CacheInvalidationResponse,
+    CollectorStatusResponse,
+    ConcurrencyResponse,
+    RdpSessionsGroupedResponse,
+    RdpSessionsPageResponse,
+    ServerHealthResponse,
+    ServerStatsResponse,
+    UserStatsResponse,
+    WinRMPoolResponse,
+)
+from app.services.rdp_service import (
+    get_available_dates_async,
+    get_concurrency_async,
+    get_rdp_report_async,
+    get_rdp_sessions_page_async,
+    get_rdp_stats_async,
+    invalidate_report_cache,
+    iter_report_days,
+    iter_report_rows,
+    sync_report_period_async,
+)
+from app.services.health import degraded_servers, server_health_status
+from app.services.ps_commands import report_bounds
+from app.services.scheduler import collector_status
+from app.services.winrm_pool import winrm_pool_status
+from app.utils.fast_json import FastJSONResponse, dumps
 from app.utils.logger import get_logger
+from app.utils.metrics import observe_stage
 
 router = APIRouter()
 log = get_logger(__name__)
@@ -18,7 +47,11 @@ example_grouped_response = {
                     "logout_server": "server1",
                     "login_time": "09:00:00",
                     "logout_time": "18:00:00",
-                    "duration": "9:00:00"
+                    "duration": "9:00:00",
+                    "duration_seconds": 32400,
+                    "login_timestamp": 1751349600,
+                    "logout_timestamp": 1751382000,
+                    "open": False,
                 }
             ],
             "petrov": [
@@ -28,9 +61,13 @@ example_grouped_response = {
                     "logout_server": "server2",
                     "login_time": "10:00:00",
                     "logout_time": "17:00:00",
-                    "duration": "7:00:00"
+                    "duration": "7:00:00",
+                    "duration_seconds": 25200,
+                    "login_timestamp": 1751353200,
+                    "logout_timestamp": 1751378400,
+                    "open": False,
                 }
-            ]
+            ],
         },
         "2025-07-02": {
             "ivanov": [
@@ -40,7 +77,11 @@ example_grouped_response = {
                     "logout_server": "нет выхода",
                     "login_time": "09:10:00",
                     "logout_time": "23:59:59",
-                    "duration": "14:49:59 (нет выхода)"
+                    "duration": "14:50:00 (нет выхода)",
+                    "duration_seconds": 53400,
+                    "login_timestamp": 1751436600,
+                    "logout_timestamp": 1751490000,
+                    "open": True,
                 }
             ]
         },
@@ -52,11 +93,17 @@ example_grouped_response = {
                     "logout_server": "server1",
                     "login_time": "08:30:00",
                     "logout_time": "16:30:00",
-                    "duration": "8:00:00"
+                    "duration": "8:00:00",
+                    "duration_seconds": 28800,
+                    "login_timestamp": 1751520600,
+                    "logout_timestamp": 1751549400,
+                    "open": False,
                 }
             ]
-        }
-    }
+        },
+    },
+    "failures": [],
+    "degraded_servers": [],
 }
 
 endpoint_grouped_description = """
@@ -69,15 +116,28 @@ endpoint_grouped_description = """
 **Структура ответа:**
 - `start_date` — Начальная дата периода отчёта (YYYY-MM-DD)
 - `end_date` — Конечная дата периода отчёта (YYYY-MM-DD)
-- `dates` — словарь, где ключ — дата (YYYY-MM-DD), значение — словарь username → список сессий пользователя за этот день
+- `dates` — словарь, где ключ — дата (YYYY-MM-DD), значение — словарь username →
+  список сессий пользователя за этот день
     - `username` — имя пользователя (логин)
         - список сессий пользователя за день, каждая сессия содержит:
             - `user_id` — SID пользователя (уникальный идентификатор в Windows)
             - `login_server` — Сервер, на который был выполнен вход
-            - `logout_server` — Сервер, с которого был выполнен выход (или "нет выхода", если не найден)
+            - `logout_server` — Сервер, с которого был выполнен выход
+              (или "нет выхода", если не найден)
             - `login_time` — Время входа в сессию (часы:минуты:секунды)
             - `logout_time` — Время выхода из сессии (часы:минуты:секунды)
-            - `duration` — Длительность сессии (часы:минуты:секунды, либо с пометкой "(нет выхода)")
+            - `duration` — Длительность сессии (часы:минуты:секунды,
+              либо с пометкой "(нет выхода)")
+            - `duration_seconds` — Длительность сессии за этот день в секундах
+            - `login_timestamp`, `logout_timestamp` — Начало и окончание сессии
+              в этот день, секунды epoch
+            - `open` — `true`, если событие выхода не найдено
+- `failures` — периоды серверов, которые не удалось загрузить
+  (`server`, `start`, `end`, `error`); отчёт за эти периоды может быть неполным,
+  остальные данные возвращаются как обычно
+- `degraded_servers` — серверы, которые пропускаются после ошибок подряд
+  (`skipped: true`, данные по ним берутся из локального хранилища) или отвечали
+  с ошибками; подробнее — `/collector/health`
 
 **Пример ответа:**
 ```
@@ -93,7 +153,11 @@ endpoint_grouped_description = """
           "logout_server": "server1",
           "login_time": "09:00:00",
           "logout_time": "18:00:00",
-          "duration": "9:00:00"
+          "duration": "9:00:00",
+          "duration_seconds": 32400,
+          "login_timestamp": 1751349600,
+          "logout_timestamp": 1751382000,
+          "open": false
         }
       ],
       "petrov": [
@@ -103,7 +167,11 @@ endpoint_grouped_description = """
           "logout_server": "server2",
           "login_time": "10:00:00",
           "logout_time": "17:00:00",
-          "duration": "7:00:00"
+          "duration": "7:00:00",
+          "duration_seconds": 25200,
+          "login_timestamp": 1751353200,
+          "logout_timestamp": 1751378400,
+          "open": false
         }
       ]
     },
@@ -115,7 +183,11 @@ endpoint_grouped_description = """
           "logout_server": "нет выхода",
           "login_time": "09:10:00",
           "logout_time": "23:59:59",
-          "duration": "14:49:59 (нет выхода)"
+          "duration": "14:50:00 (нет выхода)",
+          "duration_seconds": 53400,
+          "login_timestamp": 1751436600,
+          "logout_timestamp": 1751490000,
+          "open": true
         }
       ]
     },
@@ -127,11 +199,17 @@ endpoint_grouped_description = """
           "logout_server": "server1",
           "login_time": "08:30:00",
           "logout_time": "16:30:00",
-          "duration": "8:00:00"
+          "duration": "8:00:00",
+          "duration_seconds": 28800,
+          "login_timestamp": 1751520600,
+          "logout_timestamp": 1751549400,
+          "open": false
         }
       ]
     }
-  }
+  },
+  "failures": [],
+  "degraded_servers": []
 }
 ```
 """
@@ -142,33 +220,386 @@ endpoint_grouped_description = """
     response_model=RdpSessionsGroupedResponse,
     summary="Получить сгруппированный отчёт по RDP-сессиям",
     description=endpoint_grouped_description,
-    response_description="JSON-отчёт по сессиям пользователей, сгруппированный по дате и username",
+    response_description=(
+        "JSON-отчёт по сессиям пользователей, сгруппированный по дате и username"
+    ),
     tags=["RDP Sessions"],
     responses={
         200: {
             "description": "Успешный ответ с отчётом по сессиям (группировка)",
-            "content": {
-                "application/json": {
-                    "example": example_grouped_response
-                }
-            }
+            "content": {"application/json": {"example": example_grouped_response}},
         },
         400: {"description": "Неверные параметры запроса"},
-        500: {"description": "Внутренняя ошибка сервера"}
-    }
+        500: {"description": "Внутренняя ошибка сервера"},
+    },
 )
-def get_sessions(
-        start_date: str = Query(..., description="Начальная дата периода отчёта (YYYY-MM-DD)", example="2025-07-01"),
-        end_date: str = Query(..., description="Конечная дата периода отчёта (YYYY-MM-DD)", example="2025-07-03")
+async def get_sessions(
+    start_date: str = Query(
+        ...,
+        description="Начальная дата периода отчёта (YYYY-MM-DD)",
+        example="2025-07-01",
+    ),
+    end_date: str = Query(
+        ...,
+        description="Конечная дата периода отчёта (YYYY-MM-DD)",
+        example="2025-07-03",
+    ),
 ):
     log.info(f"GET /sessions: {start_date} - {end_date}")
     try:
-        grouped = get_rdp_sessions(start_date, end_date)
-        return RdpSessionsGroupedResponse(
-            start_date=start_date,
-            end_date=end_date,
-            dates=grouped
-        )
+        grouped, failures = await get_rdp_report_async(start_date, end_date)
+        # Сессии сформированы сервисом и соответствуют RdpSession: ответ сериализуется
+        # напрямую, без повторной проверки по response_model
+        with observe_stage("serialization"):
+            return FastJSONResponse(
+                {
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "dates": grouped,
+                    "failures": [failure.as_dict() for failure in failures],
+                    "degraded_servers": degraded_servers(),
+                }
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         log.error(f"Ошибка при формировании отчёта: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def _ndjson_lines(
+    start_date: str, end_date: str, mode: str, failures: list
+) -> Iterator[bytes]:
+    try:
+        if mode == "day":
+            for day, users in iter_report_days(start_date, end_date, failures):
+                yield _ndjson({"date": day, "users": users})
+        else:
+            for day, username, _, session in iter_report_rows(
+                start_date, end_date, failures=failures
+            ):
+                yield _ndjson({"date": day, "username": username, **session})
+        if failures:
+            yield _ndjson(
+                {
+                    "failures": [failure.as_dict() for failure in failures],
+                    "degraded_servers": degraded_servers(),
+                }
+            )
+    except Exception as e:
+        # Заголовки уже отправлены: сообщаем об ошибке последней строкой
+        log.error(f"Ошибка при потоковой выдаче отчёта: {e}")
+        yield _ndjson({"error": str(e)})
+
+
+def _ndjson(item: dict) -> bytes:
+    return dumps(item) + b"\n"
+
+
+@router.get(
+    "/sessions/stream",
+    summary="Потоковый отчёт по RDP-сессиям (NDJSON)",
+    description=(
+        "Тот же отчёт, что и `/sessions`, в формате NDJSON: при `mode=session` — одна "
+        "сессия на строку (`date`, `username` и поля сессии), при `mode=day` — один "
+        "день на строку (`date`, `users`: username → список сессий). Дни "
+        "рассчитываются порциями, первые строки приходят до окончания расчёта всего "
+        "периода. При ошибке в процессе выдачи последней строкой передаётся "
+        '`{"error": ...}`. Если часть периода не удалось загрузить с серверов, '
+        'последней строкой передаётся `{"failures": [...], "degraded_servers": [...]}` '
+        "(как в `/sessions`)."
+    ),
+    response_description="Поток строк JSON (application/x-ndjson)",
+    tags=["RDP Sessions"],
+    responses={
+        400: {"description": "Неверные параметры запроса"},
+        500: {"description": "Внутренняя ошибка сервера"},
+    },
+)
+async def stream_sessions(
+    start_date: str = Query(
+        ...,
+        description="Начальная дата периода отчёта (YYYY-MM-DD)",
+        example="2025-07-01",
+    ),
+    end_date: str = Query(
+        ...,
+        description="Конечная дата периода отчёта (YYYY-MM-DD)",
+        example="2025-07-03",
+    ),
+    mode: str = Query(
+        "session",
+        pattern="^(session|day)$",
+        description="session — строка на сессию, day — на день",
+    ),
+):
+    log.info(f"GET /sessions/stream: {start_date} - {end_date} ({mode})")
+    try:
+        report_bounds(start_date, end_date)
+        # Синхронизация до начала ответа, чтобы её ошибки вернулись кодом ответа
+        failures = await sync_report_period_async(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log.error(f"Ошибка при формировании отчёта: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        _ndjson_lines(start_date, end_date, mode, failures),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get(
+    "/sessions/page",
+    response_model=RdpSessionsPageResponse,
+    summary="Постраничный отчёт по RDP-сессиям",
+    description=(
+        "Сессии за период списком в порядке даты, username и времени входа, не больше "
+        "`limit` за запрос. Для следующей страницы передайте `next_cursor` из ответа в "
+        "параметре `cursor`."
+    ),
+    tags=["RDP Sessions"],
+    responses={
+        400: {"description": "Неверные параметры запроса"},
+        500: {"description": "Внутренняя ошибка сервера"},
+    },
+)
+async def get_sessions_page(
+    start_date: str = Query(
+        ...,
+        description="Начальная дата периода отчёта (YYYY-MM-DD)",
+        example="2025-07-01",
+    ),
+    end_date: str = Query(
+        ...,
+        description="Конечная дата периода отчёта (YYYY-MM-DD)",
+        example="2025-07-03",
+    ),
+    limit: int = Query(1000, ge=1, le=10000, description="Максимум сессий на странице"),
+    cursor: Optional[str] = Query(
+        None, description="Курсор из next_cursor предыдущей страницы"
+    ),
+):
+    log.info(f"GET /sessions/page: {start_date} - {end_date}, limit={limit}")
+    try:
+        page = await get_rdp_sessions_page_async(start_date, end_date, limit, cursor)
+        return RdpSessionsPageResponse(start_date=start_date, end_date=end_date, **page)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log.error(f"Ошибка при формировании отчёта: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+_stats_description = (
+    "Суммарная длительность сессий {what} за период: по дням (`group=day`), месяцам "
+    "(`group=month`) или за весь период (`group=total`). Считается по предрассчитанным "
+    "агрегатам, которые обновляются при загрузке новых событий, поэтому запрос за год "
+    "не перебирает сами события."
+)
+
+
+async def _get_stats(
+    dimension: str, start_date: str, end_date: str, group: str
+) -> list:
+    log.info(f"GET /stats/{dimension}s: {start_date} - {end_date} ({group})")
+    try:
+        return await get_rdp_stats_async(dimension, start_date, end_date, group)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log.error(f"Ошибка при расчёте агрегатов: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get(
+    "/stats/users",
+    response_model=UserStatsResponse,
+    summary="Агрегаты по пользователям",
+    description=_stats_description.format(what="каждого пользователя"),
+    tags=["RDP Statistics"],
+    responses={
+        400: {"description": "Неверные параметры запроса"},
+        500: {"description": "Внутренняя ошибка сервера"},
+    },
+)
+async def get_user_stats(
+    start_date: str = Query(
+        ..., description="Начальная дата периода (YYYY-MM-DD)", example="2025-07-01"
+    ),
+    end_date: str = Query(
+        ..., description="Конечная дата периода (YYYY-MM-DD)", example="2025-07-31"
+    ),
+    group: str = Query(
+        "total", pattern="^(day|month|total)$", description="day, month или total"
+    ),
+):
+    items = await _get_stats("user", start_date, end_date, group)
+    return UserStatsResponse(
+        start_date=start_date, end_date=end_date, group=group, items=items
+    )
+
+
+@router.get(
+    "/stats/servers",
+    response_model=ServerStatsResponse,
+    summary="Агрегаты по серверам",
+    description=_stats_description.format(what="на каждом сервере (по серверу входа)"),
+    tags=["RDP Statistics"],
+    responses={
+        400: {"description": "Неверные параметры запроса"},
+        500: {"description": "Внутренняя ошибка сервера"},
+    },
+)
+async def get_server_stats(
+    start_date: str = Query(
+        ..., description="Начальная дата периода (YYYY-MM-DD)", example="2025-07-01"
+    ),
+    end_date: str = Query(
+        ..., description="Конечная дата периода (YYYY-MM-DD)", example="2025-07-31"
+    ),
+    group: str = Query(
+        "total", pattern="^(day|month|total)$", description="day, month или total"
+    ),
+):
+    items = await _get_stats("server", start_date, end_date, group)
+    return ServerStatsResponse(
+        start_date=start_date, end_date=end_date, group=group, items=items
+    )
+
+
+@router.get(
+    "/stats/concurrency",
+    response_model=ConcurrencyResponse,
+    summary="Одновременные сессии по серверам",
+    description=(
+        "Для каждого сервера (по серверу входа): максимум одновременных сессий за "
+        "период и момент его достижения, 95-й перцентиль по времени, максимумы по дням "
+        "и по каждому часу (тепловая карта день × час). Сессия без события выхода "
+        "учитывается до 23:59:59 дня входа или не дольше RDP_MAX_OPEN_SESSION_HOURS "
+        "часов от входа, если задано."
+    ),
+    tags=["RDP Statistics"],
+    responses={
+        400: {"description": "Неверные параметры запроса"},
+        500: {"description": "Внутренняя ошибка сервера"},
+    },
+)
+async def get_concurrency_stats(
+    start_date: str = Query(
+        ..., description="Начальная дата периода (YYYY-MM-DD)", example="2025-07-01"
+    ),
+    end_date: str = Query(
+        ..., description="Конечная дата периода (YYYY-MM-DD)", example="2025-07-31"
+    ),
+):
+    log.info(f"GET /stats/concurrency: {start_date} - {end_date}")
+    try:
+        servers = await get_concurrency_async(start_date, end_date)
+        return ConcurrencyResponse(
+            start_date=start_date, end_date=end_date, servers=servers
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        log.error(f"Ошибка при расчёте одновременных сессий: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get(
+    "/available-dates",
+    response_model=AvailableDatesResponse,
+    summary="Доступный период данных",
+    description=(
+        "За какой период на серверах есть события входа/выхода: самое старое и самое "
+        "новое событие в журнале, свойства журнала (режим, размер) и число событий за "
+        "последние 30 и 90 дней, а также период, сохранённый в локальном хранилище. "
+        "Журнал целиком не выгружается; сведения по серверам кэшируются на "
+        "`RDP_AVAILABILITY_TTL` секунд, `refresh=true` — опросить серверы заново."
+    ),
+    tags=["RDP Sessions"],
+    responses={500: {"description": "Внутренняя ошибка сервера"}},
+)
+async def get_available_dates(
+    refresh: bool = Query(False, description="Опросить серверы, не используя кэш")
+):
+    log.info(f"GET /available-dates (refresh={refresh})")
+    try:
+        return AvailableDatesResponse(**await get_available_dates_async(refresh))
+    except Exception as e:
+        log.error(f"Ошибка при проверке доступных дат: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete(
+    "/cache",
+    response_model=CacheInvalidationResponse,
+    summary="Сбросить кэш отчёта",
+    description=(
+        "Удаляет из кэша отчёт за указанные дни (или весь кэш, если даты не заданы). "
+        "Следующий запрос за эти дни будет рассчитан заново."
+    ),
+    tags=["RDP Sessions"],
+    responses={400: {"description": "Неверные параметры запроса"}},
+)
+def invalidate_cache(
+    start_date: Optional[str] = Query(
+        None, description="Начальная дата (YYYY-MM-DD)", example="2025-07-01"
+    ),
+    end_date: Optional[str] = Query(
+        None, description="Конечная дата (YYYY-MM-DD)", example="2025-07-03"
+    ),
+):
+    log.info(f"DELETE /cache: {start_date} - {end_date}")
+    try:
+        invalidated = invalidate_report_cache(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return CacheInvalidationResponse(invalidated=invalidated)
+
+
+@router.get(
+    "/collector/status",
+    response_model=CollectorStatusResponse,
+    summary="Состояние фонового сборщика",
+    description=(
+        "Показывает, включён ли фоновый сборщик событий, и время последней успешной "
+        "синхронизации каждого сервера."
+    ),
+    tags=["RDP Sessions"],
+)
+def get_collector_status():
+    log.info("GET /collector/status")
+    return CollectorStatusResponse(**collector_status())
+
+
+@router.get(
+    "/collector/pool",
+    response_model=WinRMPoolResponse,
+    summary="Пул подключений WinRM",
+    description=(
+        "Статистика переиспользуемых подключений к серверам: свободные и занятые "
+        "подключения, число созданных, переиспользованных и закрытых."
+    ),
+    tags=["RDP Sessions"],
+)
+def get_pool_status():
+    log.info("GET /collector/pool")
+    return WinRMPoolResponse(**winrm_pool_status())
+
+
+@router.get(
+    "/collector/health",
+    response_model=ServerHealthResponse,
+    summary="Состояние серверов",
+    description=(
+        "Автомат защиты по серверам: сервер, ответивший ошибкой несколько раз подряд, "
+        "пропускается на паузу, которая удваивается при каждой следующей неудаче, "
+        "затем проверяется одним пробным запросом. Также показаны сглаженная задержка "
+        "ответа и текущий таймаут, подобранный по ней."
+    ),
+    tags=["RDP Sessions"],
+)
+def get_server_health_status():
+    log.info("GET /collector/health")
+    return ServerHealthResponse(**server_health_status())
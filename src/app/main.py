@@ -1,6 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from app.api.v1 import rdp
-from app.utils.logger import get_logger
+from app.services.scheduler import start_scheduler, stop_scheduler
+from app.services.winrm_pool import close_winrm_pool
+from app.utils.logger import RequestLogMiddleware, get_logger
+from app.utils.metrics import METRICS_CONTENT_TYPE, render_metrics
 
 log = get_logger(__name__)
 
@@ -16,33 +19,49 @@ API для сбора и анализа статистики RDP-сессий п
 
 **Автор:** Ваша команда
 """,
-    contact={
-        "name": "RDP Stats Team",
-        "email": "support@example.com"
-    },
+    contact={"name": "RDP Stats Team", "email": "support@example.com"},
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
 )
 
 app.include_router(rdp.router, prefix="/api/v1/rdp", tags=["RDP Sessions"])
+# Идентификатор запроса (X-Request-ID) в журнале и итоговая запись о запросе с
+# длительностями этапов
+app.add_middleware(RequestLogMiddleware)
 
 
 @app.on_event("startup")
 def on_startup():
+    start_scheduler()
     log.info("FastAPI приложение успешно запущено!")
 
 
+@app.on_event("shutdown")
+def on_shutdown():
+    stop_scheduler()
+    close_winrm_pool()
+    log.info("FastAPI приложение остановлено")
+
+
 @app.get("/")
 def root():
     log.info("Обращение к корневому эндпоинту API")
     return {"message": "RDP Sessions API", "docs": "/docs"}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.exception_handler(Exception)
 def global_exception_handler(request, exc):
     log.error(f"Глобальная ошибка: {exc}")
     from fastapi.responses import JSONResponse
-    return JSONResponse(status_code=500, content={"error": "Internal Server Error", "detail": str(exc)})
+
+    return JSONResponse(
+        status_code=500, content={"error": "Internal Server Error", "detail": str(exc)}
+    )
 
 
 if __name__ == "__main__":
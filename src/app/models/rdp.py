@@ -1,31 +1,334 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 
 class RdpSession(BaseModel):
-    user_id: str = Field(..., description="SID пользователя (уникальный идентификатор в Windows)")
+    user_id: str = Field(
+        ..., description="SID пользователя (уникальный идентификатор в Windows)"
+    )
     login_server: str = Field(..., description="Сервер, на который был выполнен вход")
-    logout_server: str = Field(...,
-                               description="Сервер, с которого был выполнен выход (или 'нет выхода', если не найден)")
-    login_time: str = Field(..., description="Время входа в сессию (часы:минуты:секунды)")
-    logout_time: str = Field(..., description="Время выхода из сессии (часы:минуты:секунды)")
-    duration: str = Field(..., description="Длительность сессии (часы:минуты:секунды, либо с пометкой '(нет выхода)')")
+    logout_server: str = Field(
+        ...,
+        description=(
+            "Сервер, с которого был выполнен выход (или 'нет выхода', если не найден)"
+        ),
+    )
+    login_time: str = Field(
+        ..., description="Время входа в сессию (часы:минуты:секунды)"
+    )
+    logout_time: str = Field(
+        ..., description="Время выхода из сессии (часы:минуты:секунды)"
+    )
+    duration: str = Field(
+        ...,
+        description=(
+            "Длительность сессии (часы:минуты:секунды, либо с пометкой '(нет выхода)')"
+        ),
+    )
+    duration_seconds: int = Field(
+        ..., description="Длительность сессии за этот день, секунды"
+    )
+    login_timestamp: int = Field(
+        ..., description="Начало сессии в этот день, секунды epoch"
+    )
+    logout_timestamp: int = Field(
+        ...,
+        description=(
+            "Окончание сессии в этот день (полночь, если сессия продолжается), "
+            "секунды epoch"
+        ),
+    )
+    open: bool = Field(..., description="Событие выхода не найдено")
+
+
+class SyncFailureItem(BaseModel):
+    server: str = Field(..., description="Имя сервера")
+    start: str = Field(..., description="Начало незагруженного периода (ISO 8601)")
+    end: str = Field(..., description="Окончание незагруженного периода (ISO 8601)")
+    error: str = Field(..., description="Текст ошибки")
+
+
+class ServerHealthItem(BaseModel):
+    server: str = Field(..., description="Сервер")
+    state: str = Field(
+        ...,
+        description=(
+            "Состояние автомата защиты: closed — опрашивается, open — пропускается до "
+            "retry_at, half_open — выполняется пробный запрос"
+        ),
+    )
+    skipped: bool = Field(
+        ..., description="Пропускается ли сервер сейчас (данные по нему — из хранилища)"
+    )
+    consecutive_failures: int = Field(0, description="Ошибок подряд")
+    last_error: Optional[str] = Field(None, description="Текст последней ошибки")
+    retry_at: Optional[str] = Field(
+        None, description="Когда сервер будет опрошен снова (ISO 8601)"
+    )
+    latency: Optional[float] = Field(
+        None, description="Сглаженная задержка запроса WinRM, секунды"
+    )
+    read_timeout: Optional[float] = Field(
+        None, description="Текущий таймаут ответа сервера, секунды"
+    )
+    skipped_requests: int = Field(0, description="Сколько раз сервер был пропущен")
 
 
 class RdpSessionsGroupedResponse(BaseModel):
-    start_date: str = Field(..., description="Начальная дата периода отчёта (YYYY-MM-DD)")
+    start_date: str = Field(
+        ..., description="Начальная дата периода отчёта (YYYY-MM-DD)"
+    )
+    end_date: str = Field(..., description="Конечная дата периода отчёта (YYYY-MM-DD)")
+    dates: Dict[str, Dict[str, List[RdpSession]]] = Field(
+        ..., description="Словарь дата -> username -> список сессий"
+    )
+    failures: List[SyncFailureItem] = Field(
+        [],
+        description=(
+            "Периоды серверов, которые не удалось загрузить: "
+            "отчёт за них может быть неполным"
+        ),
+    )
+    degraded_servers: List[ServerHealthItem] = Field(
+        [], description="Серверы, пропущенные или отвечавшие с ошибками"
+    )
+
+
+class RdpSessionRow(RdpSession):
+    date: str = Field(..., description="Дата (YYYY-MM-DD)")
+    username: str = Field(..., description="Имя пользователя (логин)")
+
+
+class RdpSessionsPageResponse(BaseModel):
+    start_date: str = Field(
+        ..., description="Начальная дата периода отчёта (YYYY-MM-DD)"
+    )
     end_date: str = Field(..., description="Конечная дата периода отчёта (YYYY-MM-DD)")
-    dates: Dict[str, Dict[str, List[RdpSession]]] = Field(..., description="Словарь дата -> username -> список сессий")
+    items: List[RdpSessionRow] = Field(
+        ..., description="Сессии в порядке даты, username и времени входа"
+    )
+    next_cursor: Optional[str] = Field(
+        None, description="Курсор следующей страницы (нет — страница последняя)"
+    )
+    failures: List[SyncFailureItem] = Field(
+        [], description="Периоды серверов, которые не удалось загрузить"
+    )
+    degraded_servers: List[ServerHealthItem] = Field(
+        [], description="Серверы, пропущенные или отвечавшие с ошибками"
+    )
+
+
+class UserStatsItem(BaseModel):
+    period: Optional[str] = Field(
+        None,
+        description="День (YYYY-MM-DD), месяц (YYYY-MM) или null для итога за период",
+    )
+    username: str = Field(..., description="Имя пользователя (логин)")
+    seconds: int = Field(..., description="Суммарная длительность сессий, секунды")
+    sessions: int = Field(
+        ..., description="Число сессий (сессия через полночь учитывается в каждом дне)"
+    )
+
+
+class ServerStatsItem(BaseModel):
+    period: Optional[str] = Field(
+        None,
+        description="День (YYYY-MM-DD), месяц (YYYY-MM) или null для итога за период",
+    )
+    server: str = Field(..., description="Сервер входа")
+    seconds: int = Field(..., description="Суммарная длительность сессий, секунды")
+    sessions: int = Field(
+        ..., description="Число сессий (сессия через полночь учитывается в каждом дне)"
+    )
+
+
+class UserStatsResponse(BaseModel):
+    start_date: str = Field(..., description="Начальная дата периода (YYYY-MM-DD)")
+    end_date: str = Field(..., description="Конечная дата периода (YYYY-MM-DD)")
+    group: str = Field(..., description="Группировка: day, month или total")
+    items: List[UserStatsItem] = Field(..., description="Агрегаты по пользователям")
+
+
+class ServerStatsResponse(BaseModel):
+    start_date: str = Field(..., description="Начальная дата периода (YYYY-MM-DD)")
+    end_date: str = Field(..., description="Конечная дата периода (YYYY-MM-DD)")
+    group: str = Field(..., description="Группировка: day, month или total")
+    items: List[ServerStatsItem] = Field(..., description="Агрегаты по серверам входа")
+
+
+class ServerConcurrencyItem(BaseModel):
+    server: str = Field(..., description="Сервер входа")
+    peak: int = Field(..., description="Максимум одновременных сессий за период")
+    peak_at: str = Field(
+        ..., description="Когда максимум был достигнут впервые (ISO 8601)"
+    )
+    p95: int = Field(
+        ..., description="95-й перцентиль по времени: 95% периода сессий было не больше"
+    )
+    daily_peak: Dict[str, int] = Field(
+        ..., description="Дата -> максимум одновременных сессий за день"
+    )
+    hourly_peak: Dict[str, List[int]] = Field(
+        ..., description="Дата -> максимумы за каждый час (24 значения)"
+    )
+
+
+class ConcurrencyResponse(BaseModel):
+    start_date: str = Field(..., description="Начальная дата периода (YYYY-MM-DD)")
+    end_date: str = Field(..., description="Конечная дата периода (YYYY-MM-DD)")
+    servers: List[ServerConcurrencyItem] = Field(
+        ..., description="Одновременные сессии по серверам"
+    )
+
+
+class CacheInvalidationResponse(BaseModel):
+    invalidated: int = Field(..., description="Количество удалённых из кэша дней")
+
+
+class CollectorServerStatus(BaseModel):
+    server: str = Field(..., description="Сервер")
+    last_success: Optional[str] = Field(
+        None, description="Время последней успешной синхронизации (ISO 8601)"
+    )
+    last_attempt: Optional[str] = Field(
+        None, description="Время последней попытки опроса (ISO 8601)"
+    )
+    last_error: Optional[str] = Field(None, description="Текст последней ошибки")
+    consecutive_failures: int = Field(0, description="Число ошибок подряд")
+    next_run: Optional[str] = Field(
+        None, description="Время следующего опроса (ISO 8601)"
+    )
+    owner: Optional[str] = Field(
+        None,
+        description=(
+            "Процесс сборщика, собирающий сервер сейчас (RDP_SCHEDULER_EXTERNAL)"
+        ),
+    )
+
+
+class CollectorStatusResponse(BaseModel):
+    enabled: bool = Field(
+        ..., description="Включён ли фоновый сборщик (RDP_SCHEDULER_ENABLED)"
+    )
+    external: bool = Field(
+        False,
+        description=(
+            "Сбор выполняют отдельные процессы run_collector.py "
+            "(RDP_SCHEDULER_EXTERNAL)"
+        ),
+    )
+    leader: bool = Field(..., description="Выполняет ли сбор этот процесс")
+    interval: int = Field(..., description="Период опроса серверов, секунды")
+    servers: List[CollectorServerStatus] = Field(
+        ..., description="Состояние синхронизации по серверам"
+    )
+
+
+class WinRMPoolServerStats(BaseModel):
+    server: str = Field(..., description="Сервер")
+    idle: int = Field(..., description="Свободных подключений в пуле")
+    in_use: int = Field(..., description="Подключений, занятых выполнением команд")
+    created: int = Field(..., description="Создано подключений")
+    reused: int = Field(
+        ..., description="Команд, выполненных на уже открытом подключении"
+    )
+    discarded: int = Field(
+        ..., description="Закрыто устаревших или завершившихся ошибкой подключений"
+    )
+    waits: int = Field(
+        ..., description="Сколько раз запрос ждал освобождения подключения"
+    )
+
+
+class WinRMPoolResponse(BaseModel):
+    max_per_server: int = Field(
+        ..., description="Максимум подключений к одному серверу"
+    )
+    idle_timeout: int = Field(
+        ...,
+        description="Время простоя, после которого подключение закрывается, секунды",
+    )
+    servers: List[WinRMPoolServerStats] = Field(
+        ..., description="Статистика пула по серверам"
+    )
+
+
+class ServerHealthResponse(BaseModel):
+    threshold: int = Field(
+        ..., description="Ошибок подряд, после которых сервер пропускается"
+    )
+    cooldown: float = Field(
+        ..., description="Пауза после первого размыкания, секунды (удваивается)"
+    )
+    servers: List[ServerHealthItem] = Field(..., description="Состояние серверов")
+
+
+class ServerAvailabilityItem(BaseModel):
+    server: str = Field(..., description="Сервер")
+    ok: bool = Field(..., description="Удалось ли получить сведения о журнале")
+    error: Optional[str] = Field(None, description="Текст ошибки опроса")
+    log_enabled: Optional[bool] = Field(
+        None, description="Включён ли журнал событий сессий"
+    )
+    log_mode: Optional[str] = Field(
+        None, description="Режим журнала: Circular, AutoBackup или Retain"
+    )
+    log_records: Optional[int] = Field(
+        None, description="Записей в журнале (всех кодов событий)"
+    )
+    log_size_bytes: Optional[int] = Field(None, description="Размер журнала, байт")
+    log_max_size_bytes: Optional[int] = Field(
+        None, description="Максимальный размер журнала, байт"
+    )
+    first_event: Optional[str] = Field(
+        None, description="Самое старое событие входа/выхода в журнале (ISO 8601)"
+    )
+    last_event: Optional[str] = Field(
+        None, description="Самое новое событие входа/выхода в журнале (ISO 8601)"
+    )
+    recent_events: Dict[str, int] = Field(
+        {},
+        description="Число событий входа/выхода за последние N дней: N -> количество",
+    )
+    stored_first_event: Optional[str] = Field(
+        None,
+        description="Самое старое событие сервера в локальном хранилище (ISO 8601)",
+    )
+    stored_last_event: Optional[str] = Field(
+        None,
+        description="Самое новое событие сервера в локальном хранилище (ISO 8601)",
+    )
+    checked_at: Optional[str] = Field(
+        None, description="Когда сервер был опрошен (ISO 8601)"
+    )
+
+
+class AvailableDatesResponse(BaseModel):
+    first_date: Optional[str] = Field(
+        None, description="Самая ранняя дата, за которую есть данные (YYYY-MM-DD)"
+    )
+    last_date: Optional[str] = Field(
+        None, description="Самая поздняя дата, за которую есть данные (YYYY-MM-DD)"
+    )
+    servers: List[ServerAvailabilityItem] = Field(
+        ..., description="Доступность данных по серверам"
+    )
 
 
 # Оставляем старые модели для обратной совместимости
 class RdpSessionRequest(BaseModel):
-    start_date: str = Field(..., description="Начальная дата периода отчёта (YYYY-MM-DD)")
+    start_date: str = Field(
+        ..., description="Начальная дата периода отчёта (YYYY-MM-DD)"
+    )
     end_date: str = Field(..., description="Конечная дата периода отчёта (YYYY-MM-DD)")
 
 
 class RdpSessionsResponse(BaseModel):
-    start_date: str = Field(..., description="Начальная дата периода отчёта (YYYY-MM-DD)")
+    start_date: str = Field(
+        ..., description="Начальная дата периода отчёта (YYYY-MM-DD)"
+    )
     end_date: str = Field(..., description="Конечная дата периода отчёта (YYYY-MM-DD)")
     total_sessions: int = Field(..., description="Общее количество сессий в отчёте")
-    sessions: List[RdpSession] = Field(..., description="Список сессий пользователей за период")
+    sessions: List[RdpSession] = Field(
+        ..., description="Список сессий пользователей за период"
+    )
@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from app.services.collector import (
+    ConnectionSettings,
+    load_connection_settings,
+    run_parallel,
+    run_ps_on_server,
+)
+from app.services.event_store import get_event_store
+from app.services.events import parse_ps_timestamp_ms
+from app.services.ps_commands import build_availability_command
+from app.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+# За сколько последних дней считается число событий
+AVAILABILITY_COUNT_DAYS = (30, 90)
+DEFAULT_AVAILABILITY_TTL = 300
+# Ошибку опроса кэшируем недолго, чтобы недоступный сервер не опрашивался на каждый
+# запрос
+DEFAULT_AVAILABILITY_ERROR_TTL = 30
+
+
+@dataclass
+class ServerAvailability:
+    server: str
+    ok: bool
+    error: Optional[str] = None
+    log_enabled: Optional[bool] = None
+    log_mode: Optional[str] = None  # Circular, AutoBackup, Retain
+    log_records: Optional[int] = None  # записей в журнале (всех кодов событий)
+    log_size_bytes: Optional[int] = None
+    log_max_size_bytes: Optional[int] = None
+    first_event: Optional[str] = (
+        None  # самое старое событие входа/выхода в журнале (ISO 8601)
+    )
+    last_event: Optional[str] = None  # самое новое
+    recent_events: Dict[str, int] = field(
+        default_factory=dict
+    )  # дней -> событий за последние N дней
+    stored_first_event: Optional[str] = (
+        None  # самое старое событие в локальном хранилище
+    )
+    stored_last_event: Optional[str] = None
+    checked_at: Optional[str] = None
+
+
+def _iso(time_ms: Optional[int]) -> Optional[str]:
+    if time_ms is None:
+        return None
+    return datetime.fromtimestamp(time_ms // 1000).isoformat()
+
+
+def _event_time(item: Optional[dict]) -> Optional[str]:
+    return _iso(parse_ps_timestamp_ms(item.get("TimeCreated"))) if item else None
+
+
+def parse_availability_output(std_out: bytes, server: str) -> ServerAvailability:
+    data = json.loads(std_out.decode("utf-8-sig", errors="ignore"))
+    return ServerAvailability(
+        server=server,
+        ok=True,
+        log_enabled=data.get("IsEnabled"),
+        log_mode=data.get("LogMode"),
+        log_records=data.get("RecordCount"),
+        log_size_bytes=data.get("FileSize"),
+        log_max_size_bytes=data.get("MaximumSizeInBytes"),
+        first_event=_event_time(data.get("Oldest")),
+        last_event=_event_time(data.get("Newest")),
+        recent_events={
+            str(days): int(count) for days, count in (data.get("Counts") or {}).items()
+        },
+    )
+
+
+def query_server_availability(
+    server: str, settings: ConnectionSettings
+) -> ServerAvailability:
+    # Один короткий запрос к серверу: журнал целиком не выгружается
+    result = run_ps_on_server(
+        server, build_availability_command(AVAILABILITY_COUNT_DAYS), settings
+    )
+    if result.ok:
+        try:
+            availability = parse_availability_output(result.std_out, server)
+        except Exception as e:
+            log.error(
+                "Сервер %s: не удалось разобрать сведения о журнале: %s",
+                server,
+                e,
+                extra={"server": server},
+            )
+            availability = ServerAvailability(
+                server=server, ok=False, error=f"Ошибка разбора ответа: {e}"
+            )
+    else:
+        availability = ServerAvailability(server=server, ok=False, error=result.error)
+    bounds = get_event_store().server_bounds(server)
+    if bounds is not None:
+        availability.stored_first_event, availability.stored_last_event = _iso(
+            bounds[0]
+        ), _iso(bounds[1])
+    availability.checked_at = datetime.now().isoformat(timespec="seconds")
+    return availability
+
+
+class AvailabilityCache:
+    # Сведения о журналах по серверам со сроком жизни ttl секунд
+    # (для ошибок опроса — error_ttl)
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_AVAILABILITY_TTL,
+        error_ttl: float = DEFAULT_AVAILABILITY_ERROR_TTL,
+    ):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._entries: Dict[str, Tuple[ServerAvailability, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, server: str) -> Optional[ServerAvailability]:
+        with self._lock:
+            entry = self._entries.get(server)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            return None
+
+    def put(self, availability: ServerAvailability) -> None:
+        ttl = self.ttl if availability.ok else self.error_ttl
+        with self._lock:
+            self._entries[availability.server] = (availability, time.monotonic() + ttl)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache: Optional[AvailabilityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_availability_cache() -> AvailabilityCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            load_dotenv()
+            _cache = AvailabilityCache(
+                ttl=float(os.getenv("RDP_AVAILABILITY_TTL", DEFAULT_AVAILABILITY_TTL))
+            )
+        return _cache
+
+
+def get_available_dates(refresh: bool = False) -> dict:
+    # Доступный период данных по серверам. Опрашиваются только серверы,
+    # сведений о которых нет в кэше (или все при refresh=True), параллельно.
+    settings = load_connection_settings()
+    cache = get_availability_cache()
+    servers: Dict[str, Optional[ServerAvailability]] = {
+        server: None if refresh else cache.get(server) for server in settings.servers
+    }
+    missing = [
+        server for server, availability in servers.items() if availability is None
+    ]
+    if missing:
+        log.info("Проверка доступных дат на серверах: %s", missing)
+        for server, availability in run_parallel(
+            lambda server: query_server_availability(server, settings),
+            missing,
+            settings.max_workers,
+        ).items():
+            cache.put(availability)
+            servers[server] = availability
+
+    items: List[ServerAvailability] = list(servers.values())
+    firsts = [
+        value
+        for item in items
+        for value in (item.first_event, item.stored_first_event)
+        if value
+    ]
+    lasts = [
+        value
+        for item in items
+        for value in (item.last_event, item.stored_last_event)
+        if value
+    ]
+    return {
+        "first_date": min(firsts)[:10] if firsts else None,
+        "last_date": max(lasts)[:10] if lasts else None,
+        "servers": [vars(item) for item in items],
+    }
@@ -0,0 +1,405 @@
+import contextvars
+import importlib
+import os
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple, TypeVar
+
+from dotenv import load_dotenv
+import winrm
+from winrm.exceptions import WinRMOperationTimeoutError
+from app.services.health import get_server_health
+from app.services.ps_commands import WIRE_FORMATS, WIRE_JSON
+from app.services.winrm_pool import (
+    DEFAULT_POOL_IDLE_TIMEOUT,
+    DEFAULT_POOL_SIZE,
+    PooledConnection,
+    get_winrm_pool,
+)
+from app.utils.logger import get_logger
+from app.utils.metrics import (
+    COLLECTION_ERRORS_TOTAL,
+    WINRM_RESPONSE_BYTES,
+    WINRM_ROUNDTRIP_SECONDS,
+    classify_error,
+)
+
+log = get_logger(__name__)
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+DEFAULT_SERVER_TIMEOUT = 300
+DEFAULT_SYNC_WINDOW_DAYS = 7
+DEFAULT_SYNC_WINDOW_RETRIES = 2
+DEFAULT_SYNC_PER_SERVER = 2
+
+
+class RemoteCommandError(Exception):
+    # Скрипт на сервере завершился с ненулевым кодом
+    pass
+
+
+class _StaleConnection(Exception):
+    # Подключение из пула перестало работать до запуска команды —
+    # можно повторить на новом
+    pass
+
+
+@dataclass
+class ConnectionSettings:
+    user: str
+    password: str
+    servers: List[str]
+    max_workers: int = DEFAULT_MAX_WORKERS
+    # Таймаут установки TCP-соединения с сервером, секунды
+    connect_timeout: int = DEFAULT_CONNECT_TIMEOUT
+    # Таймаут ожидания ответа на один HTTP-запрос WS-Man, секунды
+    read_timeout: int = DEFAULT_READ_TIMEOUT
+    # Общий лимит времени на выполнение команды на одном сервере, секунды
+    server_timeout: int = DEFAULT_SERVER_TIMEOUT
+    # Максимум подключений к одному серверу в пуле;
+    # 0 — без пула, новое подключение на каждую команду
+    pool_size: int = DEFAULT_POOL_SIZE
+    # Через сколько секунд простоя подключение из пула закрывается
+    pool_idle_timeout: int = DEFAULT_POOL_IDLE_TIMEOUT
+    # Длинный период загружается окнами по столько дней
+    sync_window_days: int = DEFAULT_SYNC_WINDOW_DAYS
+    # Сколько раз повторяется загрузка окна при ошибке
+    sync_window_retries: int = DEFAULT_SYNC_WINDOW_RETRIES
+    # Сколько окон одного сервера загружается одновременно
+    sync_per_server: int = DEFAULT_SYNC_PER_SERVER
+    # Своя фабрика подключений "модуль:функция(server, settings)" вместо winrm.Session,
+    # например имитация серверов для нагрузочного тестирования
+    # (benchmarks/fake_winrm.py)
+    session_factory: Optional[str] = None
+    # Формат вывода событий на сервере (ps_commands.WIRE_FORMATS)
+    wire_format: str = WIRE_JSON
+
+    @property
+    def fingerprint(self) -> tuple:
+        # Параметры, при изменении которых подключения из пула нельзя переиспользовать
+        return (
+            self.user,
+            self.password,
+            self.connect_timeout,
+            self.read_timeout,
+            self.session_factory,
+        )
+
+
+@dataclass
+class ServerResult:
+    server: str
+    ok: bool
+    std_out: bytes = b""
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+
+def load_connection_settings() -> ConnectionSettings:
+    load_dotenv()
+    username = os.getenv("RDP_LOG_USERNAME")
+    password = os.getenv("RDP_LOG_PASSWORD")
+    domain = os.getenv("RDP_LOG_DOMAIN")
+    servers_str = os.getenv("RDP_SERVERS", "")
+
+    if not username or not password:
+        message = (
+            "Не заданы параметры подключения (RDP_LOG_USERNAME, RDP_LOG_PASSWORD) "
+            "в .env"
+        )
+        log.error(message)
+        raise Exception(message)
+    if not servers_str:
+        log.error("Не задан список серверов (RDP_SERVERS) в .env")
+        raise Exception("Не задан список серверов (RDP_SERVERS) в .env")
+
+    if domain:
+        user = f"{domain}\\{username}"
+    else:
+        user = username
+
+    read_timeout = int(os.getenv("RDP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT))
+    if read_timeout < 2:
+        raise Exception("RDP_READ_TIMEOUT должен быть не меньше 2 секунд")
+
+    wire_format = os.getenv("RDP_WIRE_FORMAT", WIRE_JSON).strip().lower()
+    if wire_format not in WIRE_FORMATS:
+        raise Exception(
+            f"RDP_WIRE_FORMAT должен быть одним из: {', '.join(WIRE_FORMATS)}"
+        )
+
+    return ConnectionSettings(
+        user=user,
+        password=password,
+        servers=[server.strip() for server in servers_str.split(",") if server.strip()],
+        max_workers=int(os.getenv("RDP_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+        connect_timeout=int(os.getenv("RDP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=read_timeout,
+        server_timeout=int(os.getenv("RDP_SERVER_TIMEOUT", DEFAULT_SERVER_TIMEOUT)),
+        pool_size=int(os.getenv("RDP_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        pool_idle_timeout=int(
+            os.getenv("RDP_POOL_IDLE_TIMEOUT", DEFAULT_POOL_IDLE_TIMEOUT)
+        ),
+        sync_window_days=max(
+            1, int(os.getenv("RDP_SYNC_WINDOW_DAYS", DEFAULT_SYNC_WINDOW_DAYS))
+        ),
+        sync_window_retries=int(
+            os.getenv("RDP_SYNC_WINDOW_RETRIES", DEFAULT_SYNC_WINDOW_RETRIES)
+        ),
+        sync_per_server=max(
+            1, int(os.getenv("RDP_SYNC_PER_SERVER", DEFAULT_SYNC_PER_SERVER))
+        ),
+        session_factory=os.getenv("RDP_SESSION_FACTORY") or None,
+        wire_format=wire_format,
+    )
+
+
+@lru_cache(maxsize=None)
+def _load_session_factory(
+    path: str,
+) -> Callable[[str, ConnectionSettings], winrm.Session]:
+    module_name, _, attr = path.partition(":")
+    if not attr:
+        raise ValueError(
+            f"RDP_SESSION_FACTORY должен иметь вид 'модуль:функция', получено '{path}'"
+        )
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _open_session(server: str, settings: ConnectionSettings) -> winrm.Session:
+    if settings.session_factory:
+        return _load_session_factory(settings.session_factory)(server, settings)
+    # operation_timeout определяет, как часто сервер возвращает управление при
+    # долгом выполнении команды, — на каждом таком шаге проверяется общий лимит.
+    operation_timeout = max(1, min(20, settings.read_timeout - 5))
+    session = winrm.Session(
+        server,
+        auth=(settings.user, settings.password),
+        transport="ntlm",
+        read_timeout_sec=settings.read_timeout,
+        operation_timeout_sec=operation_timeout,
+    )
+    # pywinrm передаёт read_timeout_sec напрямую в requests, поэтому кортеж
+    # (connect, read) задаёт отдельный таймаут на установку соединения.
+    session.protocol.transport.read_timeout_sec = (
+        settings.connect_timeout,
+        settings.read_timeout,
+    )
+    return session
+
+
+def _apply_read_timeout(
+    session: winrm.Session, read_timeout: float, settings: ConnectionSettings
+) -> None:
+    # pywinrm берёт таймауты из протокола и транспорта при каждом запросе, поэтому
+    # их можно менять у открытого подключения (адаптивный таймаут, см. health.py)
+    protocol = session.protocol
+    protocol.read_timeout_sec = read_timeout
+    protocol.operation_timeout_sec = max(1, min(20, int(read_timeout) - 5))
+    protocol.transport.read_timeout_sec = (settings.connect_timeout, read_timeout)
+
+
+def _iter_ps_output(
+    conn: PooledConnection, script: str, deadline: float, idle_timeout: int
+) -> Iterator[Tuple[bytes, bytes, int]]:
+    # Аналог winrm.Session.run_ps, но вывод отдаётся порциями по мере получения
+    # и с проверкой общего лимита времени: штатный get_command_output копит весь
+    # вывод в памяти и бесконечно повторяет запрос при operation timeout.
+    # Команда выполняется в оболочке подключения, оболочка остаётся открытой
+    # для следующих.
+    # Порции — кортежи (stdout, stderr, код завершения); код окончательный в последней.
+    # Время запросов WS-Man, вернувших ответ, учитывается в задержке сервера
+    # для адаптивного таймаута.
+    encoded_ps = b64encode(script.encode("utf_16_le")).decode("ascii")
+    protocol = conn.session.protocol
+    health = get_server_health()
+    try:
+        started = time.monotonic()
+        shell_id = conn.shell(idle_timeout)
+        command_id = protocol.run_command(
+            shell_id, f"powershell -encodedcommand {encoded_ps}"
+        )
+        health.observe_latency(conn.server, time.monotonic() - started)
+    except Exception as e:
+        if conn.uses:
+            raise _StaleConnection(str(e)) from e
+        raise
+    try:
+        done = False
+        while not done:
+            if time.monotonic() > deadline:
+                raise TimeoutError("превышен лимит времени выполнения команды")
+            started = time.monotonic()
+            try:
+                out, err, status_code, done = protocol._raw_get_command_output(
+                    shell_id, command_id
+                )
+            except WinRMOperationTimeoutError:
+                # Сервер ждал вывода до OperationTimeout: это не задержка ответа
+                continue
+            health.observe_latency(conn.server, time.monotonic() - started)
+            yield out, err, status_code
+    finally:
+        protocol.cleanup_command(shell_id, command_id)
+
+
+def _connection(server: str, settings: ConnectionSettings):
+    # Подключение из пула или, при pool_size=0, одноразовое
+    if settings.pool_size > 0:
+        pool = get_winrm_pool(settings.pool_size, settings.pool_idle_timeout)
+        return pool.acquire(
+            server,
+            settings.fingerprint,
+            lambda: _open_session(server, settings),
+            timeout=settings.server_timeout,
+        )
+    return _single_connection(server, settings)
+
+
+@contextmanager
+def _single_connection(
+    server: str, settings: ConnectionSettings
+) -> Iterator[PooledConnection]:
+    conn = PooledConnection(
+        server=server, session=_open_session(server, settings), fingerprint=None
+    )
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def stream_ps_on_server(
+    server: str, script: str, settings: ConnectionSettings
+) -> Iterator[bytes]:
+    # Выполняет скрипт на сервере и отдаёт stdout порциями, не накапливая его целиком.
+    # Ошибка подключения, таймаут или ненулевой код завершения — исключение.
+    # Если подключение из пула устарело (сервер закрыл оболочку или соединение),
+    # команда один раз повторяется на новом подключении.
+    # Сервер, отвечавший ошибками подряд, пропускается сразу (ServerUnavailable),
+    # таймаут ответа подстраивается под его задержку (см. health.py).
+    health = get_server_health()
+    health.before_call(server)
+    started = time.monotonic()
+    deadline = started + settings.server_timeout
+    log.info("Подключение к серверу %s...", server, extra={"server": server})
+    try:
+        for attempt in range(2):
+            stderr, status_code, received = [], 0, 0
+            try:
+                with _connection(server, settings) as conn:
+                    _apply_read_timeout(
+                        conn.session,
+                        health.read_timeout(server, settings.read_timeout),
+                        settings,
+                    )
+                    for out, err, status_code in _iter_ps_output(
+                        conn, script, deadline, settings.pool_idle_timeout
+                    ):
+                        if err:
+                            stderr.append(err)
+                        if out:
+                            received += len(out)
+                            yield out
+                    session = conn.session
+            except _StaleConnection as e:
+                if attempt:
+                    raise
+                log.info(
+                    "Подключение к серверу %s устарело (%s), открываем новое",
+                    server,
+                    e,
+                    extra={"server": server},
+                )
+                continue
+            break
+    except GeneratorExit:
+        health.release(server)
+        raise
+    except Exception as e:
+        health.record_failure(server, e)
+        raise
+    # Ненулевой код завершения скрипта — ошибка команды, а не сервера: сервер ответил
+    health.record_success(server)
+    if status_code != 0:
+        error = session._clean_error_msg(b"".join(stderr)).decode(errors="ignore")
+        raise RemoteCommandError(f"Ошибка на сервере {server}: {error}")
+    elapsed = time.monotonic() - started
+    WINRM_ROUNDTRIP_SECONDS.labels(server).observe(elapsed)
+    WINRM_RESPONSE_BYTES.labels(server).observe(received)
+    log.info(
+        "Сервер %s ответил за %.2f с",
+        server,
+        elapsed,
+        extra={
+            "server": server,
+            "duration_ms": round(elapsed * 1000, 1),
+            "bytes": received,
+        },
+    )
+
+
+def run_ps_on_server(
+    server: str, script: str, settings: ConnectionSettings
+) -> ServerResult:
+    started = time.monotonic()
+    try:
+        std_out = b"".join(stream_ps_on_server(server, script, settings))
+    except Exception as e:
+        COLLECTION_ERRORS_TOTAL.labels(server, classify_error(e)).inc()
+        log.error(
+            "Ошибка при опросе сервера %s: %s", server, e, extra={"server": server}
+        )
+        return ServerResult(
+            server=server, ok=False, error=str(e), elapsed=time.monotonic() - started
+        )
+    return ServerResult(
+        server=server, ok=True, std_out=std_out, elapsed=time.monotonic() - started
+    )
+
+
+def run_parallel(
+    func: Callable[[K], T], servers: List[K], max_workers: int
+) -> Dict[K, T]:
+    # Вызывает func(server) для каждого сервера (или другого ключа, например окна
+    # периода) в ограниченном пуле потоков.
+    # Результат — словарь server -> результат в порядке списка серверов.
+    # Потоки выполняются в копии контекста вызывающего
+    # (идентификатор запроса в журнале).
+    if not servers:
+        return {}
+    workers = max(1, min(max_workers, len(servers)))
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="rdp-collector"
+    ) as pool:
+        futures = {
+            server: pool.submit(contextvars.copy_context().run, func, server)
+            for server in servers
+        }
+        return {server: future.result() for server, future in futures.items()}
+
+
+def collect(
+    script: str,
+    settings: Optional[ConnectionSettings] = None,
+    servers: Optional[List[str]] = None,
+) -> Dict[str, ServerResult]:
+    # Параллельно выполняет PowerShell-скрипт на всех серверах
+    if settings is None:
+        settings = load_connection_settings()
+    if servers is None:
+        servers = settings.servers
+    return run_parallel(
+        lambda server: run_ps_on_server(server, script, settings),
+        servers,
+        settings.max_workers,
+    )
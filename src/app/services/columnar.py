@@ -0,0 +1,83 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+
+@dataclass
+class SessionColumns:
+    # Части сессий в столбцах (sessions.segment_columns): время — секунды epoch,
+    # сервер входа и логин — коды в соответствующих словарях.
+    start_s: np.ndarray  # int64
+    end_s: np.ndarray  # int64
+    server: np.ndarray  # int32, индекс в servers
+    username: np.ndarray  # int32, индекс в usernames
+    servers: List[str]
+    usernames: List[str]
+
+    def __len__(self) -> int:
+        return len(self.start_s)
+
+
+@dataclass
+class SessionTotals:
+    # Суммарная длительность сессий в секундах: user_day[код логина, день];
+    # дни — days по порядку.
+    days: List[str]
+    usernames: List[str]
+    user_day: np.ndarray
+
+    def by_user(self) -> Dict[str, Dict[str, int]]:
+        # username -> {день: секунды} для дней с ненулевой длительностью
+        result: Dict[str, Dict[str, int]] = {}
+        for row, col in zip(*np.nonzero(self.user_day)):
+            days = result.setdefault(self.usernames[row], {})
+            days[self.days[col]] = int(self.user_day[row, col])
+        return result
+
+    def user_period(self) -> Dict[str, int]:
+        # username -> секунды за весь период
+        totals = self.user_day.sum(axis=1)
+        return {self.usernames[i]: int(totals[i]) for i in np.flatnonzero(totals)}
+
+
+def session_totals(
+    sessions: SessionColumns, first_day: date, last_day: date
+) -> SessionTotals:
+    # Делит части сессий по календарным дням (локальное время, как pairing.split_by_day)
+    # и суммирует длительности по логинам за дни first_day..last_day.
+    day_count = (last_day - first_day).days + 1
+    midnights = np.array(
+        [
+            int(datetime.combine(first_day + timedelta(days=i), time.min).timestamp())
+            for i in range(day_count + 1)
+        ],
+        dtype=np.int64,
+    )
+    start = np.maximum(sessions.start_s, midnights[0])
+    end = np.minimum(sessions.end_s, midnights[-1])
+    keep = np.flatnonzero(end > start)
+    start, end = start[keep], end[keep]
+
+    # Сессия на k днях превращается в k частей: номер дня первой части плюс смещение
+    first = np.searchsorted(midnights, start, side="right") - 1
+    last = np.searchsorted(midnights, end, side="left") - 1
+    counts = last - first + 1
+    owner = np.repeat(np.arange(len(start)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    day = first[owner] + offsets
+    seconds = np.minimum(end[owner], midnights[day + 1]) - np.maximum(
+        start[owner], midnights[day]
+    )
+
+    size = len(sessions.usernames)
+    codes = sessions.username[keep][owner].astype(np.int64)
+    flat = np.bincount(
+        codes * day_count + day, weights=seconds, minlength=size * day_count
+    )
+    return SessionTotals(
+        days=[(first_day + timedelta(days=i)).isoformat() for i in range(day_count)],
+        usernames=sessions.usernames,
+        user_day=flat.astype(np.int64).reshape(size, day_count),
+    )
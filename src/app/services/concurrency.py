@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from app.services.columnar import SessionColumns
+
+# Перцентиль числа одновременных сессий, учитываемый по времени
+CONCURRENCY_PERCENTILE = 95
+
+
+@dataclass
+class ServerConcurrency:
+    server: str
+    peak: int  # максимум одновременных сессий за период
+    peak_at: str  # когда максимум был достигнут впервые (ISO 8601)
+    p95: int  # 95% времени периода сессий было не больше
+    daily_peak: Dict[str, int]  # день -> максимум за день
+    hourly_peak: Dict[str, List[int]]  # день -> максимум за каждый из 24 часов
+
+
+def _hour_starts(first_day: date, last_day: date) -> np.ndarray:
+    # Начала часов периода в секундах epoch (локальное время) и конец периода
+    starts = [
+        int(datetime.combine(first_day + timedelta(days=day), time(hour)).timestamp())
+        for day in range((last_day - first_day).days + 1)
+        for hour in range(24)
+    ]
+    starts.append(
+        int(datetime.combine(last_day + timedelta(days=1), time.min).timestamp())
+    )
+    return np.array(starts, dtype=np.int64)
+
+
+def _curve(start_s: np.ndarray, end_s: np.ndarray):
+    # Заметание по точкам начала (+1) и окончания (-1) сессий за O(n log n):
+    # на отрезке [times[k]; times[k + 1]) открыто levels[k] сессий.
+    # При совпадении времени окончание учитывается раньше начала.
+    times = np.concatenate((start_s, end_s))
+    deltas = np.concatenate(
+        (np.ones(len(start_s), dtype=np.int64), -np.ones(len(end_s), dtype=np.int64))
+    )
+    order = np.lexsort((deltas, times))
+    times, levels = times[order], np.cumsum(deltas[order])
+    last_at_time = np.append(times[1:] != times[:-1], True)
+    return times[last_at_time], levels[last_at_time]
+
+
+def server_concurrency(
+    sessions: SessionColumns, first_day: date, last_day: date
+) -> List[ServerConcurrency]:
+    # Кривая числа одновременных сессий каждого сервера (по серверу входа) за дни
+    # first_day..last_day по частям сессий из хранилища
+    hours = _hour_starts(first_day, last_day)
+    period_start, period_end = hours[0], hours[-1]
+    days = [
+        (first_day + timedelta(days=i)).isoformat()
+        for i in range((last_day - first_day).days + 1)
+    ]
+
+    result = []
+    for code, server in enumerate(sessions.servers):
+        mask = (sessions.server == code) & (sessions.end_s > sessions.start_s)
+        times, levels = _curve(sessions.start_s[mask], sessions.end_s[mask])
+        # Отрезки постоянного уровня, обрезанные по периоду; до первой точки уровень 0
+        seg_start = np.maximum(np.concatenate(([period_start], times)), period_start)
+        seg_end = np.minimum(np.concatenate((times, [period_end])), period_end)
+        seg_level = np.concatenate(([0], levels))
+        keep = seg_end > seg_start
+        seg_start, seg_end, seg_level = seg_start[keep], seg_end[keep], seg_level[keep]
+        if not len(seg_level) or not seg_level.max():
+            continue
+
+        peak_index = int(np.argmax(seg_level))
+        by_level = np.argsort(seg_level, kind="stable")
+        weights = np.cumsum((seg_end - seg_start)[by_level])
+        p95 = seg_level[by_level][
+            np.searchsorted(weights, weights[-1] * CONCURRENCY_PERCENTILE / 100)
+        ]
+
+        # Максимум по часам: отрезок, покрывающий несколько часов, учитывается в каждом
+        first = np.searchsorted(hours, seg_start, side="right") - 1
+        last = np.searchsorted(hours, seg_end, side="left") - 1
+        counts = last - first + 1
+        owner = np.repeat(np.arange(len(seg_level)), counts)
+        bucket = (
+            first[owner]
+            + np.arange(counts.sum())
+            - np.repeat(np.cumsum(counts) - counts, counts)
+        )
+        hourly = np.zeros(len(hours) - 1, dtype=np.int64)
+        np.maximum.at(hourly, bucket, seg_level[owner])
+        hourly = hourly.reshape(len(days), 24)
+
+        result.append(
+            ServerConcurrency(
+                server=server,
+                peak=int(seg_level[peak_index]),
+                peak_at=datetime.fromtimestamp(int(seg_start[peak_index])).isoformat(),
+                p95=int(p95),
+                daily_peak={day: int(hourly[i].max()) for i, day in enumerate(days)},
+                hourly_peak={day: hourly[i].tolist() for i, day in enumerate(days)},
+            )
+        )
+    return sorted(result, key=lambda item: item.server)
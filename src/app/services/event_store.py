@@ -0,0 +1,769 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from app.services.events import Event
+from app.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_STORE_PATH = "rdp_events.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    server      TEXT    NOT NULL,
+    record_id   INTEGER NOT NULL,
+    time_ms     INTEGER NOT NULL,
+    event_id    INTEGER NOT NULL,
+    user        TEXT    NOT NULL,
+    username    TEXT    NOT NULL,
+    PRIMARY KEY (server, record_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_time_idx ON events (time_ms);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    server          TEXT PRIMARY KEY,
+    last_record_id  INTEGER,
+    covered_from_ms INTEGER,
+    last_sync_ms    INTEGER
+);
+
+-- Окна периода, уже загруженные с сервера вне непрерывно покрытого участка (до
+-- covered_from_ms): при частичном сбое повторно запрашиваются только недостающие окна.
+CREATE TABLE IF NOT EXISTS fetched_windows (
+    server   TEXT    NOT NULL,
+    start_ms INTEGER NOT NULL,
+    end_ms   INTEGER NOT NULL,
+    PRIMARY KEY (server, start_ms, end_ms)
+) WITHOUT ROWID;
+
+-- Аренда серверов процессами сборщика (см. shard_collector.py): сервер собирает только
+-- владелец действующей аренды; next_due_ms — когда сервер нужно собрать снова.
+CREATE TABLE IF NOT EXISTS server_leases (
+    server      TEXT    PRIMARY KEY,
+    owner       TEXT,
+    expires_ms  INTEGER NOT NULL DEFAULT 0,
+    next_due_ms INTEGER NOT NULL DEFAULT 0,
+    cycles      INTEGER NOT NULL DEFAULT 0,
+    failures    INTEGER NOT NULL DEFAULT 0,
+    last_owner  TEXT,
+    last_error  TEXT
+) WITHOUT ROWID;
+
+-- Агрегаты по дням (см. rollups.py). rollup_days — для каких дней они рассчитаны;
+-- stale = 1 — агрегаты дня нужно пересчитать целиком (изменения отдельных сессий
+-- применяются по session_changes).
+CREATE TABLE IF NOT EXISTS rollup_days (
+    day         TEXT    PRIMARY KEY,
+    computed_ms INTEGER NOT NULL,
+    stale       INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_day_rollup (
+    day      TEXT    NOT NULL,
+    username TEXT    NOT NULL,
+    seconds  INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (day, username)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS server_day_rollup (
+    day      TEXT    NOT NULL,
+    server   TEXT    NOT NULL,
+    seconds  INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (day, server)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS user_month_rollup (
+    month    TEXT    NOT NULL,
+    username TEXT    NOT NULL,
+    seconds  INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    PRIMARY KEY (month, username)
+) WITHOUT ROWID;
+
+-- Сессии, сопоставленные по событиям хранилища (см. sessions.py) и обновляемые по мере
+-- поступления событий: end_s = NULL — сессия продолжается, logout_server = NULL —
+-- событие выхода не найдено. session_days — части завершившихся сессий по дням, как в
+-- отчёте.
+CREATE INDEX IF NOT EXISTS events_key_idx ON events (server, user, time_ms);
+CREATE TABLE IF NOT EXISTS sessions (
+    server        TEXT    NOT NULL,
+    record_id     INTEGER NOT NULL,  -- RecordId события входа
+    user          TEXT    NOT NULL,
+    username      TEXT    NOT NULL,
+    start_s       INTEGER NOT NULL,
+    end_s         INTEGER,
+    logout_server TEXT,
+    PRIMARY KEY (server, record_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_key_idx ON sessions (server, user, start_s);
+CREATE INDEX IF NOT EXISTS sessions_end_idx ON sessions (server, end_s);
+CREATE INDEX IF NOT EXISTS sessions_open_idx ON sessions (server, start_s)
+    WHERE end_s IS NULL;
+CREATE TABLE IF NOT EXISTS session_days (
+    day           TEXT    NOT NULL,
+    username      TEXT    NOT NULL,
+    server        TEXT    NOT NULL,
+    record_id     INTEGER NOT NULL,
+    user          TEXT    NOT NULL,
+    start_s       INTEGER NOT NULL,
+    end_s         INTEGER NOT NULL,
+    logout_server TEXT,
+    continues     INTEGER NOT NULL,  -- сессия продолжается после полуночи
+    PRIMARY KEY (day, username, server, record_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS session_days_session_idx ON session_days (server, record_id);
+-- Серверы с новыми событиями, по которым сессии ещё не обновлены: from_ms — самое
+-- раннее новое событие
+CREATE TABLE IF NOT EXISTS session_dirty (
+    server  TEXT    PRIMARY KEY,
+    from_ms INTEGER NOT NULL
+) WITHOUT ROWID;
+-- Пары (день, логин, сервер), сессии которых изменились; seq — номер обновления.
+-- По ним сбрасывается кэш отчёта и пересчитываются только затронутые агрегаты.
+CREATE TABLE IF NOT EXISTS session_changes (
+    day      TEXT    NOT NULL,
+    username TEXT    NOT NULL,
+    server   TEXT    NOT NULL,
+    seq      INTEGER NOT NULL,
+    PRIMARY KEY (day, username, server)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS session_changes_seq_idx ON session_changes (seq);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Пар (день, логин или сервер) в одном запросе агрегатов (ограничение SQLite на число
+# параметров)
+_KEYS_PER_QUERY = 5000
+# Версия схемы (PRAGMA user_version): 1 — сессии материализуются в таблице sessions
+_SCHEMA_VERSION = 1
+
+# Пересчёт сессий сервера: (события, прежние сессии) по идентификаторам сессии ->
+# (строки sessions, строки session_days, изменившиеся (день, логин, сервер), число
+# изменившихся сессий)
+SessionRebuild = Callable[
+    [Dict[str, List[Event]], Dict[str, List[tuple]]],
+    Tuple[List[tuple], List[tuple], Set[Tuple[str, str, str]], int],
+]
+
+# Таблицы агрегатов по измерениям: (таблица по дням, столбец измерения)
+ROLLUP_DIMENSIONS = {
+    "user": ("user_day_rollup", "username"),
+    "server": ("server_day_rollup", "server"),
+}
+
+
+@dataclass
+class ServerLease:
+    server: str
+    owner: Optional[str] = None
+    expires_ms: int = 0
+    next_due_ms: int = 0
+    cycles: int = 0  # сколько раз сервер собран
+    failures: int = 0  # ошибок подряд
+    last_owner: Optional[str] = None
+    last_error: Optional[str] = None
+
+
+@dataclass
+class SyncState:
+    server: str
+    # Максимальный RecordId, уже сохранённый в хранилище (high-watermark)
+    last_record_id: Optional[int] = None
+    # Начиная с какого момента журнал сервера полностью загружен в хранилище
+    covered_from_ms: Optional[int] = None
+    last_sync_ms: Optional[int] = None
+
+
+class EventStore:
+    # Локальное хранилище событий входа/выхода на SQLite.
+    # Ключ события — (server, RecordId), поэтому повторная загрузка не создаёт дублей,
+    # а события остаются доступны и после ротации журнала на сервере.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+                # Хранилище прежней версии: сессии сопоставляются по уже сохранённым
+                # событиям, агрегаты пересчитываются по ним
+                conn.execute(
+                    "INSERT OR REPLACE INTO session_dirty SELECT server, MIN(time_ms) "
+                    "FROM events GROUP BY server"
+                )
+                conn.execute("UPDATE rollup_days SET stale = 1")
+                conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def add_events(self, events: Iterable[Event]) -> int:
+        # Новые события отмечают сервер для обновления сессий
+        # (sessions.refresh_sessions) начиная с самого раннего из них
+        rows = [tuple(event) for event in events]
+        if not rows:
+            return 0
+        with self._lock, self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            added = conn.total_changes - before
+            if added:
+                first: Dict[str, int] = {}
+                for row in rows:
+                    first[row[0]] = min(first.get(row[0], row[2]), row[2])
+                conn.executemany(
+                    "INSERT INTO session_dirty VALUES (?, ?) ON CONFLICT (server) "
+                    "DO UPDATE SET from_ms = MIN(from_ms, excluded.from_ms)",
+                    list(first.items()),
+                )
+            return added
+
+    def get_state(self, server: str) -> SyncState:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT last_record_id, covered_from_ms, last_sync_ms "
+                "FROM sync_state WHERE server = ?",
+                (server,),
+            ).fetchone()
+        if row is None:
+            return SyncState(server=server)
+        return SyncState(server, *row)
+
+    def list_states(self) -> List[SyncState]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT server, last_record_id, covered_from_ms, last_sync_ms "
+                "FROM sync_state ORDER BY server"
+            ).fetchall()
+        return [SyncState(*row) for row in rows]
+
+    def save_state(self, state: SyncState) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (
+                    state.server,
+                    state.last_record_id,
+                    state.covered_from_ms,
+                    state.last_sync_ms,
+                ),
+            )
+
+    def fetched_windows(self, server: str) -> List[Tuple[int, int]]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT start_ms, end_ms FROM fetched_windows WHERE server = ? "
+                "ORDER BY start_ms",
+                (server,),
+            ).fetchall()
+
+    def add_fetched_window(self, server: str, start_ms: int, end_ms: int) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO fetched_windows VALUES (?, ?, ?)",
+                (server, start_ms, end_ms),
+            )
+
+    def prune_fetched_windows(self, server: str, covered_from_ms: int) -> None:
+        # Окна внутри непрерывно покрытого участка больше не нужны
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "DELETE FROM fetched_windows WHERE server = ? AND start_ms >= ?",
+                (server, covered_from_ms),
+            )
+
+    def register_servers(
+        self, servers: List[str], due_ms: Optional[int] = None
+    ) -> None:
+        # Добавляет серверы в таблицу аренды; due_ms — собрать не позже этого момента
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO server_leases (server) VALUES (?)",
+                [(s,) for s in servers],
+            )
+            if due_ms is not None:
+                conn.executemany(
+                    "UPDATE server_leases SET next_due_ms = MIN(next_due_ms, ?) "
+                    "WHERE server = ?",
+                    [(due_ms, server) for server in servers],
+                )
+
+    def claim_servers(
+        self, owner: str, servers: List[str], limit: int, lease_ms: int, now_ms: int
+    ) -> List[ServerLease]:
+        # Берёт в аренду до limit серверов, которые пора собирать и которые никем не
+        # арендованы (или аренда истекла — владелец завершился аварийно). Выбор и захват
+        # выполняются под блокировкой записи SQLite, поэтому каждый сервер достаётся
+        # одному процессу.
+        if not servers or limit < 1:
+            return []
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM server_leases "
+                f"WHERE server IN ({','.join('?' * len(servers))}) "
+                "AND next_due_ms <= ? AND (owner IS NULL OR expires_ms < ?) "
+                "ORDER BY next_due_ms LIMIT ?",
+                [*servers, now_ms, now_ms, limit],
+            ).fetchall()
+            conn.executemany(
+                "UPDATE server_leases SET owner = ?, expires_ms = ? WHERE server = ?",
+                [(owner, now_ms + lease_ms, row[0]) for row in rows],
+            )
+        return [
+            ServerLease(*row[:1], owner, now_ms + lease_ms, *row[3:]) for row in rows
+        ]
+
+    def renew_leases(self, owner: str, servers: List[str], expires_ms: int) -> None:
+        if not servers:
+            return
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"UPDATE server_leases SET expires_ms = ? WHERE owner = ? "
+                f"AND server IN ({','.join('?' * len(servers))})",
+                [expires_ms, owner, *servers],
+            )
+
+    def release_server(
+        self, owner: str, server: str, next_due_ms: int, error: Optional[str] = None
+    ) -> bool:
+        # Завершает аренду: сервер собран (error=None) или попытка не удалась. False —
+        # аренда уже перешла к другому процессу (истекла), результат не учитывается.
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE server_leases "
+                "SET owner = NULL, expires_ms = 0, next_due_ms = ?, last_owner = ?, "
+                "last_error = ?, cycles = cycles + ?, "
+                "failures = CASE WHEN ? THEN failures + 1 ELSE 0 END "
+                "WHERE server = ? AND owner = ?",
+                (
+                    next_due_ms,
+                    owner,
+                    error,
+                    0 if error else 1,
+                    error is not None,
+                    server,
+                    owner,
+                ),
+            )
+            return cursor.rowcount == 1
+
+    def list_leases(self, servers: Optional[List[str]] = None) -> List[ServerLease]:
+        query, params = "SELECT * FROM server_leases", []
+        if servers is not None:
+            query += f" WHERE server IN ({','.join('?' * len(servers))})"
+            params = list(servers)
+        with self._connect() as conn:
+            return [
+                ServerLease(*row)
+                for row in conn.execute(query + " ORDER BY server", params)
+            ]
+
+    def server_bounds(self, server: str) -> Optional[Tuple[int, int]]:
+        # Время первого и последнего сохранённого события сервера (по RecordId —
+        # поиск по первичному ключу, без просмотра таблицы); None — событий нет
+        with self._connect() as conn:
+            first = conn.execute(
+                "SELECT time_ms FROM events "
+                "WHERE server = ? ORDER BY record_id LIMIT 1",
+                (server,),
+            ).fetchone()
+            if first is None:
+                return None
+            last = conn.execute(
+                "SELECT time_ms FROM events "
+                "WHERE server = ? ORDER BY record_id DESC LIMIT 1",
+                (server,),
+            ).fetchone()
+            return first[0], last[0]
+
+    def iter_events(
+        self, start_ms: int, end_ms: int, servers: Optional[List[str]] = None
+    ) -> Iterator[Event]:
+        # События в интервале [start_ms; end_ms] в порядке времени
+        query = "SELECT * FROM events WHERE time_ms BETWEEN ? AND ?"
+        params: list = [start_ms, end_ms]
+        if servers is not None:
+            query += f" AND server IN ({','.join('?' * len(servers))})"
+            params.extend(servers)
+        query += " ORDER BY time_ms, server, record_id"
+        with self._connect() as conn:
+            for row in conn.execute(query, params):
+                yield Event(*row)
+
+    def dirty_servers(self) -> List[str]:
+        # Серверы с новыми событиями, по которым сессии ещё не обновлены
+        with self._connect() as conn:
+            return [
+                row[0]
+                for row in conn.execute(
+                    "SELECT server FROM session_dirty ORDER BY server"
+                )
+            ]
+
+    def update_sessions(self, server: str, rebuild: SessionRebuild) -> int:
+        # Обновляет сессии сервера по событиям, загруженным после прошлого обновления.
+        # rebuild получает события и прежние сессии затронутых идентификаторов сессии
+        # (user) и возвращает новые сессии, их части по дням и изменившиеся (день,
+        # логин, сервер). Всё выполняется под блокировкой записи SQLite: загрузка
+        # событий и обновление сессий из других процессов ждут, поэтому новые события не
+        # пропускаются, а результаты одновременных обновлений не перезаписывают друг
+        # друга. Возвращает число изменившихся сессий.
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT from_ms FROM session_dirty WHERE server = ?", (server,)
+            ).fetchone()
+            if row is None:
+                return 0
+            from_s = row[0] // 1000
+            events: Dict[str, List[Event]] = {}
+            for event in conn.execute(
+                "SELECT * FROM events WHERE server = ? AND time_ms >= ? "
+                "ORDER BY time_ms, record_id",
+                (server, from_s * 1000),
+            ):
+                events.setdefault(event[4], []).append(Event(*event))
+            old: Dict[str, List[tuple]] = {user: [] for user in events}
+            for session in conn.execute(
+                "SELECT * FROM sessions WHERE server = ? AND start_s >= ?",
+                (server, from_s),
+            ):
+                if session[2] in old:
+                    old[session[2]].append(session)
+            # Сессии, продолжавшиеся к моменту первого нового события, пересчитываются с
+            # их начала
+            anchors: Dict[str, int] = {}
+            spanning = conn.execute(
+                "SELECT user, start_s FROM sessions WHERE server = ? "
+                "AND end_s IS NULL AND start_s < ? "
+                "UNION ALL SELECT user, start_s FROM sessions WHERE server = ? "
+                "AND end_s >= ? AND start_s < ?",
+                (server, from_s, server, from_s, from_s),
+            )
+            for user, start_s in spanning:
+                if user in events:
+                    anchors[user] = min(anchors.get(user, start_s), start_s)
+            for user, anchor in anchors.items():
+                events[user][:0] = [
+                    Event(*event)
+                    for event in conn.execute(
+                        "SELECT * FROM events WHERE server = ? AND user = ? "
+                        "AND time_ms >= ? AND time_ms < ? "
+                        "ORDER BY time_ms, record_id",
+                        (server, user, anchor * 1000, from_s * 1000),
+                    )
+                ]
+                old[user].extend(
+                    conn.execute(
+                        "SELECT * FROM sessions WHERE server = ? AND user = ? "
+                        "AND start_s >= ? AND start_s < ?",
+                        (server, user, anchor, from_s),
+                    )
+                )
+
+            sessions, segments, changes, changed = rebuild(events, old)
+            removed = [
+                (server, session[1])
+                for sessions_of_user in old.values()
+                for session in sessions_of_user
+            ]
+            conn.executemany(
+                "DELETE FROM session_days WHERE server = ? AND record_id = ?", removed
+            )
+            conn.executemany(
+                "DELETE FROM sessions WHERE server = ? AND record_id = ?", removed
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)", sessions
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO session_days "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                segments,
+            )
+            if changes:
+                seq = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM session_changes"
+                ).fetchone()[0]
+                conn.executemany(
+                    "INSERT OR REPLACE INTO session_changes VALUES (?, ?, ?, ?)",
+                    [(*change, seq) for change in changes],
+                )
+            conn.execute("DELETE FROM session_dirty WHERE server = ?", (server,))
+            return changed
+
+    def session_changes(self, after_seq: int) -> List[Tuple[str, str, str, int]]:
+        # Изменения сессий (день, логин, сервер, номер обновления) после обновления
+        # after_seq
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT day, username, server, seq FROM session_changes WHERE seq > ?",
+                (after_seq,),
+            ).fetchall()
+
+    def session_seq(self) -> int:
+        # Номер последнего обновления сессий
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM session_changes"
+            ).fetchone()[0]
+
+    def session_segments(
+        self, first_day: str, last_day: str, servers: List[str]
+    ) -> List[tuple]:
+        # Части завершившихся сессий за дни first_day..last_day в порядке дня, логина и
+        # времени входа
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT * FROM session_days WHERE day BETWEEN ? AND ? "
+                f"AND server IN ({','.join('?' * len(servers))}) "
+                "ORDER BY day, username, start_s, server, record_id",
+                [first_day, last_day, *servers],
+            ).fetchall()
+
+    def open_sessions(
+        self, servers: List[str], before_s: int, since_s: int = 0
+    ) -> List[tuple]:
+        # Продолжающиеся сессии, начавшиеся в [since_s; before_s)
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT * FROM sessions WHERE end_s IS NULL AND start_s >= ? "
+                "AND start_s < ? "
+                f"AND server IN ({','.join('?' * len(servers))})",
+                [since_s, before_s, *servers],
+            ).fetchall()
+
+    def rebuild_sessions(self) -> None:
+        # Сессии всех серверов сопоставляются заново по сохранённым событиям, агрегаты
+        # пересчитываются
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO session_dirty SELECT server, MIN(time_ms) "
+                "FROM events GROUP BY server"
+            )
+            conn.execute("UPDATE rollup_days SET stale = 1")
+
+    def session_day_totals(
+        self,
+        dimension: str,
+        first_day: str,
+        last_day: str,
+        servers: List[str],
+        keys: Optional[List[Tuple[str, str]]] = None,
+    ) -> List[Tuple[str, str, int, int]]:
+        # Строки (день, логин или сервер, секунды, сессии) по частям завершившихся
+        # сессий; keys — только эти пары (день, логин или сервер), запрашиваются
+        # порциями
+        _, column = ROLLUP_DIMENSIONS[dimension]
+        query = (
+            f"SELECT day, {column}, SUM(end_s - start_s), SUM(end_s > start_s) "
+            "FROM session_days "
+            f"WHERE day BETWEEN ? AND ? AND server IN ({','.join('?' * len(servers))})"
+        )
+        params: list = [first_day, last_day, *servers]
+        grouping = f" GROUP BY day, {column} HAVING SUM(end_s - start_s) > 0"
+        with self._connect() as conn:
+            if keys is None:
+                return conn.execute(query + grouping, params).fetchall()
+            rows = []
+            for i in range(0, len(keys), _KEYS_PER_QUERY):
+                chunk = keys[i : i + _KEYS_PER_QUERY]
+                rows.extend(
+                    conn.execute(
+                        query + f" AND (day, {column}) IN (VALUES "
+                        f"{','.join(['(?, ?)'] * len(chunk))})" + grouping,
+                        [*params, *(value for key in chunk for value in key)],
+                    )
+                )
+            return rows
+
+    def get_meta(self, key: str, default: int = 0) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM store_meta WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: int) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta VALUES (?, ?)", (key, value)
+            )
+
+    def rollup_days(self, first_day: str, last_day: str) -> Dict[str, Tuple[int, bool]]:
+        # день -> (когда рассчитан, мс epoch; устарел ли)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT day, computed_ms, stale FROM rollup_days "
+                "WHERE day BETWEEN ? AND ?",
+                (first_day, last_day),
+            ).fetchall()
+        return {day: (computed_ms, bool(stale)) for day, computed_ms, stale in rows}
+
+    def save_rollups(
+        self,
+        days: List[str],
+        computed_ms: int,
+        user_rows: List[Tuple[str, str, int, int]],
+        server_rows: List[Tuple[str, str, int, int]],
+    ) -> None:
+        # Заменяет агрегаты за days (строки: день, измерение, секунды, сессии)
+        # и пересчитывает месячные агрегаты затронутых месяцев
+        months = sorted({day[:7] for day in days})
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM user_day_rollup WHERE day = ?", [(day,) for day in days]
+            )
+            conn.executemany(
+                "DELETE FROM server_day_rollup WHERE day = ?", [(day,) for day in days]
+            )
+            conn.executemany(
+                "INSERT INTO user_day_rollup VALUES (?, ?, ?, ?)", user_rows
+            )
+            conn.executemany(
+                "INSERT INTO server_day_rollup VALUES (?, ?, ?, ?)", server_rows
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO rollup_days VALUES (?, ?, 0)",
+                [(day, computed_ms) for day in days],
+            )
+            conn.executemany(
+                "DELETE FROM user_month_rollup WHERE month = ?",
+                [(month,) for month in months],
+            )
+            conn.executemany(
+                "INSERT INTO user_month_rollup "
+                "SELECT substr(day, 1, 7), username, SUM(seconds), SUM(sessions) "
+                "FROM user_day_rollup "
+                "WHERE day BETWEEN ? AND ? GROUP BY username",
+                [(f"{month}-01", f"{month}-31") for month in months],
+            )
+
+    def update_rollups(
+        self,
+        user_keys: List[Tuple[str, str]],
+        server_keys: List[Tuple[str, str]],
+        user_rows: List[Tuple[str, str, int, int]],
+        server_rows: List[Tuple[str, str, int, int]],
+    ) -> None:
+        # Заменяет агрегаты только по парам (день, логин) и (день, сервер) и месячные
+        # агрегаты затронутых логинов
+        months = sorted({(day[:7], username) for day, username in user_keys})
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM user_day_rollup WHERE day = ? AND username = ?", user_keys
+            )
+            conn.executemany(
+                "DELETE FROM server_day_rollup WHERE day = ? AND server = ?",
+                server_keys,
+            )
+            conn.executemany(
+                "INSERT INTO user_day_rollup VALUES (?, ?, ?, ?)", user_rows
+            )
+            conn.executemany(
+                "INSERT INTO server_day_rollup VALUES (?, ?, ?, ?)", server_rows
+            )
+            conn.executemany(
+                "DELETE FROM user_month_rollup WHERE month = ? AND username = ?", months
+            )
+            conn.executemany(
+                "INSERT INTO user_month_rollup "
+                "SELECT substr(day, 1, 7), username, SUM(seconds), SUM(sessions) "
+                "FROM user_day_rollup "
+                "WHERE day BETWEEN ? AND ? AND username = ? GROUP BY username",
+                [
+                    (f"{month}-01", f"{month}-31", username)
+                    for month, username in months
+                ],
+            )
+
+    def query_rollups(
+        self, dimension: str, first_day: str, last_day: str, group: str
+    ) -> List[Tuple[Optional[str], str, int, int]]:
+        # Строки (период, измерение, секунды, сессии); период — день, месяц (YYYY-MM)
+        # или None для итога. Полные месяцы пользователей читаются из месячных
+        # агрегатов.
+        table, column = ROLLUP_DIMENSIONS[dimension]
+        if group == "day":
+            query = (
+                f"SELECT day, {column}, seconds, sessions FROM {table} "
+                f"WHERE day BETWEEN ? AND ? ORDER BY day, {column}"
+            )
+            with self._connect() as conn:
+                return conn.execute(query, (first_day, last_day)).fetchall()
+
+        full_months = _full_months(first_day, last_day) if dimension == "user" else []
+        period = "substr(day, 1, 7)" if group == "month" else "NULL"
+        parts = [
+            f"SELECT {period} AS period, {column} AS name, seconds, sessions "
+            f"FROM {table} "
+            "WHERE day BETWEEN ? AND ? "
+            f"AND substr(day, 1, 7) NOT IN ({','.join('?' * len(full_months))})"
+        ]
+        params: list = [first_day, last_day, *full_months]
+        if full_months:
+            period = "month" if group == "month" else "NULL"
+            parts.append(
+                f"SELECT {period}, username, seconds, sessions FROM user_month_rollup "
+                f"WHERE month IN ({','.join('?' * len(full_months))})"
+            )
+            params.extend(full_months)
+        query = (
+            "SELECT period, name, SUM(seconds), SUM(sessions) "
+            f"FROM ({' UNION ALL '.join(parts)}) "
+            f"GROUP BY period, name ORDER BY period, name"
+        )
+        with self._connect() as conn:
+            return conn.execute(query, params).fetchall()
+
+
+def _full_months(first_day: str, last_day: str) -> List[str]:
+    # Месяцы (YYYY-MM), целиком входящие в период
+    first, last = date.fromisoformat(first_day), date.fromisoformat(last_day)
+    months = []
+    month = (
+        first.replace(day=1)
+        if first.day == 1
+        else (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+    )
+    while True:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if next_month - timedelta(days=1) > last:
+            return months
+        months.append(month.strftime("%Y-%m"))
+        month = next_month
+
+
+_store: Optional[EventStore] = None
+_store_lock = threading.Lock()
+
+
+def get_event_store() -> EventStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            load_dotenv()
+            path = os.getenv("RDP_STORE_PATH", DEFAULT_STORE_PATH)
+            log.info(f"Локальное хранилище событий: {path}")
+            _store = EventStore(path)
+        return _store
@@ -0,0 +1,244 @@
+import base64
+import codecs
+import itertools
+import json
+import re
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+_PS_DATE_RE = re.compile(r"-?\d+")
+_JSON_DECODER = json.JSONDecoder()
+_json_string = json.decoder.scanstring
+_JSON_WHITESPACE = " \t\r\n"
+
+# Компактный вывод скрипта ps_commands (RDP_WIRE_FORMAT=compact/compact-gzip),
+# построчно:
+#   RDPC1                          заголовок
+#   U<TAB>"DOMAIN\\user"           следующая запись таблицы логинов
+#                                  (JSON-значение Properties[0])
+#   RecordId,мс epoch,Id,номер логина,Properties[1]   событие
+#   E<TAB>число событий            конец вывода (проверка, что вывод не оборван)
+# В режиме gzip после строки "RDPC1 gzip" идёт base64 от gzip того же текста.
+COMPACT_MAGIC = b"RDPC1"
+_COMPACT_GZIP_HEADER = "RDPC1 gzip"
+
+
+class Event(NamedTuple):
+    # Событие входа/выхода в нормализованном виде (так оно хранится в локальном
+    # хранилище)
+    server: str
+    record_id: int
+    time_ms: int  # TimeCreated, миллисекунды Unix epoch
+    event_id: int  # 21 - вход, 23 - выход
+    user: str  # значение Properties[1] события (поле user_id отчёта)
+    username: str  # значение Properties[0] события (логин)
+
+    @property
+    def local_time(self) -> datetime:
+        # Локальное время с точностью до секунды, как в отчётах
+        return datetime.fromtimestamp(self.time_ms // 1000)
+
+
+def parse_ps_timestamp_ms(ps_date) -> Optional[int]:
+    # "/Date(1745060200298)/" -> 1745060200298
+    if ps_date is None:
+        return None
+    match = _PS_DATE_RE.search(str(ps_date))
+    if match:
+        return int(match.group(0))
+    return None
+
+
+def event_from_ps(item: dict, server: str) -> Optional[Event]:
+    # Строка вывода Select-Object из ps_commands -> Event; None, если запись неполная
+    time_ms = parse_ps_timestamp_ms(item.get("TimeCreated"))
+    if time_ms is None or item.get("Id") is None:
+        return None
+    return Event(
+        server=server,
+        record_id=int(item.get("RecordId") or 0),
+        time_ms=time_ms,
+        event_id=int(item["Id"]),
+        user=str(item.get("User")),
+        username=str(item.get("UserName", "")),
+    )
+
+
+def iter_json_items(chunks: Iterable[bytes]) -> Iterator[dict]:
+    # Потоковый разбор вывода ConvertTo-Json: объекты отдаются по одному по мере
+    # поступления данных, в памяти держится только недоразобранный хвост.
+    # Поддерживаются массив объектов, одиночный объект (одно событие),
+    # последовательность объектов и пустой вывод (нет событий).
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="ignore")
+    buffer = ""
+    in_array = array_closed = False
+    chunks = iter(chunks)
+    finished = False
+    while not finished:
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer += text_decoder.decode(b"", final=True)
+            finished = True
+        else:
+            buffer += text_decoder.decode(chunk)
+
+        pos, size = 0, len(buffer)
+        while True:
+            while pos < size and buffer[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos >= size:
+                break
+            char = buffer[pos]
+            if array_closed:
+                raise ValueError(
+                    f"Лишние данные после JSON-массива: {buffer[pos:pos + 40]!r}"
+                )
+            if not in_array and char == "[":
+                in_array = True
+                pos += 1
+                continue
+            if in_array and char == ",":
+                pos += 1
+                continue
+            if in_array and char == "]":
+                array_closed = True
+                pos += 1
+                continue
+            try:
+                item, end = _JSON_DECODER.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if finished:
+                    raise
+                break  # объект пришёл не полностью — ждём следующую порцию
+            if end == size and not finished and not isinstance(item, (dict, list)):
+                break  # число или литерал в конце порции может продолжиться в следующей
+            pos = end
+            if isinstance(item, list):
+                # Вложенный массив (например, ConvertTo-Json без -InputObject в старых
+                # версиях)
+                yield from item
+            else:
+                yield item
+        buffer = buffer[pos:]
+
+    if in_array and not array_closed:
+        raise ValueError("Вывод сервера оборван: JSON-массив не закрыт")
+
+
+def _iter_text_blocks(chunks: Iterable[bytes]) -> Iterator[str]:
+    # Порции байт -> порции текста, каждая заканчивается на границе строки
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="ignore")
+    tail = ""
+    for chunk in chunks:
+        text = tail + decoder.decode(chunk)
+        cut = text.rfind("\n") + 1
+        if cut:
+            yield text[:cut]
+        tail = text[cut:]
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def _iter_gunzip(blocks: Iterator[str]) -> Iterator[bytes]:
+    # Текст base64 (с переносами строк) -> распакованные порции gzip
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = ""
+    for block in blocks:
+        pending += "".join(block.split())
+        cut = len(pending) - len(pending) % 4
+        if cut:
+            yield inflater.decompress(base64.b64decode(pending[:cut]))
+            pending = pending[cut:]
+    if pending:
+        raise ValueError("Вывод сервера оборван: неполный блок base64")
+    yield inflater.flush()
+    if not inflater.eof:
+        raise ValueError("Вывод сервера оборван: поток gzip не завершён")
+
+
+def iter_compact_events(chunks: Iterable[bytes], server: str) -> Iterator[Event]:
+    # Разбор компактного вывода: строки событий разбираются split и int, без JSON
+    # и регулярных выражений; логины берутся из таблицы, передаваемой по ходу вывода.
+    blocks = _iter_text_blocks(chunks)
+    first = next(blocks, "")
+    header, _, rest = first.lstrip().partition("\n")
+    header = header.strip()
+    if header == _COMPACT_GZIP_HEADER:
+        yield from iter_compact_events(
+            _iter_gunzip(itertools.chain([rest], blocks)), server
+        )
+        return
+    if header != COMPACT_MAGIC.decode():
+        raise ValueError(
+            f"Неожиданный заголовок вывода сервера {server}: {header[:40]!r}"
+        )
+
+    # Event создаётся через tuple.__new__: так заметно быстрее, чем вызов конструктора
+    # NamedTuple
+    new_event = tuple.__new__
+    usernames: List[str] = []
+    count, expected = 0, None
+    for block in itertools.chain([rest], blocks):
+        for line in block.split("\n"):
+            if not line or line == "\r":
+                continue
+            if expected is not None:
+                raise ValueError(f"Лишние данные после конца вывода сервера {server}")
+            kind = line[0]
+            try:
+                if kind == "U":
+                    value = line.rstrip("\r")
+                    usernames.append(
+                        _json_string(value, 3)[0]
+                        if value[2] == '"'
+                        else str(json.loads(value[2:]))
+                    )
+                elif kind == "E":
+                    expected = int(line[2:])
+                else:
+                    record_id, time_ms, event_id, index, user = line.split(",", 4)
+                    count += 1
+                    yield new_event(
+                        Event,
+                        (
+                            server,
+                            int(record_id),
+                            int(time_ms),
+                            int(event_id),
+                            user.rstrip("\r"),
+                            usernames[int(index)],
+                        ),
+                    )
+            except (ValueError, IndexError):
+                raise ValueError(
+                    f"Некорректная строка вывода сервера {server}: {line[:80]!r}"
+                )
+    if expected is None:
+        raise ValueError(f"Вывод сервера {server} оборван: нет строки конца вывода")
+    if expected != count:
+        raise ValueError(
+            f"Вывод сервера {server}: получено {count} событий из {expected}"
+        )
+
+
+def iter_events_output(chunks: Iterable[bytes], server: str) -> Iterator[Event]:
+    # Поток порций stdout скрипта из ps_commands -> поток событий.
+    # Формат (JSON или компактный) определяется по началу вывода.
+    chunks = iter(chunks)
+    head = b""
+    for chunk in chunks:
+        head += chunk
+        if len(head.lstrip(b"\xef\xbb\xbf \t\r\n")) >= len(COMPACT_MAGIC):
+            break
+    chunks = itertools.chain([head], chunks)
+    if head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(COMPACT_MAGIC):
+        yield from iter_compact_events(chunks, server)
+        return
+    for item in iter_json_items(chunks):
+        if not isinstance(item, dict):
+            raise ValueError(f"Неожиданный формат данных с сервера {server}")
+        event = event_from_ps(item, server)
+        if event is not None:
+            yield event
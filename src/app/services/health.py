@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from app.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_BREAKER_THRESHOLD = 3
+DEFAULT_BREAKER_COOLDOWN = 30
+DEFAULT_BREAKER_MAX_COOLDOWN = 600
+DEFAULT_READ_TIMEOUT_MIN = 5
+# Сглаживание задержки и её разброса, как при расчёте таймаута повтора в TCP (RFC 6298)
+_RTT_ALPHA = 0.125
+_RTT_BETA = 0.25
+# Адаптивный таймаут применяется, когда замеров задержки сервера набралось не меньше
+_MIN_SAMPLES = 5
+
+# Состояния автомата защиты сервера: closed — запросы идут как обычно, open — сервер
+# пропускается до окончания паузы, half_open — пауза прошла, выполняется один пробный
+# запрос
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ServerUnavailable(Exception):
+    # Сервер пропущен без подключения: автомат защиты разомкнут после ошибок подряд
+    def __init__(self, server: str, retry_at: Optional[datetime], error: Optional[str]):
+        retry = f", повтор после {retry_at:%H:%M:%S}" if retry_at else ""
+        super().__init__(
+            f"сервер {server} пропущен после ошибок подряд{retry}: {error}"
+        )
+        self.server = server
+        self.retry_at = retry_at
+
+
+@dataclass
+class HealthSettings:
+    # Ошибок подряд, после которых сервер пропускается
+    threshold: int = DEFAULT_BREAKER_THRESHOLD
+    # Пауза после первого размыкания, секунды; каждое следующее подряд удваивает её
+    cooldown: float = DEFAULT_BREAKER_COOLDOWN
+    max_cooldown: float = DEFAULT_BREAKER_MAX_COOLDOWN
+    # Нижняя граница адаптивного таймаута ответа, секунды (верхняя — RDP_READ_TIMEOUT)
+    read_timeout_min: float = DEFAULT_READ_TIMEOUT_MIN
+
+
+def load_health_settings() -> HealthSettings:
+    load_dotenv()
+    return HealthSettings(
+        threshold=max(
+            1, int(os.getenv("RDP_BREAKER_THRESHOLD", DEFAULT_BREAKER_THRESHOLD))
+        ),
+        cooldown=float(os.getenv("RDP_BREAKER_COOLDOWN", DEFAULT_BREAKER_COOLDOWN)),
+        max_cooldown=float(
+            os.getenv("RDP_BREAKER_MAX_COOLDOWN", DEFAULT_BREAKER_MAX_COOLDOWN)
+        ),
+        read_timeout_min=float(
+            os.getenv("RDP_READ_TIMEOUT_MIN", DEFAULT_READ_TIMEOUT_MIN)
+        ),
+    )
+
+
+@dataclass
+class ServerHealth:
+    server: str
+    state: str = CLOSED
+    consecutive_failures: int = 0
+    opens: int = 0  # размыканий подряд без успешного запроса
+    retry_at: float = 0.0  # time.monotonic(), когда закончится пауза
+    retry_at_wall: Optional[datetime] = None
+    probing: bool = False  # в состоянии half_open уже выполняется пробный запрос
+    skipped: int = 0
+    last_error: Optional[str] = None
+    srtt: Optional[float] = None  # сглаженная задержка запроса WS-Man, секунды
+    rttvar: float = 0.0
+    samples: int = 0
+
+
+class HealthRegistry:
+    # Состояние серверов в этом процессе: автомат защиты (circuit breaker) и
+    # задержка ответов для адаптивного таймаута. После threshold ошибок подряд
+    # сервер пропускается на паузу, растущую экспоненциально; по окончании паузы
+    # один запрос проверяет сервер, остальные по-прежнему пропускают его.
+
+    def __init__(self, settings: HealthSettings):
+        self.settings = settings
+        self._servers: Dict[str, ServerHealth] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, server: str) -> ServerHealth:
+        return self._servers.setdefault(server, ServerHealth(server=server))
+
+    def before_call(self, server: str) -> None:
+        # Разрешает запрос к серверу или выбрасывает ServerUnavailable
+        with self._lock:
+            health = self._get(server)
+            if health.state == CLOSED:
+                return
+            if health.state == OPEN and time.monotonic() >= health.retry_at:
+                health.state = HALF_OPEN
+            if health.state == HALF_OPEN and not health.probing:
+                health.probing = True
+                log.info(
+                    "Сервер %s: пробный запрос после паузы",
+                    server,
+                    extra={"server": server},
+                )
+                return
+            health.skipped += 1
+            retry_at, error = health.retry_at_wall, health.last_error
+        raise ServerUnavailable(server, retry_at, error)
+
+    def record_success(self, server: str) -> None:
+        with self._lock:
+            health = self._get(server)
+            if health.state != CLOSED:
+                log.info("Сервер %s снова отвечает", server, extra={"server": server})
+            health.state = CLOSED
+            health.consecutive_failures = 0
+            health.opens = 0
+            health.probing = False
+            health.last_error = None
+            health.retry_at_wall = None
+
+    def record_failure(self, server: str, error: BaseException) -> None:
+        with self._lock:
+            health = self._get(server)
+            health.consecutive_failures += 1
+            health.last_error = str(error)
+            health.probing = False
+            # Ошибки запросов, начатых до размыкания, паузу не продлевают
+            if health.state == HALF_OPEN or (
+                health.state == CLOSED
+                and health.consecutive_failures >= self.settings.threshold
+            ):
+                health.opens += 1
+                pause = min(
+                    self.settings.cooldown * 2 ** (health.opens - 1),
+                    self.settings.max_cooldown,
+                )
+                health.state = OPEN
+                health.retry_at = time.monotonic() + pause
+                health.retry_at_wall = datetime.now() + timedelta(seconds=pause)
+                log.warning(
+                    "Сервер %s: %d ошибок подряд, запросы к нему пропускаются %.0f с",
+                    server,
+                    health.consecutive_failures,
+                    pause,
+                    extra={"server": server},
+                )
+
+    def is_open(self, server: str) -> bool:
+        # Сервер сейчас пропускается — повторять запрос к нему нет смысла
+        with self._lock:
+            return self._get(server).state == OPEN
+
+    def release(self, server: str) -> None:
+        # Запрос прерван без результата (например, вывод не дочитан): пробный запрос
+        # можно повторить
+        with self._lock:
+            self._get(server).probing = False
+
+    def observe_latency(self, server: str, seconds: float) -> None:
+        with self._lock:
+            health = self._get(server)
+            if health.srtt is None:
+                health.srtt, health.rttvar = seconds, seconds / 2
+            else:
+                health.rttvar = (1 - _RTT_BETA) * health.rttvar + _RTT_BETA * abs(
+                    health.srtt - seconds
+                )
+                health.srtt = (1 - _RTT_ALPHA) * health.srtt + _RTT_ALPHA * seconds
+            health.samples += 1
+
+    def read_timeout(self, server: str, configured: float) -> float:
+        # Таймаут ответа по наблюдаемой задержке сервера (srtt + 4·rttvar) в пределах
+        # [read_timeout_min; configured]; каждая ошибка подряд удваивает его,
+        # чтобы медленный, но работающий сервер не отсекался раз за разом
+        with self._lock:
+            health = self._get(server)
+            if health.samples < _MIN_SAMPLES:
+                return configured
+            timeout = max(
+                self.settings.read_timeout_min, health.srtt + 4 * health.rttvar
+            )
+            timeout *= 2**health.consecutive_failures
+        return float(min(configured, timeout))
+
+    def status(
+        self, servers: Optional[List[str]] = None, configured: Optional[float] = None
+    ) -> List[dict]:
+        with self._lock:
+            names = servers if servers is not None else sorted(self._servers)
+            items = [ServerHealth(**vars(self._get(server))) for server in names]
+        return [
+            _health_item(
+                health,
+                self.read_timeout(health.server, configured) if configured else None,
+            )
+            for health in items
+        ]
+
+    def degraded(self, servers: List[str]) -> List[dict]:
+        # Серверы, которые сейчас пропускаются или отвечали с ошибками
+        return [
+            item
+            for item in self.status(servers)
+            if item["skipped"] or item["consecutive_failures"]
+        ]
+
+
+def _health_item(health: ServerHealth, read_timeout: Optional[float]) -> dict:
+    return {
+        "server": health.server,
+        "state": health.state,
+        "skipped": health.state == OPEN
+        or (health.state == HALF_OPEN and health.probing),
+        "consecutive_failures": health.consecutive_failures,
+        "last_error": health.last_error,
+        "retry_at": (
+            health.retry_at_wall.isoformat(timespec="seconds")
+            if health.state != CLOSED and health.retry_at_wall
+            else None
+        ),
+        "latency": round(health.srtt, 3) if health.srtt is not None else None,
+        "read_timeout": round(read_timeout, 1) if read_timeout is not None else None,
+        "skipped_requests": health.skipped,
+    }
+
+
+_registry: Optional[HealthRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_server_health() -> HealthRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = HealthRegistry(load_health_settings())
+        return _registry
+
+
+def degraded_servers() -> List[dict]:
+    # Серверы из RDP_SERVERS, пропущенные или отвечающие с ошибками (для ответов API)
+    from app.services.collector import load_connection_settings
+
+    try:
+        servers = load_connection_settings().servers
+    except Exception:
+        return []
+    return get_server_health().degraded(servers)
+
+
+def server_health_status() -> dict:
+    # Состояние серверов этого процесса (при нескольких воркерах uvicorn у каждого своё)
+    from app.services.collector import load_connection_settings
+
+    settings = load_connection_settings()
+    registry = get_server_health()
+    return {
+        "threshold": registry.settings.threshold,
+        "cooldown": registry.settings.cooldown,
+        "servers": registry.status(settings.servers, settings.read_timeout),
+    }
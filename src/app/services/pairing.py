@@ -0,0 +1,183 @@
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
+from app.services.events import Event
+from app.services.ps_commands import LOGOFF_EVENT_ID, LOGON_EVENT_ID
+
+# Насколько события запрашиваются за пределами периода отчёта, чтобы сессии,
+# пересекающие его границы (например, начавшиеся накануне вечером), были сопоставлены.
+PAIRING_MARGIN = timedelta(days=1)
+
+
+def pairing_window(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    # Окно событий для периода [start; end]: с запасом PAIRING_MARGIN, правая граница —
+    # не позже текущего момента (до неё же считаются продолжающиеся сессии)
+    return start - PAIRING_MARGIN, min(
+        end + PAIRING_MARGIN, datetime.now().replace(microsecond=0)
+    )
+
+
+@lru_cache(maxsize=None)
+def max_open_session() -> Optional[timedelta]:
+    # Сколько учитывается сессия без события выхода (RDP_MAX_OPEN_SESSION_HOURS, часы от
+    # входа); None (0, по умолчанию) — до конца дня входа, 23:59:59, как в прежнем
+    # отчёте
+    load_dotenv()
+    hours = float(os.getenv("RDP_MAX_OPEN_SESSION_HOURS", 0))
+    return timedelta(hours=hours) if hours > 0 else None
+
+
+def open_session_limit(start: datetime) -> datetime:
+    # Момент, дальше которого не учитывается сессия без выхода, начавшаяся в start
+    limit = max_open_session()
+    if limit is None:
+        return datetime.combine(start.date(), time(23, 59, 59))
+    return start + limit
+
+
+def open_session_since(day: date) -> datetime:
+    # Самое раннее начало сессии без выхода, которая ещё может учитываться в день day
+    midnight = datetime.combine(day, time.min)
+    limit = max_open_session()
+    return midnight if limit is None else midnight - limit
+
+
+@dataclass
+class Session:
+    server: str
+    user: str  # идентификатор сессии на сервере (поле user_id отчёта)
+    username: str
+    start: datetime
+    # Время выхода; для незакрытой сессии — момент, когда её сменил новый вход
+    # с тем же идентификатором, либо None, если сессия продолжается
+    end: Optional[datetime]
+    logout_server: Optional[str]  # None, если событие выхода не найдено
+    record_id: int = 0  # RecordId события входа на сервере server
+
+    @property
+    def closed(self) -> bool:
+        return self.logout_server is not None
+
+
+@dataclass
+class DaySegment:
+    # Часть сессии, приходящаяся на один календарный день
+    day: date
+    session: Session
+    start: datetime
+    end: datetime
+    continues: bool  # сессия продолжается после полуночи
+
+    @property
+    def duration(self) -> timedelta:
+        return self.end - self.start
+
+
+def pair_events(events: Iterable[Event]) -> Iterator[Session]:
+    # Сопоставление входов (21) и выходов (23) за один проход по событиям,
+    # отсортированным по времени. Вход и выход относятся к одной сессии, если
+    # совпадают сервер и идентификатор сессии. Выход без входа (сессия началась
+    # до начала выборки) пропускается.
+    opened: Dict[Tuple[str, str], Event] = {}
+    for event in events:
+        key = (event.server, event.user)
+        if event.event_id == LOGON_EVENT_ID:
+            previous = opened.get(key)
+            if previous is not None:
+                # Новый вход с тем же идентификатором: предыдущая сессия завершилась без
+                # события выхода
+                yield Session(
+                    previous.server,
+                    previous.user,
+                    previous.username,
+                    previous.local_time,
+                    event.local_time,
+                    None,
+                    previous.record_id,
+                )
+            opened[key] = event
+        elif event.event_id == LOGOFF_EVENT_ID:
+            logon = opened.pop(key, None)
+            if logon is not None:
+                yield Session(
+                    logon.server,
+                    logon.user,
+                    logon.username,
+                    logon.local_time,
+                    event.local_time,
+                    event.server,
+                    logon.record_id,
+                )
+    for logon in opened.values():
+        yield Session(
+            logon.server,
+            logon.user,
+            logon.username,
+            logon.local_time,
+            None,
+            None,
+            logon.record_id,
+        )
+
+
+def session_end(session: Session, until: datetime) -> datetime:
+    # Окончание сессии в отчёте: время выхода; у сессии без выхода — момент, когда её
+    # сменил новый вход, или until, если она продолжается, но не позже
+    # open_session_limit
+    if session.closed:
+        return session.end
+    end = session.end if session.end is not None else until
+    return max(session.start, min(end, open_session_limit(session.start)))
+
+
+def format_duration(duration: timedelta) -> str:
+    # H:MM:SS; часы не переходят в дни ("1 day, 0:00:00"), как у str(timedelta)
+    seconds = max(int(duration.total_seconds()), 0)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def split_by_day(session: Session, until: datetime) -> Iterator[DaySegment]:
+    # Разбивает сессию по календарным дням. Продолжающаяся сессия считается до until,
+    # сессия без выхода — не дольше open_session_limit.
+    end = session_end(session, until)
+    current = session.start
+    while True:
+        next_midnight = datetime.combine(current.date() + timedelta(days=1), time.min)
+        if end <= next_midnight:
+            yield DaySegment(current.date(), session, current, end, False)
+            return
+        yield DaySegment(current.date(), session, current, next_midnight, True)
+        current = next_midnight
+
+
+def format_segment(segment: DaySegment) -> dict:
+    # Сегмент -> запись отчёта. У части сессии, продолжающейся после полуночи, время
+    # выхода показывается как 23:59:59, и строка длительности согласована с показанным
+    # временем. Числовые поля точные (по ним считаются итоги): длительность в секундах
+    # до полуночи, границы части сессии в секундах epoch, open — событие выхода не
+    # найдено.
+    session = segment.session
+    if segment.continues:
+        logout_time = "23:59:59"
+        duration = format_duration(segment.duration - timedelta(seconds=1))
+    else:
+        logout_time = segment.end.strftime("%H:%M:%S")
+        duration = format_duration(segment.duration)
+    if not session.closed:
+        duration += " (нет выхода)"
+    return {
+        "user_id": session.user,
+        "login_server": session.server,
+        "logout_server": session.logout_server if session.closed else "нет выхода",
+        "login_time": segment.start.strftime("%H:%M:%S"),
+        "logout_time": logout_time,
+        "duration": duration,
+        "duration_seconds": int(segment.duration.total_seconds()),
+        "login_timestamp": int(segment.start.timestamp()),
+        "logout_timestamp": int(segment.end.timestamp()),
+        "open": not session.closed,
+    }
@@ -0,0 +1,240 @@
+from datetime import date, datetime, time
+from typing import Iterable, Optional, Tuple
+
+# Журнал, в который служба удалённых рабочих столов пишет события сессий
+LOG_NAME = "Microsoft-Windows-TerminalServices-LocalSessionManager/Operational"
+LOGON_EVENT_ID = 21  # вход в сессию
+LOGOFF_EVENT_ID = 23  # выход из сессии
+SESSION_EVENT_IDS = (LOGON_EVENT_ID, LOGOFF_EVENT_ID)
+
+# Форматы вывода событий (RDP_WIRE_FORMAT): json — ConvertTo-Json, compact — позиционные
+# строки с временем в мс и таблицей логинов, compact-gzip — то же, сжатое gzip и в
+# base64. Разбор — app.services.events.iter_events_output, формат определяется по
+# выводу.
+WIRE_JSON = "json"
+WIRE_COMPACT = "compact"
+WIRE_COMPACT_GZIP = "compact-gzip"
+WIRE_FORMATS = (WIRE_JSON, WIRE_COMPACT, WIRE_COMPACT_GZIP)
+
+# Символы, которые PowerShell считает одинарной кавычкой внутри '...'
+_PS_SINGLE_QUOTES = "'‘’‚‛"
+
+
+def ps_quote(value: str) -> str:
+    # Строковый литерал PowerShell в одинарных кавычках: внутри него нет
+    # подстановок, а кавычки экранируются удвоением.
+    escaped = "".join(ch * 2 if ch in _PS_SINGLE_QUOTES else ch for ch in str(value))
+    return f"'{escaped}'"
+
+
+def parse_report_date(value: str) -> date:
+    # Дата отчёта в формате YYYY-MM-DD; всё остальное отвергается до отправки на сервер
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ValueError(f"Некорректная дата '{value}', ожидается формат YYYY-MM-DD")
+
+
+def _ps_datetime(value: datetime) -> str:
+    # Локальное время сервера Windows, разбирается независимо от его региональных
+    # настроек
+    literal = ps_quote(value.strftime("%Y-%m-%dT%H:%M:%S"))
+    return (
+        f"[datetime]::ParseExact({literal}, 's', "
+        "[Globalization.CultureInfo]::InvariantCulture)"
+    )
+
+
+def _event_id_condition(event_ids: Iterable[int]) -> str:
+    ids = [int(event_id) for event_id in event_ids]
+    if not ids:
+        raise ValueError("Не задан список кодов событий")
+    return "(" + " or ".join(f"EventID={event_id}" for event_id in ids) + ")"
+
+
+def build_events_command(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    event_ids: Iterable[int] = SESSION_EVENT_IDS,
+    after_record_id: Optional[int] = None,
+    wire_format: str = WIRE_JSON,
+) -> str:
+    # Фильтрация выполняется службой журналов через -FilterXPath: Get-WinEvent читает
+    # только подходящие записи, а не весь журнал целиком. Границы периода задаются в
+    # локальном времени сервера и переводятся в UTC на его стороне, т.к. @SystemTime в
+    # журнале хранится в UTC. after_record_id оставляет только записи новее указанной
+    # (инкрементальная синхронизация). wire_format — формат вывода, см. WIRE_FORMATS.
+    if wire_format not in WIRE_FORMATS:
+        raise ValueError(
+            f"Неизвестный формат вывода '{wire_format}', допустимы: "
+            f"{', '.join(WIRE_FORMATS)}"
+        )
+    lines = ["$ErrorActionPreference = 'Stop'"]
+    time_conditions = []
+    if start is not None:
+        lines.append(f"$start = {_ps_datetime(start)}")
+        time_conditions.append("@SystemTime>='{0}'")
+    if end is not None:
+        lines.append(f"$end = {_ps_datetime(end)}")
+        time_conditions.append("@SystemTime<='{1}'")
+
+    system_filter = _event_id_condition(event_ids)
+    if after_record_id is not None:
+        system_filter += f" and EventRecordID>{int(after_record_id)}"
+    if time_conditions:
+        system_filter += " and TimeCreated[" + " and ".join(time_conditions) + "]"
+    xpath = f"*[System[{system_filter}]]"
+
+    if time_conditions:
+        utc_format = ps_quote("yyyy-MM-dd'T'HH:mm:ss.fff'Z'")
+        format_args = [
+            (
+                f"$start.ToUniversalTime().ToString({utc_format})"
+                if start is not None
+                else "''"
+            ),
+            (
+                f"$end.ToUniversalTime().ToString({utc_format})"
+                if end is not None
+                else "''"
+            ),
+        ]
+        lines.append(f"$xpath = {ps_quote(xpath)} -f {', '.join(format_args)}")
+    else:
+        lines.append(f"$xpath = {ps_quote(xpath)}")
+    lines.append(f"""try {{
+    $events = @(Get-WinEvent -LogName {ps_quote(LOG_NAME)} -FilterXPath $xpath)
+}} catch {{
+    if ($_.FullyQualifiedErrorId -notlike 'NoMatchingEventsFound*') {{ throw }}
+    $events = @()
+}}""")
+    if wire_format == WIRE_JSON:
+        lines.append("""$rows = @($events |
+  Select-Object RecordId, TimeCreated, Id,
+    @{Name='User';Expression={$_.Properties[1].Value}},
+    @{Name='UserName';Expression={$_.Properties[0].Value}} |
+  Sort-Object TimeCreated)
+ConvertTo-Json -InputObject $rows -Compress -Depth 4""")
+    else:
+        lines.append(_COMPACT_OUTPUT)
+        if wire_format == WIRE_COMPACT_GZIP:
+            lines.append(_GZIP_OUTPUT)
+        else:
+            lines.append("$out.ToString()")
+    return "\n".join(lines) + "\n"
+
+
+# Компактный вывод (формат описан в app.services.events): строки собираются в
+# StringBuilder без ConvertTo-Json для каждого события; логин передаётся один раз,
+# в событиях — его номер. Properties[1] (номер сессии) не повторяется между
+# сессиями и передаётся в строке события как есть.
+_COMPACT_OUTPUT = """\
+$names = New-Object 'System.Collections.Generic.Dictionary[string,int]'
+$out = New-Object System.Text.StringBuilder
+[void]$out.Append("RDPC1`n")
+$count = 0
+foreach ($e in @($events | Sort-Object TimeCreated)) {
+    $name = $e.Properties[0].Value
+    $index = 0
+    if (-not $names.TryGetValue([string]$name, [ref]$index)) {
+        $index = $names.Count
+        $names.Add([string]$name, $index)
+        $json = ConvertTo-Json -InputObject $name -Compress
+        [void]$out.Append("U`t").Append($json).Append("`n")
+    }
+    $ms = ([DateTimeOffset]$e.TimeCreated).ToUnixTimeMilliseconds()
+    [void]$out.Append($e.RecordId).Append(',').Append($ms).Append(',')
+    [void]$out.Append($e.Id).Append(',').Append($index).Append(',')
+    [void]$out.Append([string]$e.Properties[1].Value).Append("`n")
+    $count++
+}
+[void]$out.Append("E`t").Append($count).Append("`n")"""
+
+# Сжатие на сервере: UTF-8 -> gzip -> base64 (вывод WinRM — текст)
+_GZIP_OUTPUT = """$bytes = [Text.Encoding]::UTF8.GetBytes($out.ToString())
+$buffer = New-Object IO.MemoryStream
+$mode = [IO.Compression.CompressionMode]::Compress
+$gzip = New-Object IO.Compression.GZipStream($buffer, $mode)
+$gzip.Write($bytes, 0, $bytes.Length)
+$gzip.Close()
+"RDPC1 gzip"
+$lineBreaks = [Base64FormattingOptions]::InsertLineBreaks
+[Convert]::ToBase64String($buffer.ToArray(), $lineBreaks)"""
+
+
+def report_bounds(start_date: str, end_date: str) -> Tuple[datetime, datetime]:
+    # Границы периода отчёта: [start_date 00:00:00; end_date 23:59:59]
+    start = datetime.combine(parse_report_date(start_date), time.min)
+    end = datetime.combine(parse_report_date(end_date), time(23, 59, 59))
+    if start > end:
+        raise ValueError(f"Начальная дата {start_date} позже конечной {end_date}")
+    return start, end
+
+
+def build_sessions_command(start_date: str, end_date: str) -> str:
+    # События входа/выхода за период отчёта
+    return build_events_command(*report_bounds(start_date, end_date))
+
+
+def build_availability_command(count_days: Iterable[int]) -> str:
+    # Сведения о доступности данных без выгрузки журнала: свойства журнала
+    # (Get-WinEvent -ListLog), самое старое и самое новое событие входа/выхода
+    # (-MaxEvents 1, -Oldest) и число событий за последние count_days дней.
+    # Счёт ведётся на сервере: EventLogReader читает записи по одной, по сети
+    # передаются только числа.
+    xpath = f"*[System[{_event_id_condition(SESSION_EVENT_IDS)}]]"
+    counts = "; ".join(
+        f"'{int(days)}' = (Count-Events {ps_quote(_recent_xpath(int(days)))})"
+        for days in count_days
+    )
+    return f"""$ErrorActionPreference = 'Stop'
+$logName = {ps_quote(LOG_NAME)}
+$xpath = {ps_quote(xpath)}
+function First-Event([switch]$Oldest) {{
+    try {{
+        $filter = @{{ LogName = $logName; FilterXPath = $xpath }}
+        $first = Get-WinEvent @filter -MaxEvents 1 -Oldest:$Oldest
+    }} catch {{
+        if ($_.FullyQualifiedErrorId -notlike 'NoMatchingEventsFound*') {{ throw }}
+        return $null
+    }}
+    return $first | Select-Object RecordId, TimeCreated
+}}
+function Count-Events([string]$query) {{
+    $pathType = [System.Diagnostics.Eventing.Reader.PathType]::LogName
+    $queryArgs = @($logName, $pathType, $query)
+    $logQuery = New-Object System.Diagnostics.Eventing.Reader.EventLogQuery $queryArgs
+    $reader = New-Object System.Diagnostics.Eventing.Reader.EventLogReader($logQuery)
+    $count = 0
+    try {{
+        while (($record = $reader.ReadEvent()) -ne $null) {{
+            $count++
+            $record.Dispose()
+        }}
+    }} finally {{
+        $reader.Dispose()
+    }}
+    return $count
+}}
+$log = Get-WinEvent -ListLog $logName
+$result = [ordered]@{{
+    IsEnabled = $log.IsEnabled
+    LogMode = [string]$log.LogMode
+    RecordCount = $log.RecordCount
+    FileSize = $log.FileSize
+    MaximumSizeInBytes = $log.MaximumSizeInBytes
+    Oldest = First-Event -Oldest
+    Newest = First-Event
+    Counts = [ordered]@{{ {counts} }}
+}}
+ConvertTo-Json -InputObject $result -Compress -Depth 4
+"""
+
+
+def _recent_xpath(days: int) -> str:
+    # События входа/выхода не старше days дней (timediff — разница с текущим временем в
+    # мс)
+    return (
+        f"*[System[{_event_id_condition(SESSION_EVENT_IDS)} and "
+        f"TimeCreated[timediff(@SystemTime) <= {days * 86400 * 1000}]]]"
+    )
@@ -1,151 +1,378 @@
-import os
-from dotenv import load_dotenv
-import winrm
+import base64
 import json
-from datetime import datetime, timedelta
-from collections import defaultdict
-import re
+import threading
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.services.availability import get_available_dates
+from app.services.collector import load_connection_settings
+from app.services.columnar import SessionColumns, SessionTotals, session_totals
+from app.services.concurrency import server_concurrency
+from app.services.event_store import get_event_store
+from app.services.health import degraded_servers
+from app.services.pairing import PAIRING_MARGIN, format_segment, pairing_window
+from app.services.ps_commands import report_bounds
+from app.services.report_cache import get_report_cache
+from app.services.rollups import get_stats
+from app.services.scheduler import scheduler_enabled
+from app.services.sessions import day_segments, refresh_sessions, segment_columns
+from app.services.singleflight import SingleFlight
+from app.services.sync import SyncFailure, sync_servers
 from app.utils.logger import get_logger
+from app.utils.metrics import observe_stage
 
 log = get_logger(__name__)
 
+_sessions_flight = SingleFlight()
 
-# Функция для преобразования формата времени из PowerShell
-# Пример: "/Date(1745060200298)/" -> datetime
-def parse_ps_datetime(ps_date):
-    match = re.search(r"\d+", ps_date)
-    if match:
-        timestamp = int(match.group(0)) // 1000
-        return datetime.fromtimestamp(timestamp)
-    return None
-
-
-def get_rdp_sessions(start_date: str, end_date: str) -> dict:
-    load_dotenv()
-    username = os.getenv('RDP_LOG_USERNAME')
-    password = os.getenv('RDP_LOG_PASSWORD')
-    domain = os.getenv('RDP_LOG_DOMAIN')
-    servers_str = os.getenv('RDP_SERVERS', '')
-
-    if not username or not password:
-        log.error("Не заданы параметры подключения (RDP_LOG_USERNAME, RDP_LOG_PASSWORD) в .env")
-        raise Exception("Не заданы параметры подключения (RDP_LOG_USERNAME, RDP_LOG_PASSWORD) в .env")
-    if not servers_str:
-        log.error("Не задан список серверов (RDP_SERVERS) в .env")
-        raise Exception("Не задан список серверов (RDP_SERVERS) в .env")
-
-    if domain:
-        user = f"{domain}\\{username}"
-    else:
-        user = username
-
-    servers = [server.strip() for server in servers_str.split(',')]
-    log.info(f"Сбор статистики с серверов: {servers} за период {start_date} - {end_date}")
-
-    ps_command = f'''
-$dt1 = [datetime]"{start_date} 00:00:00"
-$dt2 = [datetime]"{end_date} 23:59:59"
-
-Get-WinEvent -LogName "Microsoft-Windows-TerminalServices-LocalSessionManager/Operational" |
-  Where-Object {{ 
-    $_.Id -in 21,23 -and 
-    $_.TimeCreated -ge $dt1 -and 
-    $_.TimeCreated -le $dt2 
-  }} |
-  Select-Object TimeCreated, Id, @{{Name="User";Expression={{($_.Properties[1].Value)}}}}, @{{Name="UserName";Expression={{($_.Properties[0].Value)}}}} |
-  Sort-Object TimeCreated | 
-  ConvertTo-Json -Compress -Depth 4
-'''
-
-    all_data = []
-    for server in servers:
-        try:
-            log.info(f"Подключение к серверу {server}...")
-            session = winrm.Session(server, auth=(user, password), transport='ntlm')
-            result = session.run_ps(ps_command)
-            if result.status_code != 0:
-                log.error(f"Ошибка на сервере {server}: {result.std_err.decode(errors='ignore')}")
-                continue
-            try:
-                data = json.loads(result.std_out.decode(errors='ignore'))
-                if isinstance(data, list):
-                    for event in data:
-                        event['Server'] = server
-                    all_data.extend(data)
-                    log.info(f"Получено {len(data)} событий с сервера {server}")
-                else:
-                    log.warning(f"Неожиданный формат данных с сервера {server}")
-            except Exception as e:
-                log.error(f"Ошибка разбора JSON с сервера {server}: {e}")
-                continue
-        except Exception as e:
-            log.error(f"Ошибка подключения к серверу {server}: {e}")
-            continue
+# Номер обновления сессий, изменения до которого уже сброшены в кэше отчёта этого
+# процесса
+_report_seq: Optional[int] = None
+_report_seq_lock = threading.Lock()
 
-    log.info(f"Всего получено событий: {len(all_data)}")
+# Сколько дней рассчитывается за раз при потоковой выдаче и постраничном чтении отчёта
+STREAM_CHUNK_DAYS = 7
 
-    # Группировка: (user, username) -> date -> list of events
-    sessions = defaultdict(lambda: defaultdict(list))
-    for event in all_data:
-        server = event.get("Server", "unknown")
-        user = str(event["User"])
-        username = str(event.get("UserName", ""))
-        dt = parse_ps_datetime(event["TimeCreated"])
-        if not dt:
-            continue
-        date_str = dt.date().isoformat()
-        sessions[(user, username)][date_str].append({
-            "datetime": dt,
-            "type": event["Id"],
-            "server": server
-        })
+
+def _sync_store(start: datetime, end: datetime) -> List[SyncFailure]:
+    # Догружаем в локальное хранилище только новые события, отчёт строится по хранилищу.
+    # Если работает фоновый сборщик, серверы опрашиваются лишь для загрузки
+    # ещё не покрытого хранилищем периода. Возвращает незагруженные периоды серверов.
+    settings = load_connection_settings()
+    log.info(
+        "Сбор статистики с серверов: %s за период %s - %s",
+        settings.servers,
+        start.date(),
+        end.date(),
+    )
+    window_start, _ = pairing_window(start, end)
+    backfill_only = scheduler_enabled()
+    failures: List[SyncFailure] = []
+    for server, result in sync_servers(
+        window_start, settings, get_event_store(), backfill_only=backfill_only
+    ).items():
+        if not result.ok:
+            log.warning(
+                "Сервер %s: %s, отчёт по нему строится по сохранённым данным",
+                server,
+                result.error,
+                extra={"server": server},
+            )
+        failures.extend(result.failures)
+    return failures
+
+
+def _failed_days(failures: Iterable[SyncFailure]) -> Set[str]:
+    # Дни, на отчёт за которые могут повлиять незагруженные периоды (с запасом
+    # PAIRING_MARGIN)
+    days: Set[str] = set()
+    for failure in failures:
+        first = date.fromtimestamp(failure.start_ms / 1000) - PAIRING_MARGIN
+        last = date.fromtimestamp(failure.end_ms / 1000) + PAIRING_MARGIN
+        days.update(
+            (first + timedelta(days=i)).isoformat()
+            for i in range((last - first).days + 1)
+        )
+    return days
+
+
+def _refresh_report_sessions() -> None:
+    # Обновляет сессии по загруженным событиям (в том числе другими процессами) и
+    # сбрасывает в кэше отчёта только дни, сессии которых изменились: например, поздний
+    # выход закрывает сессию «нет выхода» за прошлые дни
+    global _report_seq
+    store = get_event_store()
+    refresh_sessions(store)
+    with _report_seq_lock:
+        if _report_seq is None:
+            _report_seq = store.session_seq()
+            return
+        changes = store.session_changes(_report_seq)
+        if changes:
+            _report_seq = max(change[3] for change in changes)
+            get_report_cache().invalidate({change[0] for change in changes})
+
+
+def build_rdp_sessions(start_date: str, end_date: str, sync: bool = True) -> dict:
+    # Отчёт за период без кэша: синхронизация хранилища и чтение сессий из таблицы
+    # сессий
+    start, end = report_bounds(start_date, end_date)
+    if sync:
+        _sync_store(start, end)
+    refresh_sessions()
+    with observe_stage("pairing"):
+        segments = day_segments(
+            start.date(), end.date(), load_connection_settings().servers
+        )
 
     # Формируем отчёт с группировкой по дате и username
     grouped = {}
-    for (user, username), days in sessions.items():
-        for date_str, events in days.items():
-            if date_str not in grouped:
-                grouped[date_str] = {}
-            if username not in grouped[date_str]:
-                grouped[date_str][username] = []
-            events.sort(key=lambda x: x["datetime"])
-            i = 0
-            while i < len(events):
-                if events[i]["type"] == 21:  # вход
-                    start_time = events[i]["datetime"]
-                    start_server = events[i]["server"]
-                    end_time = None
-                    end_server = None
-                    for j in range(i + 1, len(events)):
-                        if events[j]["type"] == 23:
-                            end_time = events[j]["datetime"]
-                            end_server = events[j]["server"]
-                            break
-                    if end_time:
-                        duration = end_time - start_time
-                        grouped[date_str][username].append({
-                            "user_id": user,
-                            "login_server": start_server,
-                            "logout_server": end_server,
-                            "login_time": start_time.strftime("%H:%M:%S"),
-                            "logout_time": end_time.strftime("%H:%M:%S"),
-                            "duration": str(duration)
-                        })
-                        i = j + 1
-                    else:
-                        end_time = start_time.replace(hour=23, minute=59, second=59)
-                        duration = end_time - start_time
-                        grouped[date_str][username].append({
-                            "user_id": user,
-                            "login_server": start_server,
-                            "logout_server": "нет выхода",
-                            "login_time": start_time.strftime("%H:%M:%S"),
-                            "logout_time": end_time.strftime("%H:%M:%S"),
-                            "duration": str(duration) + " (нет выхода)"
-                        })
-                        i += 1
-                else:
-                    i += 1
+    for date_str in sorted(segments):
+        grouped[date_str] = {
+            username: [format_segment(segment) for segment in user_segments]
+            for username, user_segments in segments[date_str].items()
+        }
     log.info(
-        f"Сформировано {sum(len(u) for d in grouped.values() for u in d.values())} сессий для отчёта (группировка)")
+        "Сформировано %d сессий для отчёта (группировка)",
+        sum(len(u) for d in grouped.values() for u in d.values()),
+    )
     return grouped
+
+
+def _segment_columns(start: datetime, end: datetime, sync: bool) -> SessionColumns:
+    # Части сессий за период из таблицы сессий — те же, что в отчёте /sessions
+    if sync:
+        _sync_store(start, end)
+    refresh_sessions()
+    return segment_columns(start.date(), end.date(), load_connection_settings().servers)
+
+
+def get_session_totals(
+    start_date: str, end_date: str, sync: bool = True
+) -> SessionTotals:
+    # Суммарная длительность сессий по логинам за каждый день периода.
+    # Считается по столбцам частей сессий векторно, без построения записей отчёта.
+    start, end = report_bounds(start_date, end_date)
+    columns = _segment_columns(start, end, sync)
+    with observe_stage("totals"):
+        return session_totals(columns, start.date(), end.date())
+
+
+def get_concurrency(start_date: str, end_date: str) -> List[dict]:
+    # Число одновременных сессий по серверам: пик, 95-й перцентиль и максимумы по часам
+    start, end = report_bounds(start_date, end_date)
+    columns = _segment_columns(start, end, sync=True)
+    with observe_stage("concurrency"):
+        return [
+            vars(item) for item in server_concurrency(columns, start.date(), end.date())
+        ]
+
+
+def report_days(start_date: str, end_date: str) -> List[str]:
+    start, end = report_bounds(start_date, end_date)
+    return [
+        (start.date() + timedelta(days=i)).isoformat()
+        for i in range((end.date() - start.date()).days + 1)
+    ]
+
+
+def get_rdp_report(
+    start_date: str,
+    end_date: str,
+    sync: bool = True,
+    failures: Iterable[SyncFailure] = (),
+) -> Tuple[dict, List[SyncFailure]]:
+    # Отчёт собирается из кэша по дням; рассчитываются только отсутствующие
+    # в кэше дни (непрерывными отрезками, чтобы не дробить запросы).
+    # Возвращает (отчёт, незагруженные периоды серверов). Дни, затронутые
+    # незагруженными периодами (в том числе переданными в failures), не кэшируются.
+    _refresh_report_sessions()
+    cache = get_report_cache()
+    days = report_days(start_date, end_date)
+    per_day = {day: cache.get(day) for day in days}
+    failures = list(failures)
+
+    missing_runs: List[List[str]] = []
+    for day in days:
+        if per_day[day] is not None:
+            continue
+        if (
+            missing_runs
+            and (
+                date.fromisoformat(day) - date.fromisoformat(missing_runs[-1][-1])
+            ).days
+            == 1
+        ):
+            missing_runs[-1].append(day)
+        else:
+            missing_runs.append([day])
+
+    if missing_runs and sync:
+        failures.extend(
+            _sync_store(*report_bounds(missing_runs[0][0], missing_runs[-1][-1]))
+        )
+        _refresh_report_sessions()
+    incomplete = _failed_days(failures)
+    for run in missing_runs:
+        grouped = build_rdp_sessions(run[0], run[-1], sync=False)
+        for day in run:
+            per_day[day] = grouped.get(day, {})
+            if day not in incomplete:
+                cache.put(day, per_day[day])
+
+    if missing_runs:
+        log.info(
+            "Кэш отчёта: рассчитано %d из %d дней",
+            sum(len(run) for run in missing_runs),
+            len(days),
+        )
+    return {day: per_day[day] for day in days if per_day[day]}, failures
+
+
+def get_rdp_sessions(start_date: str, end_date: str, sync: bool = True) -> dict:
+    return get_rdp_report(start_date, end_date, sync)[0]
+
+
+def sync_report_period(start_date: str, end_date: str) -> List[SyncFailure]:
+    # Синхронизация хранилища за период без расчёта отчёта
+    return _sync_store(*report_bounds(start_date, end_date))
+
+
+def iter_report_days(
+    start_date: str, end_date: str, failures: Iterable[SyncFailure] = ()
+) -> Iterator[Tuple[str, dict]]:
+    # Отчёт по дням (дни без сессий пропускаются). Дни рассчитываются порциями
+    # по STREAM_CHUNK_DAYS без обращения к серверам — хранилище должно быть
+    # синхронизировано заранее (sync_report_period, его ошибки передаются в failures).
+    # В памяти — не больше одной порции.
+    days = report_days(start_date, end_date)
+    failures = list(failures)
+    for i in range(0, len(days), STREAM_CHUNK_DAYS):
+        chunk = days[i : i + STREAM_CHUNK_DAYS]
+        grouped, _ = get_rdp_report(chunk[0], chunk[-1], sync=False, failures=failures)
+        for day in chunk:
+            if grouped.get(day):
+                yield day, grouped[day]
+
+
+def encode_cursor(day: str, username: str, index: int) -> str:
+    raw = json.dumps([day, username, index], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    try:
+        day, username, index = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        date.fromisoformat(day)
+        return day, str(username), int(index)
+    except Exception:
+        raise ValueError("Некорректный cursor")
+
+
+def iter_report_rows(
+    start_date: str,
+    end_date: str,
+    cursor: Optional[str] = None,
+    failures: Iterable[SyncFailure] = (),
+) -> Iterator[Tuple[str, str, int, dict]]:
+    # Сессии отчёта по одной: (дата, username, номер сессии пользователя за день,
+    # сессия) в порядке даты, username и времени входа. cursor — позиция, с которой
+    # продолжить.
+    after = decode_cursor(cursor) if cursor else None
+    start, end = report_bounds(start_date, end_date)
+    first_day = (
+        max(start.date().isoformat(), after[0]) if after else start.date().isoformat()
+    )
+    last_day = end.date().isoformat()
+    if first_day > last_day:
+        return
+    for day, users in iter_report_days(first_day, last_day, failures):
+        for username in sorted(users):
+            if after and (day, username) < after[:2]:
+                continue
+            skip = after[2] if after and (day, username) == after[:2] else 0
+            for index, session in enumerate(users[username][skip:], start=skip):
+                yield day, username, index, session
+
+
+def get_rdp_sessions_page(
+    start_date: str, end_date: str, limit: int, cursor: Optional[str] = None
+) -> dict:
+    # Страница отчёта не больше limit сессий; next_cursor — позиция следующей страницы
+    if cursor:
+        decode_cursor(cursor)
+    failures = sync_report_period(start_date, end_date)
+    items, next_cursor = [], None
+    for day, username, index, session in iter_report_rows(
+        start_date, end_date, cursor, failures
+    ):
+        if len(items) == limit:
+            next_cursor = encode_cursor(day, username, index)
+            break
+        items.append({"date": day, "username": username, **session})
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "failures": [failure.as_dict() for failure in failures],
+        "degraded_servers": degraded_servers(),
+    }
+
+
+def get_rdp_stats(
+    dimension: str, start_date: str, end_date: str, group: str
+) -> List[dict]:
+    # Агрегаты по пользователям (dimension="user") или серверам ("server") за период
+    # из предрассчитанных таблиц; хранилище предварительно синхронизируется
+    sync_report_period(start_date, end_date)
+    return get_stats(dimension, start_date, end_date, group)
+
+
+def refresh_recent_days() -> None:
+    # Пересчитывает в кэше дни, на которые ещё могут повлиять новые события
+    today = date.today()
+    first = today - PAIRING_MARGIN
+    invalidate_report_cache(first.isoformat(), today.isoformat())
+    get_rdp_sessions(first.isoformat(), today.isoformat())
+
+
+async def get_rdp_report_async(
+    start_date: str, end_date: str
+) -> Tuple[dict, List[SyncFailure]]:
+    # Неблокирующая версия для обработчиков FastAPI: сбор выполняется в пуле потоков,
+    # а одновременные запросы за один и тот же период объединяются в один сбор.
+    return await _sessions_flight.do(
+        (start_date, end_date),
+        lambda: run_in_threadpool(get_rdp_report, start_date, end_date),
+    )
+
+
+async def sync_report_period_async(start_date: str, end_date: str) -> List[SyncFailure]:
+    # Одновременные синхронизации одного периода объединяются
+    return await _sessions_flight.do(
+        ("sync", start_date, end_date),
+        lambda: run_in_threadpool(sync_report_period, start_date, end_date),
+    )
+
+
+async def get_rdp_sessions_page_async(
+    start_date: str, end_date: str, limit: int, cursor: Optional[str] = None
+) -> dict:
+    return await run_in_threadpool(
+        get_rdp_sessions_page, start_date, end_date, limit, cursor
+    )
+
+
+async def get_rdp_stats_async(
+    dimension: str, start_date: str, end_date: str, group: str
+) -> List[dict]:
+    return await _sessions_flight.do(
+        ("stats", dimension, start_date, end_date, group),
+        lambda: run_in_threadpool(
+            get_rdp_stats, dimension, start_date, end_date, group
+        ),
+    )
+
+
+async def get_available_dates_async(refresh: bool = False) -> dict:
+    return await _sessions_flight.do(
+        ("available-dates", refresh),
+        lambda: run_in_threadpool(get_available_dates, refresh),
+    )
+
+
+async def get_concurrency_async(start_date: str, end_date: str) -> List[dict]:
+    return await _sessions_flight.do(
+        ("concurrency", start_date, end_date),
+        lambda: run_in_threadpool(get_concurrency, start_date, end_date),
+    )
+
+
+def invalidate_report_cache(
+    start_date: Optional[str] = None, end_date: Optional[str] = None
+) -> int:
+    cache = get_report_cache()
+    if start_date is None and end_date is None:
+        return cache.invalidate()
+    return cache.invalidate(report_days(start_date or end_date, end_date or start_date))
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+from app.services.pairing import PAIRING_MARGIN
+from app.utils.logger import get_logger
+from app.utils.metrics import REPORT_CACHE_REQUESTS_TOTAL
+
+log = get_logger(__name__)
+
+DEFAULT_MAX_DAYS = 1000
+DEFAULT_TODAY_TTL = 60
+
+
+class ReportCache:
+    # Кэш отчёта по дням: дата (YYYY-MM-DD) -> {username: [сессии]}.
+    # Завершившиеся дни хранятся без срока жизни, текущий (и будущие) — ttl секунд.
+    # День считается завершённым через settle_days дней после его окончания:
+    # на него ещё могут влиять события следующих дней (сессии через полночь).
+    # При превышении max_days вытесняются давно не использованные дни (LRU).
+    # Закэшированные значения не должны изменяться вызывающим кодом.
+
+    def __init__(
+        self,
+        max_days: int = DEFAULT_MAX_DAYS,
+        today_ttl: float = DEFAULT_TODAY_TTL,
+        settle_days: int = 0,
+    ):
+        self.max_days = max_days
+        self.today_ttl = today_ttl
+        self.settle_days = settle_days
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, day: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(day)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(day)
+                    self.hits += 1
+                    REPORT_CACHE_REQUESTS_TOTAL.labels("hit").inc()
+                    return value
+                del self._entries[day]
+            self.misses += 1
+            REPORT_CACHE_REQUESTS_TOTAL.labels("miss").inc()
+            return None
+
+    def put(self, day: str, value: dict) -> None:
+        if date.fromisoformat(day) < date.today() - timedelta(days=self.settle_days):
+            expires_at = None
+        else:
+            expires_at = time.monotonic() + self.today_ttl
+        with self._lock:
+            self._entries[day] = (value, expires_at)
+            self._entries.move_to_end(day)
+            while len(self._entries) > self.max_days:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, days: Optional[Iterable[str]] = None) -> int:
+        # Сбрасывает указанные дни (или весь кэш); возвращает число удалённых записей
+        with self._lock:
+            if days is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            removed = 0
+            for day in days:
+                if self._entries.pop(day, None) is not None:
+                    removed += 1
+            return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "days": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_cache: Optional[ReportCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache() -> ReportCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            load_dotenv()
+            _cache = ReportCache(
+                max_days=int(os.getenv("RDP_CACHE_MAX_DAYS", DEFAULT_MAX_DAYS)),
+                today_ttl=float(os.getenv("RDP_CACHE_TODAY_TTL", DEFAULT_TODAY_TTL)),
+                settle_days=PAIRING_MARGIN.days,
+            )
+        return _cache
@@ -0,0 +1,187 @@
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.services.collector import load_connection_settings
+from app.services.event_store import ROLLUP_DIMENSIONS, EventStore, get_event_store
+from app.services.pairing import PAIRING_MARGIN
+from app.services.ps_commands import report_bounds
+from app.services.sessions import open_segments, refresh_sessions
+from app.utils.logger import get_logger
+from app.utils.metrics import observe_stage
+
+log = get_logger(__name__)
+
+# Сколько дней агрегатов рассчитывается за один запрос к таблице сессий
+ROLLUP_CHUNK_DAYS = 31
+ROLLUP_GROUPS = ("day", "month", "total")
+
+
+def _settled(day: date, computed_ms: int) -> bool:
+    # На агрегаты дня влияют события до конца следующего дня (запас PAIRING_MARGIN)
+    # и продолжающиеся сессии — до момента расчёта
+    settle_at = datetime.combine(
+        day + PAIRING_MARGIN + timedelta(days=1), datetime.min.time()
+    )
+    return computed_ms >= settle_at.timestamp() * 1000
+
+
+def _days_to_compute(store: EventStore, first: date, last: date) -> List[date]:
+    known = store.rollup_days(first.isoformat(), last.isoformat())
+    days = []
+    for i in range((last - first).days + 1):
+        day = first + timedelta(days=i)
+        state = known.get(day.isoformat())
+        if state is None or state[1] or not _settled(day, state[0]):
+            days.append(day)
+    return days
+
+
+def _day_rows(
+    store: EventStore,
+    dimension: str,
+    first: date,
+    last: date,
+    servers: List[str],
+    keys: Optional[List[Tuple[str, str]]] = None,
+) -> List[Tuple[str, str, int, int]]:
+    # Строки (день, логин или сервер входа, секунды, сессии) за дни first..last:
+    # завершившиеся сессии суммируются запросом к таблице частей сессий, продолжающиеся
+    # — до текущего момента. keys — только эти пары (день, логин или сервер).
+    totals: Dict[Tuple[str, str], List[int]] = {
+        (day, name): [seconds, sessions]
+        for day, name, seconds, sessions in store.session_day_totals(
+            dimension, first.isoformat(), last.isoformat(), servers, keys
+        )
+    }
+    wanted = set(keys) if keys is not None else None
+    for segment in open_segments(store, first, last, servers):
+        name = (
+            segment.session.username if dimension == "user" else segment.session.server
+        )
+        key = (segment.day.isoformat(), name)
+        seconds = int(segment.duration.total_seconds())
+        if seconds <= 0 or (wanted is not None and key not in wanted):
+            continue
+        item = totals.setdefault(key, [0, 0])
+        item[0] += seconds
+        item[1] += 1
+    return [
+        (day, name, seconds, sessions)
+        for (day, name), (seconds, sessions) in sorted(totals.items())
+    ]
+
+
+def compute_rollups(
+    first: date, last: date, store: Optional[EventStore] = None
+) -> None:
+    # Пересчитывает агрегаты за дни first..last по таблице сессий
+    # (тем же сессиям, что и в отчёте /sessions за эти дни)
+    store = store or get_event_store()
+    refresh_sessions(store)
+    servers = load_connection_settings().servers
+    computed_ms = int(time.time() * 1000)
+    with observe_stage("rollups"):
+        user_rows = _day_rows(store, "user", first, last, servers)
+        server_rows = _day_rows(store, "server", first, last, servers)
+    days = [
+        (first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)
+    ]
+    store.save_rollups(days, computed_ms, user_rows, server_rows)
+
+
+def apply_session_changes(store: Optional[EventStore] = None) -> int:
+    # Пересчитывает агрегаты только по парам (день, логин) и (день, сервер), сессии
+    # которых изменились после прошлого применения; дни без рассчитанных агрегатов
+    # пропускаются (они рассчитываются целиком при запросе). Возвращает число
+    # пересчитанных пар.
+    store = store or get_event_store()
+    refresh_sessions(store)
+    changes = store.session_changes(store.get_meta("rollups_seq"))
+    if not changes:
+        return 0
+    last_seq = max(change[3] for change in changes)
+    days = sorted({change[0] for change in changes})
+    computed = store.rollup_days(days[0], days[-1])
+    changes = [change for change in changes if change[0] in computed]
+    user_keys = sorted({(day, username) for day, username, _, _ in changes})
+    server_keys = sorted({(day, server) for day, _, server, _ in changes})
+    if changes:
+        servers = load_connection_settings().servers
+        first, last = date.fromisoformat(user_keys[0][0]), date.fromisoformat(
+            user_keys[-1][0]
+        )
+        with observe_stage("rollups"):
+            user_rows = _day_rows(store, "user", first, last, servers, user_keys)
+            server_rows = _day_rows(store, "server", first, last, servers, server_keys)
+        store.update_rollups(user_keys, server_keys, user_rows, server_rows)
+        log.info(
+            "Агрегаты: пересчитано %d пар день/логин после изменения сессий",
+            len(user_keys),
+        )
+    store.set_meta("rollups_seq", last_seq)
+    return len(user_keys)
+
+
+def _compute_days(days: List[date], store: EventStore) -> None:
+    # Расчёт непрерывными отрезками не длиннее ROLLUP_CHUNK_DAYS
+    runs: List[List[date]] = []
+    for day in days:
+        if (
+            runs
+            and (day - runs[-1][-1]).days == 1
+            and len(runs[-1]) < ROLLUP_CHUNK_DAYS
+        ):
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    for run in runs:
+        compute_rollups(run[0], run[-1], store)
+
+
+def ensure_rollups(first: date, last: date, store: Optional[EventStore] = None) -> int:
+    # Применяет изменения сессий и досчитывает отсутствующие, устаревшие и ещё
+    # не окончательные дни периода. Возвращает число пересчитанных дней.
+    store = store or get_event_store()
+    apply_session_changes(store)
+    days = _days_to_compute(store, first, last)
+    _compute_days(days, store)
+    if days:
+        log.info(
+            "Агрегаты: рассчитано %d дней за период %s - %s", len(days), first, last
+        )
+    return len(days)
+
+
+def refresh_rollups(store: Optional[EventStore] = None) -> int:
+    # Применение изменений сессий к рассчитанным агрегатам и пересчёт ещё не
+    # окончательных дней
+    store = store or get_event_store()
+    apply_session_changes(store)
+    days = sorted(
+        date.fromisoformat(day)
+        for day, (computed_ms, stale) in store.rollup_days(
+            date.min.isoformat(), date.max.isoformat()
+        ).items()
+        if stale or not _settled(date.fromisoformat(day), computed_ms)
+    )
+    _compute_days(days, store)
+    return len(days)
+
+
+def get_stats(dimension: str, start_date: str, end_date: str, group: str) -> List[dict]:
+    # Суммарная длительность сессий по пользователям или серверам входа:
+    # по дням, месяцам или за весь период
+    if group not in ROLLUP_GROUPS:
+        raise ValueError(f"Неизвестная группировка {group}")
+    start, end = report_bounds(start_date, end_date)
+    store = get_event_store()
+    ensure_rollups(start.date(), end.date(), store)
+    rows = store.query_rollups(
+        dimension, start.date().isoformat(), end.date().isoformat(), group
+    )
+    _, column = ROLLUP_DIMENSIONS[dimension]
+    return [
+        {"period": period, column: name, "seconds": seconds, "sessions": sessions}
+        for period, name, seconds, sessions in rows
+    ]
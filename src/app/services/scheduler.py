@@ -0,0 +1,337 @@
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from app.services.collector import load_connection_settings
+from app.services.event_store import get_event_store
+from app.services.rollups import refresh_rollups
+from app.services.sync import sync_servers
+from app.services.winrm_pool import prune_winrm_pool
+from app.utils.logger import get_logger, log_context, new_request_id
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка между процессами недоступна
+    fcntl = None
+
+log = get_logger(__name__)
+
+DEFAULT_INTERVAL = 300
+DEFAULT_JITTER = 0.1
+DEFAULT_MAX_BACKOFF = 3600
+DEFAULT_LOOKBACK_DAYS = 7
+# Как часто поток проверяет, не пора ли опросить серверы и не освободилась ли блокировка
+_TICK = 5.0
+
+
+@dataclass
+class SchedulerSettings:
+    enabled: bool = False
+    interval: int = DEFAULT_INTERVAL  # период опроса сервера, секунды
+    jitter: float = DEFAULT_JITTER  # случайное отклонение периода, доля от interval
+    max_backoff: int = (
+        DEFAULT_MAX_BACKOFF  # предельная пауза для сервера с ошибками, секунды
+    )
+    lookback_days: int = DEFAULT_LOOKBACK_DAYS  # глубина первой загрузки, дни
+    # Сбор выполняют отдельные процессы (run_collector.py, shard_collector.py): API не
+    # запускает свой поток, но, как и при включённом сборщике, не опрашивает серверы за
+    # новыми событиями
+    external: bool = False
+
+
+def load_scheduler_settings() -> SchedulerSettings:
+    load_dotenv()
+    return SchedulerSettings(
+        enabled=os.getenv("RDP_SCHEDULER_ENABLED", "").lower() in ("1", "true", "yes"),
+        interval=int(os.getenv("RDP_SCHEDULER_INTERVAL", DEFAULT_INTERVAL)),
+        jitter=float(os.getenv("RDP_SCHEDULER_JITTER", DEFAULT_JITTER)),
+        max_backoff=int(os.getenv("RDP_SCHEDULER_MAX_BACKOFF", DEFAULT_MAX_BACKOFF)),
+        lookback_days=int(
+            os.getenv("RDP_SCHEDULER_LOOKBACK_DAYS", DEFAULT_LOOKBACK_DAYS)
+        ),
+        external=os.getenv("RDP_SCHEDULER_EXTERNAL", "").lower()
+        in ("1", "true", "yes"),
+    )
+
+
+def scheduler_enabled() -> bool:
+    settings = load_scheduler_settings()
+    return settings.enabled or settings.external
+
+
+def backoff_delay(settings: SchedulerSettings, failures: int) -> float:
+    # Пауза до следующего опроса сервера: interval, удваиваемый за каждую ошибку подряд
+    # (не больше max_backoff), со случайным отклонением jitter
+    base = min(settings.interval * (2**failures), settings.max_backoff)
+    return max(1.0, base * (1 + random.uniform(-settings.jitter, settings.jitter)))
+
+
+def lookback_since(settings: SchedulerSettings) -> datetime:
+    return datetime.combine(
+        date.today() - timedelta(days=settings.lookback_days), datetime.min.time()
+    )
+
+
+@dataclass
+class ServerSchedule:
+    server: str
+    next_run: float = 0.0  # time.monotonic()
+    next_run_at: Optional[datetime] = None
+    failures: int = 0
+    last_attempt: Optional[datetime] = None
+    last_success: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+
+class _LeaderLock:
+    # Межпроцессная блокировка на файле: при запуске uvicorn с несколькими
+    # воркерами собирает данные только процесс, захвативший блокировку.
+    # Если он завершится, блокировку подхватит другой воркер.
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        if fcntl is None:
+            self._file = open(self.path, "a")
+            return True
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class CollectorScheduler:
+    # Фоновый сбор событий: каждый сервер опрашивается раз в interval секунд
+    # (со случайным отклонением), при ошибках пауза растёт экспоненциально.
+    # После получения новых событий пересчитываются недавние дни в кэше отчёта.
+
+    def __init__(self, settings: SchedulerSettings, lock_path: str):
+        self.settings = settings
+        self._lock = _LeaderLock(lock_path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._schedules: Dict[str, ServerSchedule] = {}
+        self._state_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def leader(self) -> bool:
+        return self._lock.held
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="rdp-scheduler", daemon=True
+        )
+        self._thread.start()
+        log.info(f"Фоновый сборщик запущен, период опроса {self.settings.interval} с")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._lock.release()
+        log.info("Фоновый сборщик остановлен")
+
+    def schedules(self) -> List[ServerSchedule]:
+        with self._state_lock:
+            return [
+                ServerSchedule(**vars(schedule))
+                for schedule in self._schedules.values()
+            ]
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._lock.acquire():
+                    # Записи журнала одного цикла сбора объединены общим идентификатором
+                    with log_context(f"sync-{new_request_id()}"):
+                        self._run_due()
+                prune_winrm_pool()
+            except Exception as e:
+                log.error(f"Ошибка фонового сборщика: {e}")
+            self._stop.wait(self._next_wait())
+
+    def _next_wait(self) -> float:
+        with self._state_lock:
+            next_runs = [schedule.next_run for schedule in self._schedules.values()]
+        if not next_runs or not self._lock.held:
+            return _TICK
+        return min(_TICK, max(0.0, min(next_runs) - time.monotonic()))
+
+    def _run_due(self) -> None:
+        connection = load_connection_settings()
+        now = time.monotonic()
+        with self._state_lock:
+            for server in connection.servers:
+                self._schedules.setdefault(server, ServerSchedule(server=server))
+            for server in list(self._schedules):
+                if server not in connection.servers:
+                    del self._schedules[server]
+            due = [
+                server
+                for server, schedule in self._schedules.items()
+                if schedule.next_run <= now
+            ]
+        if not due:
+            return
+
+        results = sync_servers(
+            lookback_since(self.settings), connection, get_event_store(), servers=due
+        )
+
+        added = 0
+        with self._state_lock:
+            for server, result in results.items():
+                schedule = self._schedules.get(server)
+                if schedule is None:
+                    continue
+                schedule.last_attempt = datetime.now()
+                if result.ok:
+                    schedule.failures = 0
+                    schedule.last_success = schedule.last_attempt
+                    schedule.last_error = None
+                    added += result.added
+                else:
+                    schedule.failures += 1
+                    schedule.last_error = result.error
+                delay = backoff_delay(self.settings, schedule.failures)
+                schedule.next_run = time.monotonic() + delay
+                schedule.next_run_at = datetime.now() + timedelta(seconds=delay)
+
+        if added:
+            # Импорт здесь: rdp_service сам зависит от настроек планировщика
+            from app.services.rdp_service import refresh_recent_days
+
+            refresh_recent_days()
+            refresh_rollups()
+
+
+_scheduler: Optional[CollectorScheduler] = None
+
+
+def get_scheduler() -> Optional[CollectorScheduler]:
+    return _scheduler
+
+
+def start_scheduler() -> Optional[CollectorScheduler]:
+    global _scheduler
+    settings = load_scheduler_settings()
+    if not settings.enabled or settings.external:
+        return None
+    if _scheduler is None:
+        _scheduler = CollectorScheduler(
+            settings, get_event_store().path + ".scheduler.lock"
+        )
+    _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler() -> None:
+    if _scheduler is not None:
+        _scheduler.stop()
+
+
+def collector_status() -> dict:
+    # Последняя успешная синхронизация берётся из хранилища (общего для всех воркеров),
+    # подробности об ошибках и расписании — из сборщика этого процесса, если он ведущий,
+    # или из аренды серверов, если сбор выполняют отдельные процессы (run_collector.py).
+    settings = load_scheduler_settings()
+    store = get_event_store()
+    stored = {state.server: state for state in store.list_states()}
+    leases = (
+        {lease.server: lease for lease in store.list_leases()}
+        if settings.external
+        else {}
+    )
+    schedules = (
+        {schedule.server: schedule for schedule in _scheduler.schedules()}
+        if _scheduler
+        else {}
+    )
+    try:
+        servers = load_connection_settings().servers
+    except Exception:
+        servers = sorted(stored)
+
+    items = []
+    for server in servers:
+        state = stored.get(server)
+        schedule = schedules.get(server)
+        last_success = None
+        if state is not None and state.last_sync_ms:
+            last_success = datetime.fromtimestamp(state.last_sync_ms / 1000).isoformat(
+                timespec="seconds"
+            )
+        item = {
+            "server": server,
+            "last_success": last_success,
+            "last_attempt": (
+                schedule.last_attempt.isoformat(timespec="seconds")
+                if schedule and schedule.last_attempt
+                else None
+            ),
+            "last_error": schedule.last_error if schedule else None,
+            "consecutive_failures": schedule.failures if schedule else 0,
+            "next_run": (
+                schedule.next_run_at.isoformat(timespec="seconds")
+                if schedule and schedule.next_run_at
+                else None
+            ),
+            "owner": None,
+        }
+        lease = leases.get(server)
+        if lease is not None:
+            item.update(
+                {
+                    "last_error": lease.last_error,
+                    "consecutive_failures": lease.failures,
+                    "next_run": (
+                        datetime.fromtimestamp(lease.next_due_ms / 1000).isoformat(
+                            timespec="seconds"
+                        )
+                        if lease.next_due_ms
+                        else None
+                    ),
+                    "owner": lease.owner,
+                }
+            )
+        items.append(item)
+    return {
+        "enabled": settings.enabled,
+        "external": settings.external,
+        "leader": bool(_scheduler and _scheduler.leader),
+        "interval": settings.interval,
+        "servers": items,
+    }
@@ -0,0 +1,234 @@
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.services.columnar import SessionColumns
+from app.services.event_store import EventStore, get_event_store
+from app.services.events import Event
+from app.services.pairing import (
+    DaySegment,
+    Session,
+    max_open_session,
+    open_session_since,
+    pair_events,
+    split_by_day,
+)
+from app.utils.logger import get_logger
+from app.utils.metrics import observe_stage
+
+log = get_logger(__name__)
+
+# Одновременные обновления сессий в процессе выполняются по очереди
+_refresh_lock = threading.Lock()
+
+
+def _session_row(session: Session) -> tuple:
+    # Строка таблицы sessions
+    return (
+        session.server,
+        session.record_id,
+        session.user,
+        session.username,
+        int(session.start.timestamp()),
+        int(session.end.timestamp()) if session.end is not None else None,
+        session.logout_server,
+    )
+
+
+def _row_session(row: tuple) -> Session:
+    server, record_id, user, username, start_s, end_s, logout_server = row
+    return Session(
+        server,
+        user,
+        username,
+        datetime.fromtimestamp(start_s),
+        datetime.fromtimestamp(end_s) if end_s is not None else None,
+        logout_server,
+        record_id,
+    )
+
+
+def _segment_row(segment: DaySegment) -> tuple:
+    # Строка таблицы session_days
+    session = segment.session
+    return (
+        segment.day.isoformat(),
+        session.username,
+        session.server,
+        session.record_id,
+        session.user,
+        int(segment.start.timestamp()),
+        int(segment.end.timestamp()),
+        session.logout_server,
+        int(segment.continues),
+    )
+
+
+def _row_segment(row: tuple) -> DaySegment:
+    day, username, server, record_id, user, start_s, end_s, logout_server, continues = (
+        row
+    )
+    start, end = datetime.fromtimestamp(start_s), datetime.fromtimestamp(end_s)
+    session = Session(server, user, username, start, end, logout_server, record_id)
+    return DaySegment(date.fromisoformat(day), session, start, end, bool(continues))
+
+
+def _changed_days(session: Session) -> Set[Tuple[str, str, str]]:
+    # (день, логин, сервер) для всех дней сессии; продолжающейся — до текущего момента
+    return {
+        (segment.day.isoformat(), session.username, session.server)
+        for segment in split_by_day(session, until=datetime.now())
+    }
+
+
+def _rebuild(
+    events: Dict[str, List[Event]], old: Dict[str, List[tuple]]
+) -> Tuple[List[tuple], List[tuple], Set[Tuple[str, str, str]], int]:
+    # Сопоставление заново только для идентификаторов сессии с новыми событиями, начиная
+    # с сессии, продолжавшейся к моменту самого раннего из них: вход без выхода
+    # закрывается на месте, когда поступает выход, более ранние сессии не затрагиваются
+    sessions: List[tuple] = []
+    segments: List[tuple] = []
+    changes: Set[Tuple[str, str, str]] = set()
+    changed = 0
+    for user, user_events in events.items():
+        previous_rows = {row[1]: row for row in old.get(user, [])}
+        for session in pair_events(user_events):
+            row = _session_row(session)
+            sessions.append(row)
+            if session.end is not None:
+                segments.extend(
+                    _segment_row(segment)
+                    for segment in split_by_day(session, until=session.end)
+                )
+            previous = previous_rows.pop(session.record_id, None)
+            if previous != row:
+                changed += 1
+                changes |= _changed_days(session)
+                if previous is not None:
+                    changes |= _changed_days(_row_session(previous))
+        for previous in previous_rows.values():
+            changed += 1
+            changes |= _changed_days(_row_session(previous))
+    return sessions, segments, changes, changed
+
+
+def _check_open_session_limit(store: EventStore) -> None:
+    # Части сессий без выхода в хранилище рассчитаны с ограничением
+    # RDP_MAX_OPEN_SESSION_HOURS; если оно изменилось (или хранилище рассчитано без
+    # него), сессии сопоставляются заново
+    limit = max_open_session()
+    limit_s = int(limit.total_seconds()) if limit is not None else 0
+    if store.get_meta("open_session_limit_s", -1) != limit_s:
+        log.info(
+            "Ограничение сессий без выхода изменилось, сессии сопоставляются заново"
+        )
+        store.rebuild_sessions()
+        store.set_meta("open_session_limit_s", limit_s)
+
+
+def refresh_sessions(
+    store: Optional[EventStore] = None, servers: Optional[List[str]] = None
+) -> int:
+    # Обновляет таблицу сессий по событиям, загруженным после прошлого обновления
+    # (только серверы servers, если заданы). Возвращает число изменившихся сессий.
+    store = store or get_event_store()
+    changed = 0
+    with _refresh_lock:
+        _check_open_session_limit(store)
+        dirty = [
+            server
+            for server in store.dirty_servers()
+            if servers is None or server in servers
+        ]
+        if not dirty:
+            return 0
+        with observe_stage("sessions"):
+            for server in dirty:
+                changed += store.update_sessions(server, _rebuild)
+    if changed:
+        log.info("Сессии: обновлено %d по серверам %s", changed, dirty)
+    return changed
+
+
+def open_segments(
+    store: EventStore,
+    first: date,
+    last: date,
+    servers: List[str],
+    until: Optional[datetime] = None,
+) -> Iterator[DaySegment]:
+    # Части продолжающихся сессий за дни first..last, считая до until (по умолчанию —
+    # текущего момента)
+    until = until or datetime.now().replace(microsecond=0)
+    before = datetime.combine(last + timedelta(days=1), time.min)
+    since = open_session_since(first)
+    for row in store.open_sessions(
+        servers, int(before.timestamp()), int(since.timestamp())
+    ):
+        for segment in split_by_day(_row_session(row), until=until):
+            if first <= segment.day <= last:
+                yield segment
+
+
+def day_segments(
+    first: date, last: date, servers: List[str], store: Optional[EventStore] = None
+) -> Dict[str, Dict[str, List[DaySegment]]]:
+    # Части сессий за дни first..last: день -> логин -> части в порядке входа.
+    # Завершившиеся сессии читаются из таблицы, продолжающиеся считаются до текущего
+    # момента, поэтому время ответа зависит от размера отчёта, а не от числа событий.
+    store = store or get_event_store()
+    grouped: Dict[str, Dict[str, List[DaySegment]]] = {}
+    for row in store.session_segments(first.isoformat(), last.isoformat(), servers):
+        segment = _row_segment(row)
+        grouped.setdefault(row[0], {}).setdefault(segment.session.username, []).append(
+            segment
+        )
+    for segment in open_segments(store, first, last, servers):
+        user_segments = grouped.setdefault(segment.day.isoformat(), {}).setdefault(
+            segment.session.username, []
+        )
+        user_segments.append(segment)
+        user_segments.sort(key=lambda x: x.start)
+    return grouped
+
+
+def segment_columns(
+    first: date, last: date, servers: List[str], store: Optional[EventStore] = None
+) -> SessionColumns:
+    # Части сессий за дни first..last в столбцах для векторного подсчёта (columnar,
+    # concurrency). Берутся те же данные, что и для отчёта, поэтому итоги и
+    # одновременные сессии не зависят от запрошенного периода; у каждой части есть
+    # окончание (end_s >= 0).
+    store = store or get_event_store()
+    server_codes: Dict[str, int] = {}
+    username_codes: Dict[str, int] = {}
+    start_s, end_s, server, username = [], [], [], []
+
+    def add(segment_server: str, segment_username: str, start: int, end: int) -> None:
+        start_s.append(start)
+        end_s.append(end)
+        server.append(server_codes.setdefault(segment_server, len(server_codes)))
+        username.append(
+            username_codes.setdefault(segment_username, len(username_codes))
+        )
+
+    for row in store.session_segments(first.isoformat(), last.isoformat(), servers):
+        add(row[2], row[1], row[5], row[6])
+    for segment in open_segments(store, first, last, servers):
+        add(
+            segment.session.server,
+            segment.session.username,
+            int(segment.start.timestamp()),
+            int(segment.end.timestamp()),
+        )
+    return SessionColumns(
+        start_s=np.array(start_s, dtype=np.int64),
+        end_s=np.array(end_s, dtype=np.int64),
+        server=np.array(server, dtype=np.int32),
+        username=np.array(username, dtype=np.int32),
+        servers=list(server_codes),
+        usernames=list(username_codes),
+    )
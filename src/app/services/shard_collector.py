@@ -0,0 +1,259 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from app.services.collector import load_connection_settings
+from app.services.event_store import EventStore, ServerLease, get_event_store
+from app.services.rollups import refresh_rollups
+from app.services.scheduler import (
+    SchedulerSettings,
+    backoff_delay,
+    load_scheduler_settings,
+    lookback_since,
+)
+from app.services.sessions import refresh_sessions
+from app.services.sync import sync_servers
+from app.services.winrm_pool import close_winrm_pool, prune_winrm_pool
+from app.utils.logger import get_logger, log_context, new_request_id
+
+log = get_logger(__name__)
+
+DEFAULT_LEASE_TTL = 120
+# Как часто процесс ищет серверы, которые пора собирать, секунды
+_TICK = 2.0
+
+
+@dataclass
+class ShardSettings:
+    processes: int = 2  # процессов-сборщиков на этой машине (контейнере)
+    lease_ttl: int = (
+        DEFAULT_LEASE_TTL  # аренда сервера без продления истекает через столько секунд
+    )
+    batch: int = (
+        0  # серверов в аренде у одного процесса одновременно; 0 — RDP_MAX_WORKERS
+    )
+
+
+def load_shard_settings() -> ShardSettings:
+    load_dotenv()
+    return ShardSettings(
+        processes=max(1, int(os.getenv("RDP_SHARD_PROCESSES", os.cpu_count() or 2))),
+        lease_ttl=max(5, int(os.getenv("RDP_SHARD_LEASE_TTL", DEFAULT_LEASE_TTL))),
+        batch=int(os.getenv("RDP_SHARD_BATCH", 0)),
+    )
+
+
+class ShardWorker:
+    # Процесс-сборщик: берёт в аренду серверы, которые пора собирать, синхронизирует их
+    # в общее хранилище (как фоновый сборщик) и освобождает с временем следующего сбора.
+    # Пока идёт сбор, аренда продлевается; если процесс завершится аварийно, аренда
+    # истечёт и серверы возьмёт другой процесс. Несколько машин (контейнеров) с общим
+    # хранилищем делят серверы так же, как процессы одной машины.
+
+    def __init__(
+        self,
+        owner: str,
+        scheduler: SchedulerSettings,
+        shard: ShardSettings,
+        store: Optional[EventStore] = None,
+    ):
+        self.owner = owner
+        self.scheduler = scheduler
+        self.shard = shard
+        self.store = store or get_event_store()
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self, cycle_start_ms: Optional[int] = None) -> None:
+        # cycle_start_ms задан — один цикл: процесс завершается, когда все серверы
+        # собраны (или опрошены с ошибкой) после этого момента
+        log.info(f"Сборщик {self.owner} запущен")
+        while not self._stop.is_set():
+            connection = load_connection_settings()
+            batch = self.shard.batch or connection.max_workers
+            now_ms = int(time.time() * 1000)
+            leases = self.store.claim_servers(
+                self.owner,
+                connection.servers,
+                batch,
+                self.shard.lease_ttl * 1000,
+                now_ms,
+            )
+            if leases:
+                with log_context(f"shard-{new_request_id()}"):
+                    self._collect(leases, connection)
+                continue
+            if cycle_start_ms is not None and self._cycle_done(
+                connection.servers, cycle_start_ms
+            ):
+                break
+            prune_winrm_pool()
+            self._stop.wait(_TICK)
+        close_winrm_pool()
+        log.info(f"Сборщик {self.owner} остановлен")
+
+    def _cycle_done(self, servers: List[str], cycle_start_ms: int) -> bool:
+        return all(
+            lease.next_due_ms > cycle_start_ms and lease.owner is None
+            for lease in self.store.list_leases(servers)
+        )
+
+    def _collect(self, leases: List[ServerLease], connection) -> None:
+        servers = [lease.server for lease in leases]
+        failures = {lease.server: lease.failures for lease in leases}
+        log.info(f"Сборщик {self.owner}: серверы {servers}")
+        renewing = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._renew, args=(servers, renewing), daemon=True
+        )
+        heartbeat.start()
+        try:
+            results = sync_servers(
+                lookback_since(self.scheduler), connection, self.store, servers=servers
+            )
+        finally:
+            renewing.set()
+            heartbeat.join()
+
+        for server, result in results.items():
+            failed = 0 if result.ok else failures[server] + 1
+            next_due_ms = int(
+                (time.time() + backoff_delay(self.scheduler, failed)) * 1000
+            )
+            if not self.store.release_server(
+                self.owner, server, next_due_ms, None if result.ok else result.error
+            ):
+                log.warning(
+                    f"Сборщик {self.owner}: аренда сервера {server} "
+                    "истекла до окончания сбора"
+                )
+        # Сессии собранных серверов обновляются здесь же,
+        # чтобы API не делал этого при запросе
+        try:
+            refresh_sessions(self.store, servers)
+        except Exception as e:
+            log.error(f"Сборщик {self.owner}: ошибка обновления сессий: {e}")
+
+    def _renew(self, servers: List[str], done: threading.Event) -> None:
+        # Продление аренды на время сбора (сбор окнами может длиться дольше lease_ttl)
+        interval = self.shard.lease_ttl / 3
+        while not done.wait(interval):
+            try:
+                self.store.renew_leases(
+                    self.owner,
+                    servers,
+                    int((time.time() + self.shard.lease_ttl) * 1000),
+                )
+            except Exception as e:
+                log.error(f"Сборщик {self.owner}: не удалось продлить аренду: {e}")
+
+
+def worker_owner(index: int) -> str:
+    # Владелец аренды уникален для машины (контейнера) и процесса
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def _worker_main(index: int, cycle_start_ms: Optional[int]) -> None:
+    worker = ShardWorker(
+        worker_owner(index), load_scheduler_settings(), load_shard_settings()
+    )
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run(cycle_start_ms)
+
+
+def run_sharded_collector(processes: Optional[int] = None, once: bool = False) -> int:
+    # Запускает processes процессов-сборщиков и следит за ними: процесс, завершившийся
+    # аварийно, перезапускается (его серверы тем временем, по истечении аренды,
+    # собирают остальные). Периодически пересчитывает агрегаты по собранным событиям.
+    # once — один цикл: каждый сервер собирается один раз, затем процессы завершаются.
+    # Возвращает число аварийных завершений процессов.
+    settings = load_shard_settings()
+    scheduler = load_scheduler_settings()
+    processes = processes or settings.processes
+    store = get_event_store()
+    servers = load_connection_settings().servers
+    cycle_start_ms = int(time.time() * 1000) if once else None
+    store.register_servers(servers, due_ms=cycle_start_ms)
+
+    context = multiprocessing.get_context("spawn")
+    workers: Dict[int, multiprocessing.Process] = {}
+    crashes = 0
+    stopping = threading.Event()
+
+    def start(index: int) -> None:
+        process = context.Process(
+            target=_worker_main, args=(index, cycle_start_ms), name=f"rdp-shard-{index}"
+        )
+        process.start()
+        workers[index] = process
+
+    def stop(*_) -> None:
+        stopping.set()
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    log.info(
+        f"Сборщик: {processes} процессов, {len(servers)} серверов, "
+        f"аренда {settings.lease_ttl} с"
+    )
+    for index in range(processes):
+        start(index)
+
+    last_rollups = time.monotonic()
+    while workers:
+        stopping.wait(_TICK)
+        for index, process in list(workers.items()):
+            if process.is_alive():
+                continue
+            del workers[index]
+            if process.exitcode != 0 and not stopping.is_set():
+                crashes += 1
+                log.warning(
+                    f"Процесс сборщика {process.name} завершился "
+                    f"с кодом {process.exitcode}, перезапуск"
+                )
+                start(index)
+        if time.monotonic() - last_rollups >= scheduler.interval or not workers:
+            try:
+                refresh_rollups()
+            except Exception as e:
+                log.error(f"Ошибка пересчёта агрегатов: {e}")
+            last_rollups = time.monotonic()
+    return crashes
+
+
+def shard_status() -> List[dict]:
+    # Аренда серверов: кто собирает сервер сейчас, сколько раз он собран
+    # и когда следующий сбор
+    def iso(ms: int) -> Optional[str]:
+        return (
+            time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ms / 1000))
+            if ms
+            else None
+        )
+
+    return [
+        {
+            "server": lease.server,
+            "owner": lease.owner,
+            "lease_expires": iso(lease.expires_ms) if lease.owner else None,
+            "next_run": iso(lease.next_due_ms),
+            "cycles": lease.cycles,
+            "consecutive_failures": lease.failures,
+            "last_owner": lease.last_owner,
+            "last_error": lease.last_error,
+        }
+        for lease in get_event_store().list_leases()
+    ]
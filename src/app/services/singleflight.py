@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class SingleFlight:
+    # Объединение одинаковых одновременных запросов: пока вычисление по ключу
+    # выполняется, новые вызовы с тем же ключом ждут его результат (или исключение),
+    # а не запускают своё. Работает в пределах одного event loop.
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            log.info("Запрос %s уже выполняется, ожидаем его результат", key)
+            # shield: отмена одного ожидающего клиента не отменяет общее вычисление
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not future.cancelled():
+            # Помечаем исключение как полученное, даже если все ожидающие уже отменены
+            future.exception()
+
+    def __len__(self) -> int:
+        return len(self._inflight)
@@ -0,0 +1,363 @@
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.collector import (
+    ConnectionSettings,
+    load_connection_settings,
+    run_parallel,
+    stream_ps_on_server,
+)
+from app.services.event_store import EventStore, get_event_store
+from app.services.health import ServerUnavailable, get_server_health
+from app.services.events import Event, iter_events_output
+from app.services.ps_commands import build_events_command
+from app.utils.logger import get_logger
+from app.utils.metrics import (
+    COLLECTION_ERRORS_TOTAL,
+    EVENTS_COLLECTED_TOTAL,
+    STAGE_SECONDS,
+    classify_error,
+)
+
+log = get_logger(__name__)
+
+# Сколько событий накапливается перед записью в хранилище
+BATCH_SIZE = 5000
+
+# Окно периода: (начало, конец) в мс epoch; конец None — до текущего момента
+Window = Tuple[int, Optional[int]]
+
+
+@dataclass
+class SyncFailure:
+    # Период, который не удалось загрузить с сервера
+    server: str
+    start_ms: int
+    end_ms: int
+    error: str
+
+    def as_dict(self) -> dict:
+        return {
+            "server": self.server,
+            "start": datetime.fromtimestamp(self.start_ms / 1000).isoformat(
+                timespec="seconds"
+            ),
+            "end": datetime.fromtimestamp(self.end_ms / 1000).isoformat(
+                timespec="seconds"
+            ),
+            "error": self.error,
+        }
+
+
+@dataclass
+class SyncResult:
+    server: str
+    ok: bool
+    added: int = 0
+    error: Optional[str] = None
+    failures: List[SyncFailure] = field(default_factory=list)
+
+
+def _fetch_into_store(
+    server: str, script: str, settings: ConnectionSettings, store: EventStore
+) -> Tuple[int, Optional[int]]:
+    # Вывод сервера разбирается потоково и пачками пишется в хранилище,
+    # поэтому расход памяти не зависит от размера периода.
+    # Возвращает (число новых событий, максимальный полученный RecordId).
+    # Время разбора — общее время цикла за вычетом ожидания сети и записи в хранилище.
+    added, max_record_id, received = 0, None, 0
+    waiting = [0.0, 0.0]  # [сеть, хранилище]
+
+    def timed_chunks() -> Iterator[bytes]:
+        chunks = stream_ps_on_server(server, script, settings)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            waiting[0] += time.perf_counter() - started
+            if chunk is None:
+                return
+            yield chunk
+
+    def flush(events: List[Event]) -> int:
+        started = time.perf_counter()
+        count = store.add_events(events)
+        waiting[1] += time.perf_counter() - started
+        return count
+
+    loop_started = time.perf_counter()
+    batch: List[Event] = []
+    for event in iter_events_output(timed_chunks(), server):
+        batch.append(event)
+        received += 1
+        if max_record_id is None or event.record_id > max_record_id:
+            max_record_id = event.record_id
+        if len(batch) >= BATCH_SIZE:
+            added += flush(batch)
+            batch = []
+    added += flush(batch)
+    STAGE_SECONDS.labels("parse").observe(
+        max(0.0, time.perf_counter() - loop_started - sum(waiting))
+    )
+    EVENTS_COLLECTED_TOTAL.labels(server).inc(received)
+    return added, max_record_id
+
+
+def _split_windows(
+    start_ms: int, end_ms: Optional[int], window_days: int
+) -> List[Window]:
+    # Делит период на окна по границам сетки из window_days дней (локальная полночь),
+    # одинаковой для всех запросов, — так окна разных запросов совпадают.
+    # end_ms=None — последнее окно не ограничено справа (до текущего момента).
+    windows: List[Window] = []
+    current = start_ms
+    while True:
+        day = date.fromtimestamp(current / 1000)
+        boundary_day = day + timedelta(days=window_days - day.toordinal() % window_days)
+        boundary = int(
+            datetime.combine(boundary_day, datetime.min.time()).timestamp() * 1000
+        )
+        if end_ms is None and boundary > time.time() * 1000:
+            windows.append((current, None))
+            return windows
+        if end_ms is not None and boundary >= end_ms:
+            windows.append((current, end_ms))
+            return windows
+        windows.append((current, boundary))
+        current = boundary
+
+
+def _fetch_window(
+    server: str, window: Window, settings: ConnectionSettings, store: EventStore
+) -> Tuple[int, Optional[int]]:
+    # Загрузка одного окна с повторами; окно без правой границы запрашивается до
+    # текущего момента
+    start_ms, end_ms = window
+    script = build_events_command(
+        start=datetime.fromtimestamp(start_ms / 1000),
+        end=datetime.fromtimestamp(end_ms / 1000) if end_ms is not None else None,
+        wire_format=settings.wire_format,
+    )
+    # Пропущенный автоматом защиты сервер не повторяется: остальные окна тоже
+    # пропускаются сразу, и мёртвый сервер не задерживает отчёт на все повторы всех окон
+    for attempt in range(settings.sync_window_retries + 1):
+        try:
+            return _fetch_into_store(server, script, settings, store)
+        except Exception as e:
+            COLLECTION_ERRORS_TOTAL.labels(server, classify_error(e)).inc()
+            if (
+                attempt == settings.sync_window_retries
+                or isinstance(e, ServerUnavailable)
+                or get_server_health().is_open(server)
+            ):
+                raise
+            log.warning(
+                "Сервер %s: ошибка загрузки окна %s, повтор: %s",
+                server,
+                _window_text(window),
+                e,
+                extra={"server": server},
+            )
+            time.sleep(min(2**attempt, 10))
+
+
+def _window_text(window: Window) -> str:
+    start_ms, end_ms = window
+    end = datetime.fromtimestamp(end_ms / 1000) if end_ms is not None else "..."
+    return f"{datetime.fromtimestamp(start_ms / 1000)} - {end}"
+
+
+def _fetch_windows(
+    server: str,
+    start_ms: int,
+    end_ms: Optional[int],
+    settings: ConnectionSettings,
+    store: EventStore,
+    result: SyncResult,
+) -> Tuple[Optional[int], Optional[int]]:
+    # Загружает период [start_ms; end_ms] окнами: параллельно не больше sync_per_server
+    # окон сервера, каждое со своими повторами. Окна, загруженные ранее, пропускаются;
+    # загруженные сейчас запоминаются в хранилище. Ошибки окон добавляются в result.
+    # Возвращает (начало непрерывно загруженного участка, примыкающего к концу периода,
+    # или None, если последнее окно не загружено; максимальный полученный RecordId).
+    windows = _split_windows(start_ms, end_ms, settings.sync_window_days)
+    fetched = store.fetched_windows(server)
+    todo = [
+        window
+        for window in windows
+        if window[1] is None
+        or not any(a <= window[0] and window[1] <= b for a, b in fetched)
+    ]
+
+    def fetch(window: Window):
+        started_ms = int(time.time() * 1000)
+        try:
+            added, max_record_id = _fetch_window(server, window, settings, store)
+        except Exception as e:
+            return e
+        store.add_fetched_window(
+            server, window[0], window[1] if window[1] is not None else started_ms
+        )
+        return added, max_record_id
+
+    outcomes = run_parallel(fetch, todo, settings.sync_per_server)
+    max_record_id = None
+    skipped = 0
+    for window, outcome in outcomes.items():
+        if isinstance(outcome, Exception):
+            if isinstance(outcome, ServerUnavailable):
+                skipped += 1
+            else:
+                log.error(
+                    "Сервер %s: не удалось загрузить окно %s: %s",
+                    server,
+                    _window_text(window),
+                    outcome,
+                    extra={"server": server},
+                )
+            result.failures.append(
+                SyncFailure(
+                    server,
+                    window[0],
+                    window[1] or int(time.time() * 1000),
+                    str(outcome),
+                )
+            )
+            continue
+        result.added += outcome[0]
+        if outcome[1] is not None and (
+            max_record_id is None or outcome[1] > max_record_id
+        ):
+            max_record_id = outcome[1]
+    if skipped:
+        log.warning(
+            "Сервер %s пропущен после ошибок подряд, не загружено окон: %d",
+            server,
+            skipped,
+            extra={"server": server},
+        )
+
+    covered_from = None
+    for window in reversed(windows):
+        if isinstance(outcomes.get(window), Exception):
+            break
+        covered_from = window[0]
+    return covered_from, max_record_id
+
+
+def sync_server(
+    server: str,
+    since: datetime,
+    settings: ConnectionSettings,
+    store: EventStore,
+    backfill_only: bool = False,
+) -> SyncResult:
+    # Догружает в хранилище события сервера, начиная с момента since.
+    # Новые события запрашиваются по RecordId больше сохранённого (watermark),
+    # а период до covered_from, если он ещё не загружен, — по времени, окнами
+    # (см. _fetch_windows). Если часть окон загрузить не удалось, загруженные
+    # сохраняются, а ошибки возвращаются в SyncResult.failures.
+    # backfill_only: сервер опрашивается, только если период с since ещё не загружен
+    # (новые события в этом режиме догружает фоновый сборщик).
+    state = store.get_state(server)
+    since_ms = int(since.timestamp() * 1000)
+    if (
+        backfill_only
+        and state.last_record_id is not None
+        and state.covered_from_ms is not None
+        and state.covered_from_ms <= since_ms
+    ):
+        return SyncResult(server=server, ok=True)
+
+    result = SyncResult(server=server, ok=True)
+    if state.last_record_id is None:
+        # Первая синхронизация: весь журнал, начиная с since (или с ранее покрытой
+        # даты); watermark известен, только если загружено последнее, открытое справа
+        # окно
+        start_ms = min(since_ms, state.covered_from_ms or since_ms)
+        covered_from, max_record_id = _fetch_windows(
+            server, start_ms, None, settings, store, result
+        )
+        if covered_from is not None:
+            state.last_record_id = max_record_id
+            state.covered_from_ms = covered_from
+            state.last_sync_ms = int(time.time() * 1000)
+    else:
+        try:
+            script = build_events_command(
+                after_record_id=state.last_record_id, wire_format=settings.wire_format
+            )
+            added, max_record_id = _fetch_into_store(server, script, settings, store)
+        except Exception as e:
+            COLLECTION_ERRORS_TOTAL.labels(server, classify_error(e)).inc()
+            log.error(
+                "Ошибка синхронизации сервера %s: %s",
+                server,
+                e,
+                extra={"server": server},
+            )
+            since_sync = state.last_sync_ms or state.covered_from_ms or since_ms
+            return SyncResult(
+                server=server,
+                ok=False,
+                error=str(e),
+                failures=[
+                    SyncFailure(server, since_sync, int(time.time() * 1000), str(e))
+                ],
+            )
+        result.added += added
+        if max_record_id is not None:
+            state.last_record_id = max(state.last_record_id, max_record_id)
+        state.last_sync_ms = int(time.time() * 1000)
+        if state.covered_from_ms is None or since_ms < state.covered_from_ms:
+            # Дозагрузка более раннего периода, которого ещё нет в хранилище
+            backfill_end = state.covered_from_ms or int(time.time() * 1000)
+            covered_from, _ = _fetch_windows(
+                server, since_ms, backfill_end, settings, store, result
+            )
+            if covered_from is not None:
+                state.covered_from_ms = covered_from
+
+    if state.covered_from_ms is not None:
+        store.prune_fetched_windows(server, state.covered_from_ms)
+    store.save_state(state)
+    if result.failures:
+        result.ok = False
+        result.error = f"не загружено окон: {len(result.failures)}"
+        log.warning(
+            "Сервер %s: сохранено %d новых событий, %s",
+            server,
+            result.added,
+            result.error,
+            extra={"server": server, "added": result.added},
+        )
+    else:
+        log.info(
+            "Сервер %s: сохранено %d новых событий",
+            server,
+            result.added,
+            extra={"server": server, "added": result.added},
+        )
+    return result
+
+
+def sync_servers(
+    since: datetime,
+    settings: Optional[ConnectionSettings] = None,
+    store: Optional[EventStore] = None,
+    backfill_only: bool = False,
+    servers: Optional[List[str]] = None,
+) -> Dict[str, SyncResult]:
+    # Параллельная инкрементальная синхронизация всех серверов
+    if settings is None:
+        settings = load_connection_settings()
+    if store is None:
+        store = get_event_store()
+    if servers is None:
+        servers = settings.servers
+    return run_parallel(
+        lambda server: sync_server(server, since, settings, store, backfill_only),
+        servers,
+        settings.max_workers,
+    )
@@ -0,0 +1,234 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Iterator, List, Optional
+
+import winrm
+from app.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_POOL_IDLE_TIMEOUT = 120
+# Запас к времени простоя: сервер не должен закрыть оболочку раньше, чем это сделает пул
+_SHELL_IDLE_MARGIN = 60
+
+
+@dataclass
+class PooledConnection:
+    # Авторизованное подключение к серверу: сессия requests внутри pywinrm держит
+    # TCP-соединение с пройденной аутентификацией NTLM, оболочка WS-Man
+    # открывается при первой команде и используется всеми следующими.
+    server: str
+    session: winrm.Session
+    fingerprint: Hashable
+    shell_id: Optional[str] = None
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+    def shell(self, idle_timeout: int) -> str:
+        if self.shell_id is None:
+            self.shell_id = self.session.protocol.open_shell(
+                idle_timeout=f"PT{idle_timeout + _SHELL_IDLE_MARGIN}S"
+            )
+        return self.shell_id
+
+    def close(self) -> None:
+        protocol = self.session.protocol
+        if self.shell_id is not None:
+            try:
+                protocol.close_shell(self.shell_id, close_session=False)
+            except Exception as e:
+                log.debug(f"Не удалось закрыть оболочку на сервере {self.server}: {e}")
+            self.shell_id = None
+        try:
+            protocol.transport.close_session()
+        except Exception:
+            pass
+
+
+@dataclass
+class PoolStats:
+    server: str
+    idle: int = 0
+    in_use: int = 0
+    created: int = 0
+    reused: int = 0
+    discarded: int = 0
+    waits: int = 0
+
+
+class WinRMPool:
+    # Пул подключений WinRM по серверам. Не больше max_per_server подключений к
+    # одному серверу одновременно; остальные запросы ждут освобождения.
+    # Подключение, простаивавшее дольше idle_timeout, созданное с другими
+    # параметрами или завершившееся ошибкой, закрывается и создаётся заново.
+
+    def __init__(
+        self,
+        max_per_server: int = DEFAULT_POOL_SIZE,
+        idle_timeout: int = DEFAULT_POOL_IDLE_TIMEOUT,
+    ):
+        self.max_per_server = max(1, max_per_server)
+        self.idle_timeout = idle_timeout
+        self._idle: Dict[str, List[PooledConnection]] = {}
+        self._stats: Dict[str, PoolStats] = {}
+        self._cond = threading.Condition()
+
+    def _stats_for(self, server: str) -> PoolStats:
+        return self._stats.setdefault(server, PoolStats(server=server))
+
+    def _take(
+        self, server: str, fingerprint: Hashable, stale: List[PooledConnection]
+    ) -> Optional[PooledConnection]:
+        # Под блокировкой: свежее свободное подключение или None; устаревшие — в stale
+        stats = self._stats_for(server)
+        idle = self._idle.get(server, [])
+        now = time.monotonic()
+        while idle:
+            conn = idle.pop()
+            stats.idle -= 1
+            if (
+                conn.fingerprint != fingerprint
+                or now - conn.last_used > self.idle_timeout
+            ):
+                stats.discarded += 1
+                stale.append(conn)
+                continue
+            stats.in_use += 1
+            stats.reused += 1
+            return conn
+        return None
+
+    @contextmanager
+    def acquire(
+        self,
+        server: str,
+        fingerprint: Hashable,
+        factory: Callable[[], winrm.Session],
+        timeout: float,
+    ) -> Iterator[PooledConnection]:
+        # Выдаёт подключение на время блока with. Если блок завершился исключением,
+        # подключение считается испорченным и не возвращается в пул.
+        stale: List[PooledConnection] = []
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            stats = self._stats_for(server)
+            while True:
+                conn = self._take(server, fingerprint, stale)
+                if conn is not None:
+                    break
+                if stats.in_use < self.max_per_server:
+                    stats.in_use += 1
+                    stats.created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"нет свободного подключения к серверу {server} в пуле"
+                    )
+                stats.waits += 1
+                self._cond.wait(remaining)
+        for old in stale:
+            old.close()
+
+        if conn is None:
+            try:
+                conn = PooledConnection(
+                    server=server, session=factory(), fingerprint=fingerprint
+                )
+            except BaseException:
+                self._release(server, None)
+                raise
+        try:
+            yield conn
+        except BaseException:
+            self._release(server, None)
+            conn.close()
+            raise
+        conn.uses += 1
+        conn.last_used = time.monotonic()
+        self._release(server, conn)
+
+    def _release(self, server: str, conn: Optional[PooledConnection]) -> None:
+        with self._cond:
+            stats = self._stats_for(server)
+            stats.in_use -= 1
+            if conn is None:
+                stats.discarded += 1
+            else:
+                self._idle.setdefault(server, []).append(conn)
+                stats.idle += 1
+            self._cond.notify()
+
+    def prune(self) -> int:
+        # Закрывает подключения, простаивающие дольше idle_timeout
+        stale: List[PooledConnection] = []
+        now = time.monotonic()
+        with self._cond:
+            for server, idle in self._idle.items():
+                fresh = [
+                    conn for conn in idle if now - conn.last_used <= self.idle_timeout
+                ]
+                stale.extend(
+                    conn for conn in idle if now - conn.last_used > self.idle_timeout
+                )
+                stats = self._stats_for(server)
+                stats.discarded += len(idle) - len(fresh)
+                stats.idle = len(fresh)
+                self._idle[server] = fresh
+        for conn in stale:
+            conn.close()
+        return len(stale)
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+            for stats in self._stats.values():
+                stats.idle = 0
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> List[PoolStats]:
+        with self._cond:
+            return [PoolStats(**vars(stats)) for stats in self._stats.values()]
+
+
+_pool: Optional[WinRMPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_winrm_pool(
+    max_per_server: int = DEFAULT_POOL_SIZE,
+    idle_timeout: int = DEFAULT_POOL_IDLE_TIMEOUT,
+) -> WinRMPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WinRMPool(max_per_server, idle_timeout)
+        return _pool
+
+
+def prune_winrm_pool() -> None:
+    if _pool is not None:
+        _pool.prune()
+
+
+def close_winrm_pool() -> None:
+    if _pool is not None:
+        _pool.close_all()
+
+
+def winrm_pool_status() -> dict:
+    # Статистика пула этого процесса (при нескольких воркерах uvicorn у каждого свой
+    # пул)
+    if _pool is None:
+        return {"max_per_server": 0, "idle_timeout": 0, "servers": []}
+    return {
+        "max_per_server": _pool.max_per_server,
+        "idle_timeout": _pool.idle_timeout,
+        "servers": [vars(stats) for stats in _pool.stats()],
+    }
@@ -0,0 +1,24 @@
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    # Ответ из уже проверенных данных сервиса: FastAPI не валидирует его по
+    # response_model повторно, а сериализация идёт через orjson, если он установлен.
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
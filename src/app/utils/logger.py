@@ -1,21 +1,333 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import re
 import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from dotenv import load_dotenv
 
 LOG_FORMAT = (
-    "%(asctime)s | %(levelname)s | %(name)s | %(filename)s:%(lineno)d | %(message)s"
+    "%(asctime)s | %(levelname)s | %(name)s | %(request_id)s | "
+    "%(filename)s:%(lineno)d | %(message)s"
 )
 
+# Настройки журнала (.env):
+#   RDP_LOG_LEVEL            уровень, по умолчанию INFO
+#   RDP_LOG_FORMAT           text — строки LOG_FORMAT, json — одна JSON-запись на строку
+#   RDP_LOG_ASYNC            1 — вывод в отдельном потоке через очередь,
+#                            0 — сразу в stdout
+#   RDP_LOG_QUEUE_SIZE       размер очереди; при переполнении записи отбрасываются,
+#                            а не задерживают запрос
+#   RDP_LOG_SERVER_INTERVAL  сообщения INFO о сервере из одного места кода — не чаще
+#                            раза в столько секунд
+load_dotenv()
+LOG_LEVEL = os.getenv("RDP_LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("RDP_LOG_FORMAT", "text").lower() == "json"
+LOG_ASYNC = os.getenv("RDP_LOG_ASYNC", "1") != "0"
+LOG_QUEUE_SIZE = int(os.getenv("RDP_LOG_QUEUE_SIZE", 10000))
+LOG_SERVER_INTERVAL = float(os.getenv("RDP_LOG_SERVER_INTERVAL", 10))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+# Идентификатор запроса (или цикла сборщика) и длительности его этапов, секунды.
+# Потоки пула run_parallel получают копию контекста вызывающего, поэтому записи
+# опроса серверов несут тот же идентификатор, а этапы суммируются в тот же словарь.
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "rdp_request_id", default=None
+)
+_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "rdp_stages", default=None
+)
+_stages_lock = threading.Lock()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextmanager
+def log_context(request_id: Optional[str] = None) -> Iterator[str]:
+    # Область с собственным идентификатором запроса и учётом длительностей этапов
+    request_id = request_id or new_request_id()
+    id_token = _request_id.set(request_id)
+    stages_token = _stages.set({})
+    try:
+        yield request_id
+    finally:
+        _stages.reset(stages_token)
+        _request_id.reset(id_token)
+
+
+def add_stage_duration(stage: str, seconds: float) -> None:
+    # Вызывается из observe_stage: длительность этапа попадает в итоговую запись запроса
+    stages = _stages.get()
+    if stages is not None:
+        with _stages_lock:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def stage_durations_ms() -> Dict[str, float]:
+    stages = _stages.get() or {}
+    with _stages_lock:
+        return {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()}
+
+
+class ContextFilter(logging.Filter):
+    # Добавляет к записи идентификатор текущего запроса (выполняется в потоке, сделавшем
+    # запись)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        return True
+
+
+class ServerRateLimitFilter(logging.Filter):
+    # Сообщения о сервере (extra={"server": ...}) уровня INFO и ниже из одного места
+    # кода пропускаются не чаще раза в interval секунд для каждого сервера; число
+    # отброшенных с прошлого раза добавляется к следующей записи полем suppressed.
+    # Предупреждения и ошибки не ограничиваются.
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._last: Dict[Tuple[str, int, str], Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        server = getattr(record, "server", None)
+        if server is None or record.levelno > logging.INFO or self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno, str(server))
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return False
+            self._last[key] = (now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+# Стандартные атрибуты LogRecord; остальные (переданные через extra) выводятся как поля
+# записи
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, object]:
+    return {
+        key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS
+    }
+
+
+class TextFormatter(logging.Formatter):
+    # LOG_FORMAT, поля extra дописываются в конец строки как key=value
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if not fields:
+            return line
+        values = " ".join(
+            (
+                f"{key}={value}"
+                if isinstance(value, str)
+                else f"{key}={json.dumps(value, ensure_ascii=False, default=str)}"
+            )
+            for key, value in fields.items()
+        )
+        return f"{line} | {values}"
+
+
+class JsonFormatter(logging.Formatter):
+    # Одна JSON-запись на строку: время, уровень, логгер, идентификатор запроса,
+    # сообщение и поля extra
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+            "location": f"{record.filename}:{record.lineno}",
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    # Запись только ставится в очередь; форматирование и вывод в stdout выполняет поток
+    # QueueListener. Если вывод не успевает и очередь заполнена, запись отбрасывается,
+    # а при следующей удачной постановке в журнал попадает число отброшенных.
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В потоке вызывающего подставляются только аргументы сообщения и текст
+        # исключения (объекты могут измениться к моменту вывода); формат строки — в
+        # потоке вывода
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._lock_dropped:
+                dropped, self.dropped = self.dropped, 0
+            notice = logging.LogRecord(
+                record.name,
+                logging.WARNING,
+                __file__,
+                0,
+                f"Очередь журнала переполнена, отброшено записей: {dropped}",
+                None,
+                None,
+            )
+            notice.request_id = "-"
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._lock_dropped:
+                    self.dropped += dropped
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # При остановке ждём места в очереди: записи до остановки выводятся все
+        self.queue.put(self._sentinel)
+
+
 # Создаём корневой логгер
 logger = logging.getLogger("rdp_app")
-logger.setLevel(logging.INFO)
+logger.setLevel(LOG_LEVEL)
 
-# Хендлер для вывода в stdout (Docker-friendly)
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(logging.Formatter(LOG_FORMAT))
+# Хендлер для вывода в stdout (Docker-friendly); при RDP_LOG_ASYNC=1 запросы пишут в
+# очередь, а в stdout пишет отдельный поток, так что медленный вывод не задерживает
+# ответы
+stream_handler = logging.StreamHandler(sys.stdout)
+stream_handler.setFormatter(JsonFormatter() if LOG_JSON else TextFormatter(LOG_FORMAT))
+listener: Optional[logging.handlers.QueueListener] = None
+
+if LOG_ASYNC:
+    handler: logging.Handler = NonBlockingQueueHandler(
+        queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+    )
+    listener = _QueueListener(handler.queue, stream_handler)
+    listener.start()
+    # Оставшиеся в очереди записи выводятся при завершении процесса
+    atexit.register(listener.stop)
+else:
+    handler = stream_handler
+handler.addFilter(ContextFilter())
+handler.addFilter(ServerRateLimitFilter(LOG_SERVER_INTERVAL))
 
 # Добавляем хендлер только если его ещё нет
 if not logger.hasHandlers():
     logger.addHandler(handler)
 
 # Функция для получения логгера в других модулях
-get_logger = lambda name=None: logger if name is None else logger.getChild(name) 
\ No newline at end of file
+get_logger = lambda name=None: logger if name is None else logger.getChild(name)
+
+
+def set_log_stream(stream) -> None:
+    # Вывод журнала в другой поток, например в stderr, когда stdout занят данными
+    # скрипта
+    stream_handler.setStream(stream)
+
+
+_http_log = get_logger("http")
+
+
+def _incoming_request_id(scope: dict) -> Optional[str]:
+    header = REQUEST_ID_HEADER.lower().encode()
+    for name, value in scope.get("headers") or []:
+        if name == header:
+            request_id = value.decode("latin-1").strip()
+            return request_id if _REQUEST_ID_RE.match(request_id) else None
+    return None
+
+
+class RequestLogMiddleware:
+    # ASGI-middleware: у каждого HTTP-запроса свой идентификатор (заголовок X-Request-ID
+    # клиента или новый), он есть во всех записях журнала при обработке запроса и
+    # возвращается в ответе. По окончании запроса пишется одна запись с кодом ответа,
+    # длительностью и длительностями этапов (observe_stage) в полях duration_ms и
+    # stages.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = _incoming_request_id(scope) or new_request_id()
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = dict(message)
+                message["headers"] = list(message.get("headers") or []) + [
+                    (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+                ]
+            await send(message)
+
+        with log_context(request_id):
+            try:
+                await self.app(scope, receive, send_with_id)
+            finally:
+                _http_log.info(
+                    "%s %s %s",
+                    scope["method"],
+                    scope["path"],
+                    status,
+                    extra={
+                        "status": status,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                        "stages": stage_durations_ms(),
+                    },
+                )
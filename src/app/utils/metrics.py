@@ -0,0 +1,98 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from app.utils.logger import add_stage_duration
+
+# Метрики Prometheus для сбора статистики. При запуске uvicorn с несколькими
+# воркерами задайте PROMETHEUS_MULTIPROC_DIR — тогда /metrics агрегирует все процессы.
+
+WINRM_ROUNDTRIP_SECONDS = Histogram(
+    "rdp_winrm_roundtrip_seconds",
+    "Время выполнения команды на сервере через WinRM",
+    ["server"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+WINRM_RESPONSE_BYTES = Histogram(
+    "rdp_winrm_response_bytes",
+    "Размер вывода команды, полученного с сервера",
+    ["server"],
+    buckets=(1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8),
+)
+EVENTS_COLLECTED_TOTAL = Counter(
+    "rdp_events_collected_total",
+    "Количество событий, полученных с сервера",
+    ["server"],
+)
+COLLECTION_ERRORS_TOTAL = Counter(
+    "rdp_collection_errors_total",
+    "Ошибки опроса серверов по типам: auth, timeout, exit_code, json, connection, "
+    "skipped (сервер пропущен автоматом защиты)",
+    ["server", "type"],
+)
+STAGE_SECONDS = Histogram(
+    "rdp_stage_seconds",
+    "Длительность этапов построения отчёта: parse, pairing, totals, serialization",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REPORT_CACHE_REQUESTS_TOTAL = Counter(
+    "rdp_report_cache_requests_total",
+    "Обращения к кэшу отчёта по дням (result: hit/miss); доля попаданий — hit / (hit "
+    "+ miss)",
+    ["result"],
+)
+
+
+@contextmanager
+def observe_stage(stage: str) -> Iterator[None]:
+    # Длительность этапа идёт в гистограмму и в поле stages итоговой записи журнала о
+    # запросе
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        add_stage_duration(stage, elapsed)
+
+
+def classify_error(error: BaseException) -> str:
+    # Тип ошибки опроса сервера для метки type
+    from requests.exceptions import Timeout
+    from winrm.exceptions import AuthenticationError, InvalidCredentialsError
+    from app.services.collector import RemoteCommandError
+    from app.services.health import ServerUnavailable
+
+    if isinstance(error, ServerUnavailable):
+        return "skipped"
+    if isinstance(error, (AuthenticationError, InvalidCredentialsError)):
+        return "auth"
+    if isinstance(error, (TimeoutError, Timeout)):
+        return "timeout"
+    if isinstance(error, RemoteCommandError):
+        return "exit_code"
+    if isinstance(error, ValueError):
+        return "json"
+    return "connection"
+
+
+def render_metrics() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
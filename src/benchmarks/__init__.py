@@ -0,0 +1,7 @@
+"""
+Бенчмарки этапов построения отчёта на синтетических журналах событий 21/23.
+
+- generator — генератор событий в формате вывода ConvertTo-Json PowerShell
+- run — замер времени и пиковой памяти по этапам, сохранение результатов в JSON
+- compare — сравнение результатов двух прогонов
+"""
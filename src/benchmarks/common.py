@@ -0,0 +1,49 @@
+"""
+Общие функции бенчмарков: замер этапа, порции вывода WinRM и коммит прогона.
+"""
+
+import gc
+import subprocess
+import time
+import tracemalloc
+from typing import Callable, Iterator, Tuple
+
+# Размер порции, которой вывод поступает от WinRM
+CHUNK_SIZE = 64 * 1024
+
+
+def measure(func: Callable, arg, memory: bool) -> Tuple[object, float, int]:
+    # Время выполнения без трассировки памяти; пик памяти — отдельным прогоном под
+    # tracemalloc
+    gc.collect()
+    started = time.perf_counter()
+    result = func(arg)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = func(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def chunks(payload: bytes) -> Iterator[bytes]:
+    for i in range(0, len(payload), CHUNK_SIZE):
+        yield payload[i : i + CHUNK_SIZE]
+
+
+def git_commit() -> str:
+    # Коммит, на котором выполнен прогон (для сравнения результатов между коммитами)
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return ""
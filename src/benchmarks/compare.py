@@ -0,0 +1,65 @@
+"""
+Сравнение двух файлов результатов benchmarks.run (например, до и после изменения).
+
+Пример:
+    python -m benchmarks.compare base.json new.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+
+def _index(report: dict) -> dict:
+    return {
+        (run["size"], stage["stage"]): stage
+        for run in report["runs"]
+        for stage in run["stages"]
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарка")
+    parser.add_argument("base", help="результаты базовой версии")
+    parser.add_argument("new", help="результаты новой версии")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="допустимое замедление или рост памяти (доля, по умолчанию 0.1)",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(
+        f"База: {base.get('commit', '')[:12]}  Новая версия: "
+        f"{new.get('commit', '')[:12]}"
+    )
+
+    base_index = _index(base)
+    regressions = 0
+    for key, stage in _index(new).items():
+        old = base_index.get(key)
+        if old is None:
+            continue
+        size, name = key
+        time_ratio = stage["seconds"] / old["seconds"] if old["seconds"] else 1.0
+        memory_ratio = (
+            stage["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else 1.0
+        )
+        flag = ""
+        if time_ratio > 1 + args.threshold or memory_ratio > 1 + args.threshold:
+            flag = "  <-- регрессия"
+            regressions += 1
+        print(
+            f"{size:>10} {name:<16} время x{time_ratio:5.2f}  память "
+            f"x{memory_ratio:5.2f}{flag}"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
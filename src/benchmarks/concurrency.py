@@ -0,0 +1,140 @@
+"""
+Замер расчёта одновременных сессий по серверам на многомесячных синтетических журналах.
+
+События загружаются во временное хранилище, сессии сопоставляются так же, как при
+работе API (sessions.refresh_sessions), затем замеряется путь /stats/concurrency:
+чтение частей сессий из хранилища (sessions.segment_columns) и расчёт
+(concurrency.server_concurrency).
+
+Пример:
+    python -m benchmarks.concurrency --days 90 --sizes 100000,1000000 --output conc.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from app.services.concurrency import server_concurrency
+from app.services.event_store import EventStore
+from app.services.events import iter_compact_events
+from app.services.ps_commands import WIRE_COMPACT
+from app.services.sessions import refresh_sessions, segment_columns
+from benchmarks.common import chunks, git_commit, measure
+from benchmarks.generator import GeneratorConfig, generate_ps_payloads
+
+DEFAULT_SIZES = "100000,1000000"
+
+
+def _stage_result(name: str, elapsed: float, peak: int, events: int) -> dict:
+    print(
+        f"  {name:<16} {elapsed:9.3f} с  пик памяти {peak / 2 ** 20:9.1f} МБ",
+        flush=True,
+    )
+    return {
+        "stage": name,
+        "seconds": round(elapsed, 6),
+        "peak_bytes": peak,
+        "events_per_second": round(events / elapsed) if elapsed else None,
+    }
+
+
+def run_size(size: int, config_overrides: dict, memory: bool) -> dict:
+    config = GeneratorConfig.for_size(size, **config_overrides)
+    payloads = generate_ps_payloads(config, WIRE_COMPACT)
+    servers = sorted(payloads)
+    first_day = config.start
+    last_day = config.start + timedelta(days=config.days - 1)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="rdp-bench-") as directory:
+        store = EventStore(os.path.join(directory, "events.sqlite3"))
+        # Подготовка хранилища замеряется только по времени: повторный прогон
+        # под tracemalloc ничего бы не загрузил и не сопоставил
+        started = time.perf_counter()
+        events = sum(
+            store.add_events(iter_compact_events(chunks(payload), server))
+            for server, payload in payloads.items()
+        )
+        results.append(_stage_result("store", time.perf_counter() - started, 0, events))
+        started = time.perf_counter()
+        refresh_sessions(store)
+        results.append(
+            _stage_result("sessions", time.perf_counter() - started, 0, events)
+        )
+
+        stages = [
+            (
+                "segments",
+                lambda _: segment_columns(first_day, last_day, servers, store),
+            ),
+            (
+                "concurrency",
+                lambda columns: server_concurrency(columns, first_day, last_day),
+            ),
+        ]
+        data = None
+        for name, func in stages:
+            data, elapsed, peak = measure(func, data, memory)
+            results.append(_stage_result(name, elapsed, peak, events))
+    return {
+        "size": size,
+        "events": events,
+        "config": {key: str(value) for key, value in vars(config).items()},
+        "stages": results,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк расчёта одновременных сессий по серверам"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="размеры журналов в событиях через запятую "
+        f"(по умолчанию {DEFAULT_SIZES})",
+    )
+    parser.add_argument("--servers", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--reconnect-rate", type=float, default=1.0)
+    parser.add_argument("--missing-logoff-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--no-memory", action="store_true", help="не измерять пиковую память (быстрее)"
+    )
+    parser.add_argument("--output", help="файл для результатов в формате JSON")
+    args = parser.parse_args(argv)
+
+    overrides = {
+        "servers": args.servers,
+        "days": args.days,
+        "reconnect_rate": args.reconnect_rate,
+        "missing_logoff_rate": args.missing_logoff_rate,
+        "seed": args.seed,
+    }
+    runs = []
+    for size in (int(value) for value in args.sizes.split(",") if value.strip()):
+        print(f"Размер {size}:", flush=True)
+        runs.append(run_size(size, overrides, memory=not args.no_memory))
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
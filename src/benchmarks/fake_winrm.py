@@ -0,0 +1,222 @@
+"""
+Имитация серверов WinRM для нагрузочного тестирования без Windows-серверов и сети.
+
+Подключается к приложению переменной окружения
+    RDP_SESSION_FACTORY=benchmarks.fake_winrm:FakeSession
+и отвечает на команды ps_commands (выборка событий по времени и RecordId в формате
+RDP_WIRE_FORMAT, сведения о журнале) синтетическим журналом, свой для каждого сервера
+из RDP_SERVERS.
+Журнал растёт со временем: события позже текущего момента не выдаются.
+
+Параметры (переменные окружения):
+    RDP_FAKE_LATENCY_MS   задержка каждого запроса WS-Man, мс (по умолчанию 20)
+    RDP_FAKE_CONNECT_MS   установка подключения с аутентификацией, мс (по умолчанию 100)
+    RDP_FAKE_USERS        пользователей в журнале сервера — размер ответа
+                          (по умолчанию 50)
+    RDP_FAKE_DAYS         дней в журнале, заканчивая сегодняшним (по умолчанию 30)
+    RDP_FAKE_ERROR_RATE   доля команд, завершающихся ошибкой подключения
+                          (по умолчанию 0)
+    RDP_FAKE_CHUNK_BYTES  размер вывода, отдаваемого за один запрос (по умолчанию 64 КБ)
+"""
+
+import bisect
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from base64 import b64decode
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.services.ps_commands import LOG_NAME
+from benchmarks.generator import (
+    GeneratorConfig,
+    RawEvent,
+    encode_compact,
+    encode_ps_json,
+    generate_server_events,
+)
+
+_START_RE = re.compile(r"\$start = \[datetime\]::ParseExact\('([^']+)'")
+_END_RE = re.compile(r"\$end = \[datetime\]::ParseExact\('([^']+)'")
+_AFTER_RE = re.compile(r"EventRecordID>(\d+)")
+_DAYS_RE = re.compile(r"'(\d+)' = \(Count-Events")
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+class FakeLog:
+    # Журнал событий одного сервера: события в порядке времени, RecordId = номер + 1
+
+    def __init__(self, server: str, users: int, days: int):
+        config = GeneratorConfig(
+            users=users,
+            servers=1,
+            days=days,
+            start=date.today() - timedelta(days=days - 1),
+            seed=zlib.crc32(server.encode()),
+        )
+        self.events: List[RawEvent] = sorted(
+            event
+            for _, buckets in generate_server_events(config)
+            for events in buckets.values()
+            for event in events
+        )
+        self.times = [event[0] for event in self.events]
+
+    def select(
+        self,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        after_record_id: Optional[int],
+    ) -> Tuple[int, int]:
+        # Номера событий [first; last), подходящих под условия команды
+        first = bisect.bisect_left(self.times, start_ms) if start_ms is not None else 0
+        last = bisect.bisect_right(
+            self.times, end_ms if end_ms is not None else time.time() * 1000
+        )
+        last = min(last, bisect.bisect_right(self.times, time.time() * 1000))
+        if after_record_id is not None:
+            first = max(first, after_record_id)
+        return first, max(first, last)
+
+    def output(self, script: str) -> bytes:
+        if "-ListLog" in script:
+            return self._availability(script)
+        start_ms, end_ms = (
+            _script_time_ms(pattern, script) for pattern in (_START_RE, _END_RE)
+        )
+        after = _AFTER_RE.search(script)
+        first, last = self.select(
+            start_ms, end_ms, int(after.group(1)) if after else None
+        )
+        if "RDPC1" in script:
+            return encode_compact(
+                self.events[first:last], first + 1, compress="GZipStream" in script
+            )
+        return encode_ps_json(self.events[first:last], first + 1)
+
+    def _availability(self, script: str) -> bytes:
+        _, last = self.select(None, None, None)
+        now_ms = time.time() * 1000
+
+        def record(index: int) -> Optional[dict]:
+            if not last:
+                return None
+            return {
+                "RecordId": index + 1,
+                "TimeCreated": f"/Date({self.events[index][0]})/",
+            }
+
+        return json.dumps(
+            {
+                "IsEnabled": True,
+                "LogMode": "Circular",
+                "RecordCount": last,
+                "FileSize": last * 512,
+                "MaximumSizeInBytes": 20 * 2**20,
+                "Oldest": record(0),
+                "Newest": record(last - 1),
+                "Counts": {
+                    days: last
+                    - bisect.bisect_left(self.times, now_ms - int(days) * 86400 * 1000)
+                    for days in _DAYS_RE.findall(script)
+                },
+            }
+        ).encode()
+
+
+def _script_time_ms(pattern: re.Pattern, script: str) -> Optional[int]:
+    match = pattern.search(script)
+    return (
+        int(datetime.fromisoformat(match.group(1)).timestamp() * 1000)
+        if match
+        else None
+    )
+
+
+_logs: Dict[str, FakeLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_fake_log(server: str) -> FakeLog:
+    with _logs_lock:
+        if server not in _logs:
+            _logs[server] = FakeLog(
+                server,
+                int(_env_float("RDP_FAKE_USERS", 50)),
+                int(_env_float("RDP_FAKE_DAYS", 30)),
+            )
+        return _logs[server]
+
+
+class _FakeTransport:
+    def close_session(self) -> None:
+        pass
+
+
+class FakeProtocol:
+    # Те методы winrm.Protocol, которые использует collector._iter_ps_output и пул
+
+    def __init__(self, server: str):
+        self.server = server
+        self.transport = _FakeTransport()
+        self.latency = _env_float("RDP_FAKE_LATENCY_MS", 20) / 1000
+        self.error_rate = _env_float("RDP_FAKE_ERROR_RATE", 0)
+        self.chunk_bytes = max(1, int(_env_float("RDP_FAKE_CHUNK_BYTES", 64 * 1024)))
+        self._outputs: Dict[str, Tuple[bytes, int]] = (
+            {}
+        )  # команда -> (вывод, сколько уже отдано)
+
+    def _roundtrip(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_shell(self, **kwargs) -> str:
+        self._roundtrip()
+        return str(uuid.uuid4())
+
+    def close_shell(self, shell_id: str, close_session: bool = True) -> None:
+        self._roundtrip()
+
+    def run_command(self, shell_id: str, command: str) -> str:
+        self._roundtrip()
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError(f"имитация: сервер {self.server} не ответил")
+        script = b64decode(command.rsplit(" ", 1)[1]).decode("utf_16_le")
+        if LOG_NAME not in script:
+            raise ValueError("имитация поддерживает только команды ps_commands")
+        command_id = str(uuid.uuid4())
+        self._outputs[command_id] = (get_fake_log(self.server).output(script), 0)
+        return command_id
+
+    def _raw_get_command_output(
+        self, shell_id: str, command_id: str
+    ) -> Tuple[bytes, bytes, int, bool]:
+        self._roundtrip()
+        output, offset = self._outputs[command_id]
+        end = offset + self.chunk_bytes
+        self._outputs[command_id] = (output, end)
+        return output[offset:end], b"", 0, end >= len(output)
+
+    def cleanup_command(self, shell_id: str, command_id: str) -> None:
+        self._outputs.pop(command_id, None)
+
+
+class FakeSession:
+    # Замена winrm.Session: создание подключения занимает RDP_FAKE_CONNECT_MS
+    # (аутентификация)
+
+    def __init__(self, server: str, settings=None):
+        time.sleep(_env_float("RDP_FAKE_CONNECT_MS", 100) / 1000)
+        self.url = server
+        self.protocol = FakeProtocol(server)
+
+    def _clean_error_msg(self, msg: bytes) -> bytes:
+        return msg
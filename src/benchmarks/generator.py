@@ -0,0 +1,193 @@
+import base64
+import gzip
+import json
+import math
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from app.services.ps_commands import (
+    LOGOFF_EVENT_ID,
+    LOGON_EVENT_ID,
+    WIRE_COMPACT_GZIP,
+    WIRE_JSON,
+)
+
+# Кортеж события генератора: (время, мс epoch; код события; идентификатор сессии; логин)
+RawEvent = Tuple[int, int, int, str]
+
+
+@dataclass
+class GeneratorConfig:
+    users: int = 100
+    servers: int = 4
+    days: int = 30
+    # Среднее число переподключений пользователя за рабочий день
+    reconnect_rate: float = 1.0
+    # Доля сессий без события выхода (сбой, потеря записи журнала)
+    missing_logoff_rate: float = 0.02
+    # Доля сессий, продолжающихся после полуночи
+    overnight_rate: float = 0.01
+    start: date = date(2025, 1, 1)
+    seed: int = 42
+
+    @property
+    def events_per_user_day(self) -> float:
+        # Число переподключений — целая часть экспоненциальной величины со средним
+        # reconnect_rate
+        reconnects = (
+            1 / math.expm1(1 / self.reconnect_rate) if self.reconnect_rate > 0 else 0.0
+        )
+        return (1 + reconnects) * (2 - self.missing_logoff_rate)
+
+    @classmethod
+    def for_size(cls, events: int, **overrides) -> "GeneratorConfig":
+        # Конфигурация, дающая примерно events событий: число пользователей подбирается
+        # под заданные серверы/дни/частоту переподключений
+        config = cls(**overrides)
+        config.users = max(
+            1, math.ceil(events / (config.days * config.events_per_user_day))
+        )
+        return config
+
+
+def _user_day_sessions(
+    rng: random.Random, config: GeneratorConfig, day_start: datetime
+) -> List[Tuple[datetime, datetime]]:
+    # Рабочий день пользователя (около 9:00-18:00), разбитый переподключениями на сессии
+    start = day_start + timedelta(hours=rng.gauss(9, 1))
+    length = timedelta(hours=max(1.0, rng.gauss(9, 1.5)))
+    if rng.random() < config.overnight_rate:
+        start = day_start + timedelta(hours=rng.uniform(18, 23))
+        length = timedelta(hours=rng.uniform(4, 12))
+    end = start + length
+
+    reconnects = (
+        min(20, int(rng.expovariate(1 / config.reconnect_rate)))
+        if config.reconnect_rate > 0
+        else 0
+    )
+    cuts = sorted(start + (end - start) * rng.random() for _ in range(reconnects))
+    bounds = [start] + cuts + [end]
+    sessions = []
+    for i in range(len(bounds) - 1):
+        # Между переподключениями — пауза до нескольких минут
+        pause = timedelta(seconds=rng.uniform(5, 300)) if i else timedelta()
+        if bounds[i] + pause < bounds[i + 1]:
+            sessions.append((bounds[i] + pause, bounds[i + 1]))
+    return sessions
+
+
+def generate_server_events(
+    config: GeneratorConfig,
+) -> Iterator[Tuple[date, Dict[str, List[RawEvent]]]]:
+    # Поток событий по дням: для каждого дня — события каждого сервера в порядке
+    # времени. Сессии через полночь переносят событие выхода в следующий день.
+    rng = random.Random(config.seed)
+    servers = [f"rdsh{i + 1:02d}" for i in range(config.servers)]
+    usernames = [f"DOMAIN\\user{i + 1:05d}" for i in range(config.users)]
+    next_session_id = {server: 2 for server in servers}
+    pending: Dict[date, Dict[str, List[RawEvent]]] = {}
+
+    for day_index in range(config.days + 1):
+        day = config.start + timedelta(days=day_index)
+        day_start = datetime.combine(day, time.min)
+        buckets = pending.pop(day, None) or {server: [] for server in servers}
+        if day_index < config.days:
+            for username in usernames:
+                for start, end in _user_day_sessions(rng, config, day_start):
+                    server = rng.choice(servers)
+                    session_id = next_session_id[server]
+                    next_session_id[server] += 1
+                    buckets[server].append(
+                        (
+                            int(start.timestamp() * 1000),
+                            LOGON_EVENT_ID,
+                            session_id,
+                            username,
+                        )
+                    )
+                    if rng.random() < config.missing_logoff_rate:
+                        continue
+                    logoff = (
+                        int(end.timestamp() * 1000),
+                        LOGOFF_EVENT_ID,
+                        session_id,
+                        username,
+                    )
+                    if end.date() == day:
+                        buckets[server].append(logoff)
+                    else:
+                        target = pending.setdefault(
+                            end.date(), {name: [] for name in servers}
+                        )
+                        target[server].append(logoff)
+        for events in buckets.values():
+            events.sort()
+        yield day, buckets
+
+
+def encode_ps_json(events: List[RawEvent], first_record_id: int = 1) -> bytes:
+    # Вывод в формате ConvertTo-Json -Compress Windows PowerShell 5.1: "\/Date(ms)\/"
+    parts = []
+    for offset, (time_ms, event_id, session_id, username) in enumerate(events):
+        parts.append(
+            f'{{"RecordId":{first_record_id + offset},'
+            f'"TimeCreated":"\\/Date({time_ms})\\/",'
+            f'"Id":{event_id},"User":{session_id},"UserName":{json.dumps(username)}}}'
+        )
+    return ("[" + ",".join(parts) + "]").encode()
+
+
+def encode_compact(
+    events: List[RawEvent], first_record_id: int = 1, compress: bool = False
+) -> bytes:
+    # Компактный вывод скрипта ps_commands (RDP_WIRE_FORMAT=compact или compact-gzip)
+    names: Dict[str, int] = {}
+    lines = ["RDPC1"]
+    for offset, (time_ms, event_id, session_id, username) in enumerate(events):
+        if username not in names:
+            names[username] = len(names)
+            lines.append(f"U\t{json.dumps(username, ensure_ascii=False)}")
+        record_id = first_record_id + offset
+        lines.append(f"{record_id},{time_ms},{event_id},{names[username]},{session_id}")
+    lines.append(f"E\t{len(events)}")
+    text = ("\n".join(lines) + "\n").encode()
+    if not compress:
+        return text
+    encoded = base64.b64encode(gzip.compress(text)).decode()
+    return (
+        "RDPC1 gzip\r\n"
+        + "\r\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76))
+        + "\r\n"
+    ).encode()
+
+
+def generate_ps_payloads(
+    config: GeneratorConfig, wire_format: str = WIRE_JSON
+) -> Dict[str, bytes]:
+    # Полный вывод скрипта ps_commands для каждого сервера за весь период
+    # в формате wire_format (ps_commands.WIRE_FORMATS)
+    if wire_format != WIRE_JSON:
+        events: Dict[str, List[RawEvent]] = {}
+        for _, buckets in generate_server_events(config):
+            for server, day_events in buckets.items():
+                events.setdefault(server, []).extend(day_events)
+        return {
+            server: encode_compact(
+                server_events, compress=wire_format == WIRE_COMPACT_GZIP
+            )
+            for server, server_events in events.items()
+            if server_events
+        }
+    chunks: Dict[str, List[bytes]] = {}
+    record_ids: Dict[str, int] = {}
+    for _, buckets in generate_server_events(config):
+        for server, events in buckets.items():
+            if not events:
+                continue
+            body = encode_ps_json(events, record_ids.get(server, 1))[1:-1]
+            record_ids[server] = record_ids.get(server, 1) + len(events)
+            chunks.setdefault(server, []).append(body)
+    return {server: b"[" + b",".join(parts) + b"]" for server, parts in chunks.items()}
@@ -0,0 +1,397 @@
+"""
+Нагрузочный тест API: параллельные запросы к /api/v1/rdp/sessions, задержки p50/p99,
+пропускная способность и память процесса API.
+
+Без --url тест запускает uvicorn с приложением, подключённым к имитации серверов
+(benchmarks/fake_winrm.py), — Windows-серверы и сеть не нужны.
+
+Пример:
+    python -m benchmarks.loadtest --latency-ms 20 --requests 200 --concurrency 16
+    python -m benchmarks.loadtest --periods 50 --env RDP_POOL_SIZE=0 --output pool0.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --pid 12345
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.common import git_commit
+
+SESSIONS_PATH = "/api/v1/rdp/sessions"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree_rss(pid: int) -> int:
+    # Суммарный RSS процесса и его потомков (воркеров uvicorn) по /proc, байты
+    parents: Dict[int, int] = {}
+    rss: Dict[int, int] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+            rss[int(entry)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [
+            child
+            for child, ppid in parents.items()
+            if ppid == parent and child not in tree
+        ]
+        tree.update(children)
+        frontier.extend(children)
+    return sum(rss.get(member, 0) for member in tree)
+
+
+class MemorySampler(threading.Thread):
+    # Периодически замеряет RSS процесса API, запоминает пик
+
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.interval)
+
+    def sample(self) -> int:
+        self.last = _process_tree_rss(self.pid)
+        self.peak = max(self.peak, self.last)
+        return self.last
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+
+def start_fake_api(args, store_dir: str) -> Tuple[subprocess.Popen, str]:
+    # uvicorn с приложением, опрашивающим имитацию серверов fake01..fakeNN
+    env = dict(os.environ)
+    env.update(
+        {
+            "PYTHONPATH": os.pathsep.join(
+                filter(None, [os.getcwd(), env.get("PYTHONPATH")])
+            ),
+            "RDP_SESSION_FACTORY": "benchmarks.fake_winrm:FakeSession",
+            "RDP_LOG_USERNAME": "loadtest",
+            "RDP_LOG_PASSWORD": "loadtest",
+            "RDP_SERVERS": ",".join(f"fake{i + 1:02d}" for i in range(args.servers)),
+            "RDP_STORE_PATH": os.path.join(store_dir, "events.sqlite3"),
+            "RDP_FAKE_LATENCY_MS": str(args.latency_ms),
+            "RDP_FAKE_CONNECT_MS": str(args.connect_ms),
+            "RDP_FAKE_USERS": str(args.users),
+            "RDP_FAKE_DAYS": str(args.log_days),
+            "RDP_FAKE_ERROR_RATE": str(args.error_rate),
+        }
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(args.workers),
+            "--log-level",
+            "warning",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(store_dir, "api.log"), "wb"),
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            urllib.request.urlopen(url + "/", timeout=1).read()
+            return process, url
+        except Exception:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(
+                    f"API не запустился, см. {os.path.join(store_dir, 'api.log')}"
+                )
+            time.sleep(0.2)
+
+
+def report_periods(count: int, days: int) -> List[Tuple[str, str]]:
+    # count разных периодов по days дней, заканчивающихся вчера, позавчера и т.д.
+    # Чем больше разных периодов, тем меньше попаданий в кэш отчёта.
+    last = date.today() - timedelta(days=1)
+    return [
+        (
+            (last - timedelta(days=i + days - 1)).isoformat(),
+            (last - timedelta(days=i)).isoformat(),
+        )
+        for i in range(count)
+    ]
+
+
+def request_once(url: str, timeout: float) -> dict:
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body, status = e.read(), e.code
+    except Exception as e:
+        return {
+            "seconds": time.perf_counter() - started,
+            "status": type(e).__name__,
+            "bytes": 0,
+            "partial": False,
+        }
+    return {
+        "seconds": time.perf_counter() - started,
+        "status": status,
+        "bytes": len(body),
+        "partial": status == 200 and b'"failures":[]' not in body,
+    }
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[
+        min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered))) - 1))
+    ]
+
+
+def run_load(
+    base_url: str,
+    periods: List[Tuple[str, str]],
+    total: int,
+    concurrency: int,
+    timeout: float,
+) -> dict:
+    urls = [
+        f"{base_url}{SESSIONS_PATH}?start_date={start}&end_date={end}"
+        for start, end in periods
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(
+            pool.map(lambda i: request_once(urls[i % len(urls)], timeout), range(total))
+        )
+    wall = time.perf_counter() - started
+
+    ok = [result["seconds"] for result in results if result["status"] == 200]
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 2) if wall else None,
+        "statuses": statuses,
+        "partial_responses": sum(result["partial"] for result in results),
+        "response_bytes": sum(result["bytes"] for result in results),
+        "latency_seconds": {
+            name: round(value, 4) if value is not None else None
+            for name, value in (
+                ("p50", _percentile(ok, 50)),
+                ("p90", _percentile(ok, 90)),
+                ("p99", _percentile(ok, 99)),
+                ("max", max(ok) if ok else None),
+                ("mean", sum(ok) / len(ok) if ok else None),
+            )
+        },
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест /api/v1/rdp/sessions"
+    )
+    parser.add_argument(
+        "--url",
+        help="адрес работающего API; без него запускается API с имитацией серверов",
+    )
+    parser.add_argument(
+        "--pid", type=int, help="PID процесса API для замера памяти (вместе с --url)"
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="число запросов (по умолчанию 200)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="одновременных запросов (по умолчанию 16)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=1,
+        help="последовательных запросов до замера (по умолчанию 1)",
+    )
+    parser.add_argument(
+        "--periods",
+        type=int,
+        default=4,
+        help="разных периодов отчёта в запросах (по умолчанию 4)",
+    )
+    parser.add_argument(
+        "--period-days",
+        type=int,
+        default=7,
+        help="длина периода отчёта, дней (по умолчанию 7)",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=300, help="таймаут одного запроса, сек"
+    )
+    parser.add_argument("--servers", type=int, default=8, help="имитируемых серверов")
+    parser.add_argument(
+        "--users", type=int, default=50, help="пользователей в журнале каждого сервера"
+    )
+    parser.add_argument(
+        "--log-days", type=int, default=30, help="дней в журналах серверов"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=20, help="задержка запроса WS-Man, мс"
+    )
+    parser.add_argument(
+        "--connect-ms", type=float, default=100, help="установка подключения, мс"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="доля команд с ошибкой подключения"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="дополнительные переменные окружения API, например RDP_POOL_SIZE=0",
+    )
+    parser.add_argument("--output", help="файл для результатов в формате JSON")
+    args = parser.parse_args(argv)
+
+    store_dir = tempfile.mkdtemp(prefix="rdp-loadtest-")
+    process = None
+    try:
+        if args.url:
+            base_url, pid = args.url.rstrip("/"), args.pid
+        else:
+            process, base_url = start_fake_api(args, store_dir)
+            pid = process.pid
+        sampler = MemorySampler(pid) if pid else None
+        if sampler:
+            sampler.sample()
+            idle_rss = sampler.last
+            sampler.start()
+
+        periods = report_periods(args.periods, args.period_days)
+        warmup = (
+            [
+                request_once(
+                    f"{base_url}{SESSIONS_PATH}?start_date={start}&end_date={end}",
+                    args.timeout,
+                )
+                for start, end in periods[: args.warmup]
+            ]
+            if args.warmup
+            else []
+        )
+        for result in warmup:
+            print(
+                f"Прогрев: {result['seconds']:.3f} с, статус {result['status']}",
+                flush=True,
+            )
+        load = run_load(
+            base_url, periods, args.requests, args.concurrency, args.timeout
+        )
+        if sampler:
+            sampler.stop()
+            load["memory"] = {
+                "idle_rss_bytes": idle_rss,
+                "peak_rss_bytes": sampler.peak,
+                "final_rss_bytes": sampler.last,
+            }
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    latency = load["latency_seconds"]
+    print(
+        f"Запросов: {load['requests']} (одновременно {load['concurrency']}) за "
+        f"{load['wall_seconds']} с, "
+        f"{load['throughput_rps']} запр/с, статусы {load['statuses']}"
+    )
+    print(
+        f"Задержка: p50 {latency['p50']} с, p90 {latency['p90']} с, p99 "
+        f"{latency['p99']} с, "
+        f"max {latency['max']} с"
+    )
+    if "memory" in load:
+        memory = load["memory"]
+        print(
+            f"Память API: в простое {memory['idle_rss_bytes'] / 2 ** 20:.1f} МБ, "
+            f"пик {memory['peak_rss_bytes'] / 2 ** 20:.1f} МБ"
+        )
+    if load["partial_responses"]:
+        print(f"Ответов с незагруженными периодами: {load['partial_responses']}")
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "warmup_seconds": [round(result["seconds"], 4) for result in warmup],
+        "load": load,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
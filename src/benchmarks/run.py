@@ -0,0 +1,191 @@
+"""
+Замер производительности этапов построения отчёта на синтетических журналах.
+
+Пример:
+    python -m benchmarks.run --sizes 10000,100000,1000000 --output bench.json
+    python -m benchmarks.compare old.json bench.json
+    python -m benchmarks.run --sizes 1000000 --wire-format compact-gzip --output gz.json
+"""
+
+import argparse
+import json
+import platform
+import sys
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from app.services.events import event_from_ps, iter_compact_events, iter_json_items
+from app.services.pairing import format_segment, pair_events, split_by_day
+from app.services.ps_commands import WIRE_FORMATS, WIRE_JSON
+from app.utils.fast_json import dumps
+from benchmarks.common import chunks, git_commit, measure
+from benchmarks.generator import GeneratorConfig, generate_ps_payloads
+
+DEFAULT_SIZES = "10000,100000,1000000"
+
+
+def stage_json_parse(payloads: Dict[str, bytes]) -> Dict[str, List[dict]]:
+    return {
+        server: list(iter_json_items(chunks(payload)))
+        for server, payload in payloads.items()
+    }
+
+
+def stage_compact_parse(payloads: Dict[str, bytes]) -> list:
+    # Компактный вывод разбирается сразу в события (разбор времени не нужен)
+    return [
+        event
+        for server, payload in payloads.items()
+        for event in iter_compact_events(chunks(payload), server)
+    ]
+
+
+def stage_timestamp_parse(items: Dict[str, List[dict]]) -> list:
+    return [
+        event_from_ps(item, server) for server, rows in items.items() for item in rows
+    ]
+
+
+def stage_grouping(events: list) -> list:
+    # Объединение серверов в общий поток по времени (как при чтении из хранилища)
+    return sorted(events, key=lambda x: (x.time_ms, x.server, x.record_id))
+
+
+def stage_pairing(events: list) -> list:
+    return list(pair_events(events))
+
+
+def _make_stage_report(until: datetime) -> Callable[[list], dict]:
+    def stage_report(sessions: list) -> dict:
+        segments = defaultdict(lambda: defaultdict(list))
+        for session in sessions:
+            for segment in split_by_day(session, until=until):
+                segments[segment.day.isoformat()][session.username].append(
+                    format_segment(segment)
+                )
+        return {day: dict(users) for day, users in segments.items()}
+
+    return stage_report
+
+
+def stage_serialization(grouped: dict) -> bytes:
+    # Как в обработчике /sessions: без проверки по модели ответа
+    return dumps({"start_date": "", "end_date": "", "dates": grouped})
+
+
+def run_size(
+    size: int, config_overrides: dict, memory: bool, wire_format: str = WIRE_JSON
+) -> dict:
+    config = GeneratorConfig.for_size(size, **config_overrides)
+    payloads = generate_ps_payloads(config, wire_format)
+    payload_bytes = sum(len(payload) for payload in payloads.values())
+    print(
+        f"  вывод серверов ({wire_format}): {payload_bytes / 2 ** 20:.1f} МБ",
+        flush=True,
+    )
+    until = datetime.combine(
+        config.start + timedelta(days=config.days + 1), datetime.min.time()
+    )
+
+    if wire_format == WIRE_JSON:
+        parse_stages = [
+            ("json_parse", stage_json_parse),
+            ("timestamp_parse", stage_timestamp_parse),
+        ]
+    else:
+        parse_stages = [("compact_parse", stage_compact_parse)]
+    stages = parse_stages + [
+        ("grouping", stage_grouping),
+        ("pairing", stage_pairing),
+        ("report", _make_stage_report(until)),
+        ("serialization", stage_serialization),
+    ]
+    data = payloads
+    events = 0
+    results = []
+    for name, func in stages:
+        data, elapsed, peak = measure(func, data, memory)
+        if name in ("timestamp_parse", "compact_parse"):
+            events = len(data)
+        results.append(
+            {"stage": name, "seconds": round(elapsed, 6), "peak_bytes": peak}
+        )
+        print(
+            f"  {name:<16} {elapsed:9.3f} с  пик памяти {peak / 2 ** 20:9.1f} МБ",
+            flush=True,
+        )
+
+    for result in results:
+        result["events_per_second"] = (
+            round(events / result["seconds"]) if result["seconds"] else None
+        )
+    return {
+        "size": size,
+        "events": events,
+        "payload_bytes": payload_bytes,
+        "wire_format": wire_format,
+        "config": {key: str(value) for key, value in vars(config).items()},
+        "stages": results,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Бенчмарк этапов построения отчёта по RDP-сессиям"
+    )
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="размеры журналов в событиях через запятую "
+        f"(по умолчанию {DEFAULT_SIZES})",
+    )
+    parser.add_argument("--servers", type=int, default=20)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--reconnect-rate", type=float, default=1.0)
+    parser.add_argument("--missing-logoff-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--wire-format",
+        choices=WIRE_FORMATS,
+        default=WIRE_JSON,
+        help="формат вывода серверов (RDP_WIRE_FORMAT), по умолчанию json",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="не измерять пиковую память (быстрее)"
+    )
+    parser.add_argument("--output", help="файл для результатов в формате JSON")
+    args = parser.parse_args(argv)
+
+    overrides = {
+        "servers": args.servers,
+        "days": args.days,
+        "reconnect_rate": args.reconnect_rate,
+        "missing_logoff_rate": args.missing_logoff_rate,
+        "seed": args.seed,
+    }
+    runs = []
+    for size in (int(value) for value in args.sizes.split(",") if value.strip()):
+        print(f"Размер {size}:", flush=True)
+        runs.append(
+            run_size(
+                size, overrides, memory=not args.no_memory, wire_format=args.wire_format
+            )
+        )
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
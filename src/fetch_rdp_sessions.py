@@ -1,249 +1,273 @@
+"""
+Выгрузка отчёта по RDP-сессиям в CSV или Parquet.
+
+Примеры:
+    python fetch_rdp_sessions.py --date 2025-07-07
+    python fetch_rdp_sessions.py --start 2025-07-01 --end 2025-07-31 --output july.csv
+    python fetch_rdp_sessions.py --date 2025-07-07 --format parquet --output day.parquet
+
+Код завершения: 0 — успешно, 1 — ошибка, 2 — отчёт выгружен, но часть периода
+не удалось загрузить с серверов (подробности в stderr).
+"""
+
+import argparse
+import csv
 import os
-from dotenv import load_dotenv
-import winrm
 import sys
-import json
-from datetime import datetime, timedelta
-from collections import defaultdict
-import re
-
-# Функция для преобразования формата времени из PowerShell
-# Пример: "/Date(1745060200298)/" -> datetime
-
-def parse_ps_datetime(ps_date):
-    match = re.search(r"\d+", ps_date)
-    if match:
-        timestamp = int(match.group(0)) // 1000
-        return datetime.fromtimestamp(timestamp)
-    return None
-
-# Загрузка параметров
-load_dotenv()
-username = os.getenv('RDP_LOG_USERNAME')
-password = os.getenv('RDP_LOG_PASSWORD')
-domain = os.getenv('RDP_LOG_DOMAIN')
-servers_str = os.getenv('RDP_SERVERS', '')
-
-if not username or not password:
-    print("Ошибка: не заданы параметры подключения (RDP_LOG_USERNAME, RDP_LOG_PASSWORD) в .env")
-    sys.exit(1)
-
-if not servers_str:
-    print("Ошибка: не задан список серверов (RDP_SERVERS) в .env")
-    sys.exit(1)
-
-if domain:
-    user = f"{domain}\\{username}"
-else:
-    user = username
-
-# Список серверов для сбора статистики (из .env)
-servers = [server.strip() for server in servers_str.split(',')]
-
-# Дата для отчёта (можно задать диапазон)
-report_date = "2025-07-07"  # YYYY-MM-DD - для одной даты
-# Или диапазон дат:
-# start_date = "2025-07-01"
-# end_date = "2025-07-07"
-
-# Определяем режим работы: одна дата или диапазон
-single_date_mode = True  # True - одна дата, False - диапазон
-
-if single_date_mode:
-    # Режим одной даты
-    start_date = report_date
-    end_date = report_date
-else:
-    # Режим диапазона дат
-    start_date = "2025-07-01"  # измените на нужную начальную дату
-    end_date = "2025-07-07"    # измените на нужную конечную дату
-
-# PowerShell-команда с фильтрацией по диапазону дат
-ps_command = f'''
-$dt1 = [datetime]"{start_date} 00:00:00"
-$dt2 = [datetime]"{end_date} 23:59:59"
-
-Get-WinEvent -LogName "Microsoft-Windows-TerminalServices-LocalSessionManager/Operational" |
-  Where-Object {{ 
-    $_.Id -in 21,23 -and 
-    $_.TimeCreated -ge $dt1 -and 
-    $_.TimeCreated -le $dt2 
-  }} |
-  Select-Object TimeCreated, Id, @{{Name="User";Expression={{($_.Properties[1].Value)}}}}, @{{Name="UserName";Expression={{($_.Properties[0].Value)}}}} |
-  Sort-Object TimeCreated | 
-  ConvertTo-Json -Compress -Depth 4
-'''
-
-# Сбор данных со всех серверов
-all_data = []
-
-for server in servers:
-    print(f"Подключение к серверу {server}...")
-    
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from app.services.pairing import format_duration
+from app.services.ps_commands import report_bounds
+from app.services.rdp_service import (
+    get_session_totals,
+    iter_report_days,
+    iter_report_rows,
+    sync_report_period,
+)
+from app.utils.logger import set_log_stream
+
+# Столбцы отчёта: заголовки CSV (как в прежнем консольном отчёте) и имена полей Parquet
+CSV_HEADER = [
+    "Дата",
+    "UserId",
+    "Логин",
+    "Сервер входа",
+    "Сервер выхода",
+    "Вход",
+    "Выход",
+    "Длительность сессии",
+    "Секунды",
+]
+PARQUET_FIELDS = [
+    "date",
+    "user_id",
+    "username",
+    "login_server",
+    "logout_server",
+    "login_time",
+    "logout_time",
+    "duration",
+    "duration_seconds",
+]
+TOTAL_SERVER = "ВСЕ СЕРВЕРЫ"
+DEFAULT_BATCH_SIZE = 10000
+
+
+def iter_export_rows(start_date: str, end_date: str, failures=()) -> Iterator[list]:
+    # Строки отчёта по дням и пользователям: сессии пользователя за день, затем итог за
+    # день; в конце, если период длиннее дня, — итоги пользователей за период. Дни
+    # рассчитываются сервисом порциями; итоги считаются векторно (get_session_totals) по
+    # тем же частям сессий, в памяти — только они.
+    totals = get_session_totals(start_date, end_date, sync=False)
+    by_day = totals.by_user()
+    user_ids: Dict[str, str] = {}
+    for day, users in iter_report_days(start_date, end_date, failures):
+        for username in sorted(users):
+            for session in users[username]:
+                user_ids[username] = session["user_id"]
+                yield [
+                    day,
+                    session["user_id"],
+                    username,
+                    session["login_server"],
+                    session["logout_server"],
+                    session["login_time"],
+                    session["logout_time"],
+                    session["duration"],
+                    session["duration_seconds"],
+                ]
+            day_total = by_day.get(username, {}).get(day, 0)
+            if day_total:
+                yield [
+                    day,
+                    user_ids[username],
+                    username,
+                    TOTAL_SERVER,
+                    "",
+                    "",
+                    "Итого за день:",
+                    format_duration(timedelta(seconds=day_total)),
+                    day_total,
+                ]
+
+    if start_date != end_date:
+        period = totals.user_period()
+        for username in sorted(period):
+            yield [
+                f"{start_date} - {end_date}",
+                user_ids.get(username, ""),
+                username,
+                TOTAL_SERVER,
+                "",
+                "",
+                "Итого за период:",
+                format_duration(timedelta(seconds=period[username])),
+                period[username],
+            ]
+
+
+def _batches(rows: Iterator[list], size: int) -> Iterator[List[list]]:
+    batch: List[list] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def write_csv(rows: Iterator[list], output: Optional[str], batch_size: int) -> int:
+    # CSV с разделителем ';' (как прежний вывод в консоль); без output — в stdout
+    f = open(output, "w", encoding="utf-8-sig", newline="") if output else sys.stdout
     try:
-        session = winrm.Session(server, auth=(user, password), transport='ntlm')
-        result = session.run_ps(ps_command)
-        
-        if result.status_code != 0:
-            print(f"Ошибка на сервере {server}:", result.std_err.decode(errors='ignore'))
-            continue
-            
-        # Обработка результата
-        try:
-            data = json.loads(result.std_out.decode(errors='ignore'))
-            if isinstance(data, list):
-                # Добавляем информацию о сервере к каждому событию
-                for event in data:
-                    event['Server'] = server
-                all_data.extend(data)
-                print(f"Получено {len(data)} событий с сервера {server}")
-            else:
-                print(f"Неожиданный формат данных с сервера {server}")
-                
-        except Exception as e:
-            print(f"Ошибка разбора JSON с сервера {server}:", e)
-            continue
-            
-    except Exception as e:
-        print(f"Ошибка подключения к серверу {server}:", e)
-        continue
-
-# Диагностика: выводим общее количество событий
-if single_date_mode:
-    print(f"Всего получено событий за {report_date}: {len(all_data)}")
-else:
-    print(f"Всего получено событий за период {start_date} - {end_date}: {len(all_data)}")
-
-# Диагностика: выводим диапазон дат среди всех событий
-all_dates = []
-for event in all_data:
-    dt = event.get("TimeCreated")
-    if dt:
-        match = re.search(r"\d+", dt)
-        if match:
-            timestamp = int(match.group(0)) // 1000
-            all_dates.append(datetime.fromtimestamp(timestamp))
-if all_dates:
-    min_date = min(all_dates)
-    max_date = max(all_dates)
-    print(f"Минимальная дата: {min_date}")
-    print(f"Максимальная дата: {max_date}")
-else:
-    print("Не удалось определить диапазон дат.")
-
-# Группировка: (user, username) -> date -> list of events (объединяем данные с разных серверов)
-sessions = defaultdict(lambda: defaultdict(list))
-for event in all_data:
-    server = event.get("Server", "unknown")
-    user = str(event["User"])
-    username = str(event.get("UserName", ""))
-    dt = parse_ps_datetime(event["TimeCreated"])
-    if not dt:
-        continue
-    date_str = dt.date().isoformat()
-    # Группируем по пользователю, а не по серверу
-    sessions[(user, username)][date_str].append({
-        "datetime": dt,
-        "type": event["Id"], # 21 - вход, 23 - выход
-        "server": server
-    })
-
-# Формируем отчёт за выбранный период
-report_rows = []
-if single_date_mode:
-    # Режим одной даты
-    target_dates = [report_date]
-else:
-    # Режим диапазона дат - генерируем список дат
-    from datetime import datetime, timedelta
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-    target_dates = []
-    current_dt = start_dt
-    while current_dt <= end_dt:
-        target_dates.append(current_dt.strftime("%Y-%m-%d"))
-        current_dt += timedelta(days=1)
-
-for (user, username), days in sessions.items():
-    user_total_time = timedelta()
-    user_sessions = []
-    
-    for target_date in target_dates:
-        if target_date in days:
-            events = days[target_date]
-            # Сортируем события по времени
-            events.sort(key=lambda x: x["datetime"])
-            i = 0
-            day_total_time = timedelta()
-            
-            while i < len(events):
-                if events[i]["type"] == 21:  # вход
-                    start_time = events[i]["datetime"]
-                    start_server = events[i]["server"]
-                    # ищем ближайший выход
-                    end_time = None
-                    end_server = None
-                    for j in range(i+1, len(events)):
-                        if events[j]["type"] == 23:
-                            end_time = events[j]["datetime"]
-                            end_server = events[j]["server"]
-                            break
-                    if end_time:
-                        duration = end_time - start_time
-                        day_total_time += duration
-                        user_total_time += duration
-                        user_sessions.append([
-                            target_date, user, username,
-                            start_server, end_server,
-                            start_time.strftime("%H:%M:%S"),
-                            end_time.strftime("%H:%M:%S"),
-                            str(duration)
-                        ])
-                        i = j + 1
-                    else:
-                        # Нет выхода — считаем до конца дня
-                        end_time = start_time.replace(hour=23, minute=59, second=59)
-                        duration = end_time - start_time
-                        day_total_time += duration
-                        user_total_time += duration
-                        user_sessions.append([
-                            target_date, user, username,
-                            start_server, "нет выхода",
-                            start_time.strftime("%H:%M:%S"),
-                            end_time.strftime("%H:%M:%S"),
-                            str(duration) + " (нет выхода)"
-                        ])
-                        i += 1
-                else:
-                    i += 1
-            
-            # Итог по дню для пользователя
-            if day_total_time:
-                user_sessions.append([
-                    target_date, user, username, "ВСЕ СЕРВЕРЫ", "", "", "Итого за день:", str(day_total_time)
-                ])
-    
-    # Добавляем все сессии пользователя в отчёт
-    report_rows.extend(user_sessions)
-    
-    # Итог по всему периоду для пользователя
-    if user_total_time and not single_date_mode:
-        report_rows.append([
-            f"{start_date} - {end_date}", user, username, "ВСЕ СЕРВЕРЫ", "", "", "Итого за период:", str(user_total_time)
-        ])
-
-# Выводим в консоль отчёт
-if single_date_mode:
-    print(f"\nОтчёт за {report_date}:")
-else:
-    print(f"\nОтчёт за период {start_date} - {end_date}:")
-    
-print("Дата;UserId;Логин;Сервер входа;Сервер выхода;Вход;Выход;Длительность сессии;Итого за день")
-if report_rows:
-    for row in report_rows:
-        print(";".join(str(x) for x in row))
-else:
-    if single_date_mode:
-        print(f"Нет данных за {report_date}.")
+        writer = csv.writer(f, delimiter=";", lineterminator="\n")
+        writer.writerow(CSV_HEADER)
+        count = 0
+        for batch in _batches(rows, batch_size):
+            writer.writerows(batch)
+            f.flush()
+            count += len(batch)
+        return count
+    finally:
+        if output:
+            f.close()
+
+
+def write_parquet(rows: Iterator[list], output: str, batch_size: int) -> int:
+    # Каждая порция строк записывается отдельной группой строк (row group)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError(
+            "Для выгрузки в Parquet установите pyarrow: poetry install -E parquet"
+        )
+
+    schema = pa.schema(
+        [
+            (name, pa.int64() if name == "duration_seconds" else pa.string())
+            for name in PARQUET_FIELDS
+        ]
+    )
+    count = 0
+    with pq.ParquetWriter(output, schema) as writer:
+        for batch in _batches(rows, batch_size):
+            columns = list(zip(*batch))
+            writer.write_table(
+                pa.table(
+                    {
+                        name: list(column)
+                        for name, column in zip(PARQUET_FIELDS, columns)
+                    },
+                    schema=schema,
+                )
+            )
+            count += len(batch)
+    return count
+
+
+def get_rdp_data(start_date: str, end_date: str) -> List[dict]:
+    # Сессии за период списком (для src/main.py): хранилище синхронизируется,
+    # отчёт строится сервисом app.services.rdp_service
+    failures = sync_report_period(start_date, end_date)
+    return [
+        {"date": day, "username": username, **session}
+        for day, username, _, session in iter_report_rows(
+            start_date, end_date, failures=failures
+        )
+    ]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Отчёт по RDP-сессиям в CSV или Parquet"
+    )
+    parser.add_argument("--date", help="дата отчёта YYYY-MM-DD (отчёт за один день)")
+    parser.add_argument("--start", help="начальная дата периода YYYY-MM-DD")
+    parser.add_argument(
+        "--end", help="конечная дата периода YYYY-MM-DD (по умолчанию равна --start)"
+    )
+    parser.add_argument(
+        "--servers", help="серверы через запятую (по умолчанию RDP_SERVERS из .env)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=("csv", "parquet"),
+        default="csv",
+        help="формат (по умолчанию csv)",
+    )
+    parser.add_argument("--output", help="файл отчёта (для csv по умолчанию — stdout)")
+    parser.add_argument(
+        "--no-sync",
+        action="store_true",
+        help="не опрашивать серверы, строить отчёт по локальному хранилищу",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"строк в одной порции записи (по умолчанию {DEFAULT_BATCH_SIZE})",
+    )
+    args = parser.parse_args(argv)
+
+    if args.date and (args.start or args.end):
+        parser.error("--date нельзя указывать вместе с --start/--end")
+    if args.date:
+        args.start = args.end = args.date
+    elif args.start:
+        args.end = args.end or args.start
+    elif args.end:
+        parser.error("--end указывается вместе с --start")
     else:
-        print(f"Нет данных за период {start_date} - {end_date}.") 
\ No newline at end of file
+        args.start = args.end = date.today().isoformat()
+    if args.format == "parquet" and not args.output:
+        parser.error("для формата parquet укажите --output")
+    if args.batch_size < 1:
+        parser.error("--batch-size должен быть положительным")
+    try:
+        report_bounds(args.start, args.end)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # Журнал — в stderr: CSV может выводиться в stdout
+    set_log_stream(sys.stderr)
+    if args.servers:
+        # Список серверов задаётся так же, как в .env: все сервисы читают RDP_SERVERS
+        os.environ["RDP_SERVERS"] = args.servers
+
+    failures = []
+    try:
+        if not args.no_sync:
+            failures = sync_report_period(args.start, args.end)
+        for failure in failures:
+            item = failure.as_dict()
+            print(
+                f"Сервер {item['server']}: не загружен период {item['start']} - "
+                f"{item['end']}: {item['error']}",
+                file=sys.stderr,
+            )
+        rows = iter_export_rows(args.start, args.end, failures)
+        if args.format == "parquet":
+            count = write_parquet(rows, args.output, args.batch_size)
+        else:
+            count = write_csv(rows, args.output, args.batch_size)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+
+    print(
+        f"Отчёт за период {args.start} - {args.end}: {count} строк"
+        + (f" записано в {args.output}" if args.output else ""),
+        file=sys.stderr,
+    )
+    return 2 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,14 +32,16 @@ except Exception as e:
 app = FastAPI(
     title="RDP Sessions Report API",
     version="1.0.0",
-    description="API для получения отчётов по RDP сессиям"
+    description="API для получения отчётов по RDP сессиям",
 )
 
+
 # Модели для API
 class RdpSessionRequest(BaseModel):
     start_date: str
     end_date: str
 
+
 class RdpSession(BaseModel):
     date: str
     user_id: str
@@ -50,43 +52,48 @@ class RdpSession(BaseModel):
     logout_time: str
     duration: str
 
+
 class RdpSessionsResponse(BaseModel):
     start_date: str
     end_date: str
     total_sessions: int
     sessions: List[RdpSession]
 
+
 @app.get("/")
 async def root():
     """Корневой эндпоинт"""
     return {"message": "RDP Sessions Report API", "version": "1.0.0"}
 
+
 @app.get("/health")
 async def health():
     """Проверка состояния API"""
     return {"status": "ok", "message": "API работает"}
 
+
 @app.post("/api/sessions", response_model=RdpSessionsResponse)
 async def get_sessions(request: RdpSessionRequest):
     """Получить отчёт по RDP сессиям"""
     try:
         sessions_data = get_rdp_data(request.start_date, request.end_date)
-        
+
         # Преобразуем в модели Pydantic
         sessions = []
         for session_data in sessions_data:
             sessions.append(RdpSession(**session_data))
-        
+
         return RdpSessionsResponse(
             start_date=request.start_date,
             end_date=request.end_date,
             total_sessions=len(sessions),
-            sessions=sessions
+            sessions=sessions,
         )
-        
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
 @app.get("/api/available-dates")
 async def get_available_dates():
     """Получить доступные даты для отчётов"""
@@ -96,6 +103,8 @@ async def get_available_dates():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,61 @@
+"""
+Сборщик событий входа/выхода в несколько процессов.
+
+Процессы делят серверы из RDP_SERVERS через аренду в общем хранилище (RDP_STORE_PATH):
+каждый берёт до RDP_SHARD_BATCH серверов, которые пора собирать, и сохраняет их события.
+Серверы процесса, завершившегося аварийно, по истечении аренды (RDP_SHARD_LEASE_TTL)
+собирают остальные. Сборщики на нескольких машинах (контейнерах) с общим хранилищем
+работают так же. API при этом запускается с RDP_SCHEDULER_EXTERNAL=1 и строит отчёты
+по собранным событиям, не опрашивая серверы.
+
+Примеры:
+    python run_collector.py             # RDP_SHARD_PROCESSES процессов, до остановки
+    python run_collector.py --workers 4 --once
+    python run_collector.py --status
+
+Код завершения: 0 — успешно, 1 — ошибка, 2 — процессы сборщика завершались аварийно
+и были перезапущены.
+"""
+
+import argparse
+import json
+import sys
+
+from app.services.shard_collector import run_sharded_collector, shard_status
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Сборщик событий RDP в несколько процессов"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="число процессов (по умолчанию RDP_SHARD_PROCESSES)"
+    )
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="собрать каждый сервер один раз и завершиться",
+    )
+    parser.add_argument(
+        "--status", action="store_true", help="показать аренду серверов и завершиться"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        if args.status:
+            print(json.dumps(shard_status(), ensure_ascii=False, indent=2))
+            return 0
+        crashes = run_sharded_collector(args.workers, once=args.once)
+    except Exception as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    if crashes:
+        print(f"Процессы сборщика завершались аварийно: {crashes}", file=sys.stderr)
+    return 2 if crashes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
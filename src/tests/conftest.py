@@ -0,0 +1,18 @@
+import os
+from pathlib import Path
+
+import pytest
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+
+
+@pytest.fixture
+def golden():
+    # Сравнение с эталоном tests/golden/<name>; UPDATE_GOLDEN=1 перезаписывает эталоны
+    def check(name: str, actual: str) -> None:
+        path = GOLDEN_DIR / name
+        if os.getenv("UPDATE_GOLDEN") == "1":
+            path.write_text(actual, encoding="utf-8", newline="\n")
+        assert actual == path.read_text(encoding="utf-8")
+
+    return check
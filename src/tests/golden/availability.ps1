@@ -0,0 +1,41 @@
+$ErrorActionPreference = 'Stop'
+$logName = 'Microsoft-Windows-TerminalServices-LocalSessionManager/Operational'
+$xpath = '*[System[(EventID=21 or EventID=23)]]'
+function First-Event([switch]$Oldest) {
+    try {
+        $filter = @{ LogName = $logName; FilterXPath = $xpath }
+        $first = Get-WinEvent @filter -MaxEvents 1 -Oldest:$Oldest
+    } catch {
+        if ($_.FullyQualifiedErrorId -notlike 'NoMatchingEventsFound*') { throw }
+        return $null
+    }
+    return $first | Select-Object RecordId, TimeCreated
+}
+function Count-Events([string]$query) {
+    $pathType = [System.Diagnostics.Eventing.Reader.PathType]::LogName
+    $queryArgs = @($logName, $pathType, $query)
+    $logQuery = New-Object System.Diagnostics.Eventing.Reader.EventLogQuery $queryArgs
+    $reader = New-Object System.Diagnostics.Eventing.Reader.EventLogReader($logQuery)
+    $count = 0
+    try {
+        while (($record = $reader.ReadEvent()) -ne $null) {
+            $count++
+            $record.Dispose()
+        }
+    } finally {
+        $reader.Dispose()
+    }
+    return $count
+}
+$log = Get-WinEvent -ListLog $logName
+$result = [ordered]@{
+    IsEnabled = $log.IsEnabled
+    LogMode = [string]$log.LogMode
+    RecordCount = $log.RecordCount
+    FileSize = $log.FileSize
+    MaximumSizeInBytes = $log.MaximumSizeInBytes
+    Oldest = First-Event -Oldest
+    Newest = First-Event
+    Counts = [ordered]@{ '30' = (Count-Events '*[System[(EventID=21 or EventID=23) and TimeCreated[timediff(@SystemTime) <= 2592000000]]]'); '90' = (Count-Events '*[System[(EventID=21 or EventID=23) and TimeCreated[timediff(@SystemTime) <= 7776000000]]]') }
+}
+ConvertTo-Json -InputObject $result -Compress -Depth 4
@@ -0,0 +1,14 @@
+$ErrorActionPreference = 'Stop'
+$xpath = '*[System[(EventID=21 or EventID=23) and EventRecordID>12345]]'
+try {
+    $events = @(Get-WinEvent -LogName 'Microsoft-Windows-TerminalServices-LocalSessionManager/Operational' -FilterXPath $xpath)
+} catch {
+    if ($_.FullyQualifiedErrorId -notlike 'NoMatchingEventsFound*') { throw }
+    $events = @()
+}
+$rows = @($events |
+  Select-Object RecordId, TimeCreated, Id,
+    @{Name='User';Expression={$_.Properties[1].Value}},
+    @{Name='UserName';Expression={$_.Properties[0].Value}} |
+  Sort-Object TimeCreated)
+ConvertTo-Json -InputObject $rows -Compress -Depth 4
@@ -0,0 +1,39 @@
+$ErrorActionPreference = 'Stop'
+$start = [datetime]::ParseExact('2025-04-01T00:00:00', 's', [Globalization.CultureInfo]::InvariantCulture)
+$end = [datetime]::ParseExact('2025-04-30T23:59:59', 's', [Globalization.CultureInfo]::InvariantCulture)
+$xpath = '*[System[(EventID=21 or EventID=23) and TimeCreated[@SystemTime>=''{0}'' and @SystemTime<=''{1}'']]]' -f $start.ToUniversalTime().ToString('yyyy-MM-dd''T''HH:mm:ss.fff''Z'''), $end.ToUniversalTime().ToString('yyyy-MM-dd''T''HH:mm:ss.fff''Z''')
+try {
+    $events = @(Get-WinEvent -LogName 'Microsoft-Windows-TerminalServices-LocalSessionManager/Operational' -FilterXPath $xpath)
+} catch {
+    if ($_.FullyQualifiedErrorId -notlike 'NoMatchingEventsFound*') { throw }
+    $events = @()
+}
+$names = New-Object 'System.Collections.Generic.Dictionary[string,int]'
+$out = New-Object System.Text.StringBuilder
+[void]$out.Append("RDPC1`n")
+$count = 0
+foreach ($e in @($events | Sort-Object TimeCreated)) {
+    $name = $e.Properties[0].Value
+    $index = 0
+    if (-not $names.TryGetValue([string]$name, [ref]$index)) {
+        $index = $names.Count
+        $names.Add([string]$name, $index)
+        $json = ConvertTo-Json -InputObject $name -Compress
+        [void]$out.Append("U`t").Append($json).Append("`n")
+    }
+    $ms = ([DateTimeOffset]$e.TimeCreated).ToUnixTimeMilliseconds()
+    [void]$out.Append($e.RecordId).Append(',').Append($ms).Append(',')
+    [void]$out.Append($e.Id).Append(',').Append($index).Append(',')
+    [void]$out.Append([string]$e.Properties[1].Value).Append("`n")
+    $count++
+}
+[void]$out.Append("E`t").Append($count).Append("`n")
+$bytes = [Text.Encoding]::UTF8.GetBytes($out.ToString())
+$buffer = New-Object IO.MemoryStream
+$mode = [IO.Compression.CompressionMode]::Compress
+$gzip = New-Object IO.Compression.GZipStream($buffer, $mode)
+$gzip.Write($bytes, 0, $bytes.Length)
+$gzip.Close()
+"RDPC1 gzip"
+$lineBreaks = [Base64FormattingOptions]::InsertLineBreaks
+[Convert]::ToBase64String($buffer.ToArray(), $lineBreaks)
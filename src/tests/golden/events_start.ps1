@@ -0,0 +1,15 @@
+$ErrorActionPreference = 'Stop'
+$start = [datetime]::ParseExact('2025-04-01T00:00:00', 's', [Globalization.CultureInfo]::InvariantCulture)
+$xpath = '*[System[(EventID=21 or EventID=23) and TimeCreated[@SystemTime>=''{0}'']]]' -f $start.ToUniversalTime().ToString('yyyy-MM-dd''T''HH:mm:ss.fff''Z'''), ''
+try {
+    $events = @(Get-WinEvent -LogName 'Microsoft-Windows-TerminalServices-LocalSessionManager/Operational' -FilterXPath $xpath)
+} catch {
+    if ($_.FullyQualifiedErrorId -notlike 'NoMatchingEventsFound*') { throw }
+    $events = @()
+}
+$rows = @($events |
+  Select-Object RecordId, TimeCreated, Id,
+    @{Name='User';Expression={$_.Properties[1].Value}},
+    @{Name='UserName';Expression={$_.Properties[0].Value}} |
+  Sort-Object TimeCreated)
+ConvertTo-Json -InputObject $rows -Compress -Depth 4
@@ -0,0 +1,126 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from app.services import availability, event_store
+from app.services.availability import (
+    AvailabilityCache,
+    ServerAvailability,
+    get_available_dates,
+    parse_availability_output,
+)
+from app.services.collector import ServerResult
+from app.services.events import Event
+
+SERVERS = ["fake01", "fake02"]
+
+
+def _ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+def _record(record_id: int, at: datetime) -> dict:
+    return {"RecordId": record_id, "TimeCreated": f"/Date({_ms(at)})/"}
+
+
+def test_parse_availability_output():
+    output = "\ufeff" + json.dumps(
+        {
+            "IsEnabled": True,
+            "LogMode": "Circular",
+            "RecordCount": 1200,
+            "FileSize": 69632,
+            "MaximumSizeInBytes": 1052672,
+            "Oldest": _record(1, datetime(2025, 3, 1, 8)),
+            "Newest": _record(1200, datetime(2025, 4, 30, 18)),
+            "Counts": {"30": 400, "90": 1200},
+        }
+    )
+    result = parse_availability_output(output.encode(), "srv")
+    assert result.ok and result.log_mode == "Circular" and result.log_records == 1200
+    assert result.first_event == "2025-03-01T08:00:00"
+    assert result.last_event == "2025-04-30T18:00:00"
+    assert result.recent_events == {"30": 400, "90": 1200}
+
+
+def test_parse_empty_log():
+    output = json.dumps(
+        {"IsEnabled": True, "RecordCount": 0, "Oldest": None, "Newest": None}
+    )
+    result = parse_availability_output(output.encode(), "srv")
+    assert result.first_event is None and result.last_event is None
+    assert result.recent_events == {}
+
+
+def test_cache_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(availability.time, "monotonic", lambda: now[0])
+    cache = AvailabilityCache(ttl=300, error_ttl=30)
+    cache.put(ServerAvailability(server="ok", ok=True))
+    cache.put(ServerAvailability(server="down", ok=False, error="timeout"))
+    now[0] += 31
+    # Ошибка опроса хранится меньше, чем сведения о журнале
+    assert cache.get("down") is None
+    assert cache.get("ok") is not None
+    now[0] += 270
+    assert cache.get("ok") is None
+
+
+@pytest.fixture
+def fake_servers(monkeypatch, tmp_path):
+    # Имитация серверов (benchmarks.fake_winrm); fake02 не отвечает.
+    # Серверы, к которым выполнен запрос, записываются в calls
+    env = {
+        "RDP_SESSION_FACTORY": "benchmarks.fake_winrm:FakeSession",
+        "RDP_LOG_USERNAME": "user",
+        "RDP_LOG_PASSWORD": "password",
+        "RDP_SERVERS": ",".join(SERVERS),
+        "RDP_STORE_PATH": str(tmp_path / "events.sqlite3"),
+        "RDP_FAKE_DAYS": "3",
+        "RDP_FAKE_USERS": "2",
+        "RDP_FAKE_LATENCY_MS": "0",
+        "RDP_FAKE_CONNECT_MS": "0",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(event_store, "_store", None)
+    monkeypatch.setattr(availability, "_cache", None)
+
+    calls = []
+    run_ps_on_server = availability.run_ps_on_server
+
+    def recording_run(server, script, settings):
+        calls.append(server)
+        if server == "fake02":
+            return ServerResult(server=server, ok=False, error="имитация: нет ответа")
+        return run_ps_on_server(server, script, settings)
+
+    monkeypatch.setattr(availability, "run_ps_on_server", recording_run)
+    return calls
+
+
+def test_available_dates(fake_servers):
+    # В хранилище есть события fake02 старше журнала серверов
+    stored = datetime(2024, 12, 1, 9, 0)
+    event_store.get_event_store().add_events(
+        [
+            Event("fake02", 1, _ms(stored), 21, "5", "DOMAIN\\ivanov"),
+        ]
+    )
+
+    result = get_available_dates()
+    assert sorted(fake_servers) == SERVERS
+    servers = {item["server"]: item for item in result["servers"]}
+    assert servers["fake01"]["ok"] and servers["fake01"]["log_records"] > 0
+    assert not servers["fake02"]["ok"] and servers["fake02"]["error"]
+    assert servers["fake02"]["stored_first_event"] == stored.isoformat()
+    assert result["first_date"] == "2024-12-01"
+    assert result["last_date"] == servers["fake01"]["last_event"][:10]
+
+    # Повторный запрос — из кэша, refresh опрашивает серверы снова
+    fake_servers.clear()
+    assert get_available_dates() == result
+    assert fake_servers == []
+    get_available_dates(refresh=True)
+    assert sorted(fake_servers) == SERVERS
@@ -0,0 +1,122 @@
+import base64
+import gzip
+import json
+
+import pytest
+
+from app.services.events import Event, iter_events_output, iter_json_items
+
+
+def _item(record_id: int, time_ms: int, event_id: int, user: str, username: str):
+    # Строка вывода Select-Object, как её отдаёт ConvertTo-Json
+    return {
+        "RecordId": record_id,
+        "TimeCreated": f"/Date({time_ms})/",
+        "Id": event_id,
+        "User": user,
+        "UserName": username,
+    }
+
+
+ROWS = [
+    (101, 1743490800000, 21, "5", "DOMAIN\\ivanov"),
+    (102, 1743494400000, 23, "5", "DOMAIN\\ivanov"),
+    (103, 1743498000000, 21, "7", "DOMAIN\\петров"),
+]
+ITEMS = [_item(*row) for row in ROWS]
+EVENTS = [Event("srv", *row) for row in ROWS]
+
+
+def _split(payload: bytes, size: int):
+    return [payload[i : i + size] for i in range(0, len(payload), size)]
+
+
+@pytest.mark.parametrize("payload", [b"", b"\xef\xbb\xbf\r\n", b"  \r\n\r\n"])
+def test_empty_output(payload):
+    assert list(iter_events_output([payload], "srv")) == []
+
+
+def test_single_object():
+    # ConvertTo-Json без массива, когда событие одно
+    payload = json.dumps(ITEMS[0], indent=4).encode()
+    assert list(iter_events_output([payload], "srv")) == EVENTS[:1]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_array_across_chunks(size):
+    # Порции режут объекты, числа и многобайтовые символы UTF-8 в произвольных местах
+    payload = b"\xef\xbb\xbf" + json.dumps(ITEMS, indent=4, ensure_ascii=False).encode()
+    assert list(iter_events_output(_split(payload, size), "srv")) == EVENTS
+
+
+def test_trailing_number_waits_for_next_chunk():
+    assert list(iter_json_items([b"[1", b"23]"])) == [123]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        json.dumps(ITEMS).encode()[:-1],
+        json.dumps(ITEMS).encode()[:-20],
+        json.dumps(ITEMS[0]).encode()[:-5],
+    ],
+)
+def test_truncated_output(payload):
+    with pytest.raises(ValueError):
+        list(iter_events_output(_split(payload, 16), "srv"))
+
+
+def test_data_after_array():
+    with pytest.raises(ValueError):
+        list(iter_events_output([json.dumps(ITEMS).encode() + b"{}"], "srv"))
+
+
+def _compact(rows, count=None, compress=False) -> bytes:
+    # Компактный вывод скрипта ps_commands (RDP_WIRE_FORMAT=compact/compact-gzip)
+    usernames = sorted({row[4] for row in rows})
+    lines = ["RDPC1"] + ["U\t" + json.dumps(name) for name in usernames]
+    lines += [
+        f"{record_id},{time_ms},{event_id},{usernames.index(username)},{user}"
+        for record_id, time_ms, event_id, user, username in rows
+    ]
+    lines.append(f"E\t{len(rows) if count is None else count}")
+    text = "".join(line + "\r\n" for line in lines).encode()
+    if not compress:
+        return text
+    encoded = base64.b64encode(gzip.compress(text)).decode()
+    lines = [encoded[i : i + 76] for i in range(0, len(encoded), 76)]
+    return "".join(line + "\r\n" for line in ["RDPC1 gzip"] + lines).encode()
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("size", [1, 5, 4096])
+def test_compact_round_trip(compress, size):
+    payload = _compact(ROWS, compress=compress)
+    assert list(iter_events_output(_split(payload, size), "srv")) == EVENTS
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_compact_empty(compress):
+    assert list(iter_events_output([_compact([], compress=compress)], "srv")) == []
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("cut", [3, 10, 30])
+def test_compact_truncated(compress, cut):
+    payload = _compact(ROWS, compress=compress)
+    with pytest.raises(ValueError):
+        list(iter_events_output(_split(payload[:-cut], 16), "srv"))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+@pytest.mark.parametrize("count", [2, 4])
+def test_compact_count_mismatch(compress, count):
+    with pytest.raises(ValueError, match="получено 3 событий"):
+        payload = _compact(ROWS, count=count, compress=compress)
+        list(iter_events_output([payload], "srv"))
+
+
+def test_compact_bad_line():
+    payload = _compact(ROWS).replace(b"101,", b"x01,")
+    with pytest.raises(ValueError, match="Некорректная строка"):
+        list(iter_events_output([payload], "srv"))
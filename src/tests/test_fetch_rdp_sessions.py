@@ -0,0 +1,59 @@
+import csv
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+
+from fetch_rdp_sessions import CSV_HEADER, TOTAL_SERVER
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+
+
+def test_csv_on_stdout_has_no_log_lines(tmp_path):
+    # Выгрузка через CLI с имитацией серверов: журнал (уровень INFO) уходит в stderr,
+    # в stdout — только CSV
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(SRC_DIR),
+        RDP_SESSION_FACTORY="benchmarks.fake_winrm:FakeSession",
+        RDP_LOG_USERNAME="user",
+        RDP_LOG_PASSWORD="password",
+        RDP_SERVERS="fake01,fake02",
+        RDP_STORE_PATH=str(tmp_path / "events.sqlite3"),
+        RDP_FAKE_DAYS="4",
+        RDP_FAKE_USERS="3",
+        RDP_FAKE_LATENCY_MS="0",
+        RDP_FAKE_CONNECT_MS="0",
+        RDP_LOG_LEVEL="INFO",
+        RDP_LOG_FORMAT="text",
+    )
+    start = (date.today() - timedelta(days=3)).isoformat()
+    end = (date.today() - timedelta(days=1)).isoformat()
+    process = subprocess.run(
+        [sys.executable, "fetch_rdp_sessions.py", "--start", start, "--end", end],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        timeout=120,
+    )
+    stdout, stderr = process.stdout.decode(), process.stderr.decode()
+    assert process.returncode == 0, stderr
+    assert " | INFO | " in stderr
+    assert f"Отчёт за период {start} - {end}" in stderr
+
+    rows = list(csv.reader(stdout.splitlines(), delimiter=";"))
+    assert rows[0] == CSV_HEADER
+    assert len(rows) > 1 and all(len(row) == len(CSV_HEADER) for row in rows)
+    for level in ("DEBUG", "INFO", "WARNING", "ERROR"):
+        assert f" | {level} | " not in stdout
+
+    # Итог за день равен сумме сессий пользователя за этот день
+    sessions, day_totals = defaultdict(int), {}
+    for day, _, username, server, _, _, _, _, seconds in rows[1:]:
+        if server != TOTAL_SERVER:
+            sessions[day, username] += int(seconds)
+        elif day != f"{start} - {end}":
+            day_totals[day, username] = int(seconds)
+    assert day_totals == dict(sessions)
@@ -0,0 +1,119 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from winrm.exceptions import WinRMOperationTimeoutError
+
+from app.services import collector, health
+from app.services.health import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    HealthRegistry,
+    HealthSettings,
+    ServerUnavailable,
+)
+from app.services.winrm_pool import PooledConnection
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Управляемое time.monotonic автомата защиты
+    now = [1000.0]
+    monkeypatch.setattr(health.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _state(registry: HealthRegistry, server: str = "srv") -> str:
+    return registry.status([server])[0]["state"]
+
+
+def test_breaker_transitions(clock):
+    settings = HealthSettings(threshold=2, cooldown=30, max_cooldown=100)
+    registry = HealthRegistry(settings)
+    error = ConnectionError("connection refused")
+
+    registry.before_call("srv")
+    registry.record_failure("srv", error)
+    assert _state(registry) == CLOSED
+    registry.record_failure("srv", error)
+    assert _state(registry) == OPEN
+    assert registry.is_open("srv")
+    with pytest.raises(ServerUnavailable):
+        registry.before_call("srv")
+
+    # Пауза прошла: пропускается ровно один пробный запрос
+    clock[0] += 30
+    registry.before_call("srv")
+    assert _state(registry) == HALF_OPEN
+    with pytest.raises(ServerUnavailable):
+        registry.before_call("srv")
+
+    # Неудачная проба снова размыкает автомат на удвоенную паузу
+    registry.record_failure("srv", error)
+    assert _state(registry) == OPEN
+    clock[0] += 59
+    with pytest.raises(ServerUnavailable):
+        registry.before_call("srv")
+    clock[0] += 1
+    registry.before_call("srv")
+    assert _state(registry) == HALF_OPEN
+
+    registry.record_success("srv")
+    assert _state(registry) == CLOSED
+    registry.before_call("srv")
+    assert registry.status(["srv"])[0]["consecutive_failures"] == 0
+
+
+def test_release_allows_new_probe(clock):
+    registry = HealthRegistry(HealthSettings(threshold=1, cooldown=10))
+    registry.record_failure("srv", TimeoutError("timeout"))
+    clock[0] += 10
+    registry.before_call("srv")
+    registry.release("srv")
+    registry.before_call("srv")
+    assert _state(registry) == HALF_OPEN
+
+
+class _Protocol:
+    # Протокол WS-Man: два ожидания до OperationTimeout, затем две порции вывода
+    def __init__(self):
+        self.responses = [
+            WinRMOperationTimeoutError(),
+            WinRMOperationTimeoutError(),
+            (b"[", b"", 0, False),
+            (b"]", b"", 0, True),
+        ]
+
+    def open_shell(self, **kwargs) -> str:
+        return "shell"
+
+    def run_command(self, shell_id: str, command: str) -> str:
+        return "command"
+
+    def _raw_get_command_output(self, shell_id: str, command_id: str):
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def cleanup_command(self, shell_id: str, command_id: str) -> None:
+        pass
+
+
+def test_operation_timeout_is_not_latency(monkeypatch):
+    registry = HealthRegistry(HealthSettings())
+    observed = []
+    monkeypatch.setattr(
+        registry, "observe_latency", lambda server, seconds: observed.append(server)
+    )
+    monkeypatch.setattr(collector, "get_server_health", lambda: registry)
+    conn = PooledConnection(
+        server="srv", session=SimpleNamespace(protocol=_Protocol()), fingerprint=None
+    )
+
+    deadline = time.monotonic() + 60
+    chunks = list(collector._iter_ps_output(conn, "Get-Date", deadline, 60))
+    assert chunks == [(b"[", b"", 0), (b"]", b"", 0)]
+    # run_command и два ответа с выводом; ожидания до OperationTimeout не учитываются
+    assert observed == ["srv"] * 3
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import pairing
+from app.services.events import Event
+from app.services.pairing import (
+    format_duration,
+    format_segment,
+    pair_events,
+    split_by_day,
+)
+
+
+def _event(record_id: int, at: datetime, event_id: int, user: str = "5") -> Event:
+    return Event(
+        "srv", record_id, int(at.timestamp() * 1000), event_id, user, "DOMAIN\\ivanov"
+    )
+
+
+@pytest.fixture
+def open_limit(monkeypatch):
+    def set_hours(hours: float) -> None:
+        monkeypatch.setenv("RDP_MAX_OPEN_SESSION_HOURS", str(hours))
+        pairing.max_open_session.cache_clear()
+
+    yield set_hours
+    pairing.max_open_session.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "seconds, expected",
+    [
+        (0, "0:00:00"),
+        (59, "0:00:59"),
+        (3661, "1:01:01"),
+        (86400, "24:00:00"),
+        (200000, "55:33:20"),
+    ],
+)
+def test_format_duration(seconds, expected):
+    assert format_duration(timedelta(seconds=seconds)) == expected
+
+
+def test_open_session_ends_with_logon_day_by_default(open_limit):
+    open_limit(0)
+    logon = datetime(2025, 4, 1, 9, 0, 0)
+    [session] = pair_events([_event(1, logon, 21)])
+    segments = list(split_by_day(session, until=datetime(2025, 4, 10)))
+    assert len(segments) == 1
+    record = format_segment(segments[0])
+    assert record["logout_time"] == "23:59:59"
+    assert record["duration"] == "14:59:59 (нет выхода)"
+    assert record["duration_seconds"] == 14 * 3600 + 59 * 60 + 59
+
+
+def test_open_session_limit_in_hours(open_limit):
+    open_limit(30)
+    logon = datetime(2025, 4, 1, 9, 0, 0)
+    [session] = pair_events([_event(1, logon, 21)])
+    segments = list(split_by_day(session, until=datetime(2025, 4, 10)))
+    assert [segment.day.isoformat() for segment in segments] == [
+        "2025-04-01",
+        "2025-04-02",
+    ]
+    assert segments[-1].end == logon + timedelta(hours=30)
+    # Пока предел не наступил, сессия считается до until
+    segments = list(split_by_day(session, until=datetime(2025, 4, 1, 12, 0, 0)))
+    assert segments[-1].end == datetime(2025, 4, 1, 12, 0, 0)
+
+
+def test_session_replaced_by_new_logon_is_limited(open_limit):
+    open_limit(0)
+    first, second = datetime(2025, 4, 1, 22, 0, 0), datetime(2025, 4, 3, 8, 0, 0)
+    sessions = list(pair_events([_event(1, first, 21), _event(2, second, 21)]))
+    segments = list(split_by_day(sessions[0], until=datetime(2025, 4, 10)))
+    assert [(segment.start, segment.end) for segment in segments] == [
+        (first, datetime(2025, 4, 1, 23, 59, 59))
+    ]
+
+
+def test_closed_session_over_midnight(open_limit):
+    logon, logoff = datetime(2025, 4, 1, 22, 0, 0), datetime(2025, 4, 3, 1, 30, 0)
+    [session] = pair_events([_event(1, logon, 21), _event(2, logoff, 23)])
+    records = [
+        format_segment(segment) for segment in split_by_day(session, until=logoff)
+    ]
+    assert [record["logout_time"] for record in records] == [
+        "23:59:59",
+        "23:59:59",
+        "01:30:00",
+    ]
+    assert [record["duration"] for record in records] == [
+        "1:59:59",
+        "23:59:59",
+        "1:30:00",
+    ]
+    assert [record["duration_seconds"] for record in records] == [7200, 86400, 5400]
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.ps_commands import (
+    WIRE_COMPACT,
+    WIRE_COMPACT_GZIP,
+    WIRE_JSON,
+    build_availability_command,
+    build_events_command,
+    build_sessions_command,
+    ps_quote,
+    report_bounds,
+)
+
+START = datetime(2025, 4, 1, 0, 0, 0)
+END = datetime(2025, 4, 30, 23, 59, 59)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("plain", "'plain'"),
+        ("O'Brien", "'O''Brien'"),
+        ("‘left’ ‚low‛", "'‘‘left’’ ‚‚low‛‛'"),
+        ("$(Remove-Item C:\\) `n", "'$(Remove-Item C:\\) `n'"),
+        ("", "''"),
+        (42, "'42'"),
+    ],
+)
+def test_ps_quote(value, expected):
+    assert ps_quote(value) == expected
+
+
+def test_events_command_period(golden):
+    golden("events_period.ps1", build_events_command(START, END))
+
+
+def test_events_command_start_only(golden):
+    golden("events_start.ps1", build_events_command(start=START))
+
+
+def test_events_command_end_only(golden):
+    golden("events_end.ps1", build_events_command(end=END))
+
+
+def test_events_command_after_record_id(golden):
+    golden("events_after_record_id.ps1", build_events_command(after_record_id=12345))
+
+
+def test_events_command_after_record_id_and_period(golden):
+    golden(
+        "events_after_record_id_period.ps1",
+        build_events_command(START, END, after_record_id=12345),
+    )
+
+
+@pytest.mark.parametrize("wire_format", [WIRE_JSON, WIRE_COMPACT, WIRE_COMPACT_GZIP])
+def test_events_command_wire_format(golden, wire_format):
+    golden(
+        f"events_{wire_format}.ps1",
+        build_events_command(START, END, wire_format=wire_format),
+    )
+
+
+def test_events_command_validation():
+    with pytest.raises(ValueError):
+        build_events_command(wire_format="xml")
+    with pytest.raises(ValueError):
+        build_events_command(event_ids=[])
+    # RecordId приводится к числу: подстановка в XPath невозможна
+    with pytest.raises(ValueError):
+        build_events_command(after_record_id="1 or 1=1")
+
+
+def test_sessions_command_matches_bounds():
+    assert build_sessions_command("2025-04-01", "2025-04-30") == build_events_command(
+        START, END
+    )
+
+
+@pytest.mark.parametrize(
+    "start_date, end_date",
+    [
+        ("2025-04-31", "2025-05-01"),
+        ("2025-04-01'; Remove-Item C:\\ #", "2025-04-30"),
+        ("2025-05-01", "2025-04-30"),
+    ],
+)
+def test_report_bounds_rejects(start_date, end_date):
+    with pytest.raises(ValueError):
+        report_bounds(start_date, end_date)
+
+
+def test_availability_command(golden):
+    script = build_availability_command((30, 90))
+    assert "Get-WinEvent -ListLog $logName" in script
+    assert "-MaxEvents 1 -Oldest:$Oldest" in script
+    golden("availability.ps1", script)
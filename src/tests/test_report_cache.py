@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import report_cache
+from app.services.report_cache import ReportCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Управляемое time.monotonic кэша
+    now = [1000.0]
+    monkeypatch.setattr(report_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _day(days_ago: int) -> str:
+    return (date.today() - timedelta(days=days_ago)).isoformat()
+
+
+def test_recent_days_expire_by_ttl(clock):
+    cache = ReportCache(today_ttl=60, settle_days=1)
+    for days_ago in range(4):
+        cache.put(_day(days_ago), {"day": days_ago})
+    clock[0] += 59
+    assert all(cache.get(_day(days_ago)) == {"day": days_ago} for days_ago in range(4))
+    clock[0] += 2
+    # Сегодня и вчера (settle_days=1) устарели, более ранние дни хранятся без срока
+    assert cache.get(_day(0)) is None
+    assert cache.get(_day(1)) is None
+    assert cache.get(_day(2)) == {"day": 2}
+    assert cache.get(_day(3)) == {"day": 3}
+    assert cache.stats() == {"days": 2, "hits": 6, "misses": 2}
+
+
+def test_lru_eviction(clock):
+    cache = ReportCache(max_days=2)
+    cache.put("2025-04-01", {"day": 1})
+    cache.put("2025-04-02", {"day": 2})
+    assert cache.get("2025-04-01") == {"day": 1}
+    # Вытесняется давно не использованный 2025-04-02, а не первый добавленный
+    cache.put("2025-04-03", {"day": 3})
+    assert cache.get("2025-04-02") is None
+    assert cache.get("2025-04-01") == {"day": 1}
+    assert cache.get("2025-04-03") == {"day": 3}
+    assert cache.stats()["days"] == 2
+
+
+def test_invalidate():
+    cache = ReportCache()
+    for day in ("2025-04-01", "2025-04-02", "2025-04-03"):
+        cache.put(day, {})
+    assert cache.invalidate(["2025-04-02", "2025-04-05"]) == 1
+    assert cache.get("2025-04-02") is None
+    assert cache.invalidate() == 2
+    assert cache.stats()["days"] == 0
+
+
+def test_delete_cache_endpoint(monkeypatch):
+    cache = ReportCache()
+    monkeypatch.setattr(report_cache, "_cache", cache)
+    for day in ("2025-04-01", "2025-04-02", "2025-04-03", "2025-04-04"):
+        cache.put(day, {})
+    client = TestClient(app)
+
+    period = {"start_date": "2025-04-02", "end_date": "2025-04-03"}
+    response = client.delete("/api/v1/rdp/cache", params=period)
+    assert response.status_code == 200
+    assert response.json()["invalidated"] == 2
+    assert cache.get("2025-04-02") is None and cache.get("2025-04-03") is None
+    assert cache.get("2025-04-01") == {}
+
+    response = client.delete("/api/v1/rdp/cache")
+    assert response.json()["invalidated"] == 2
+    assert cache.stats()["days"] == 0
+
+    response = client.delete("/api/v1/rdp/cache", params={"start_date": "2025-04-31"})
+    assert response.status_code == 400
@@ -0,0 +1,91 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from app.services import pairing
+from app.services.event_store import EventStore
+from app.services.events import Event
+from app.services.sessions import refresh_sessions
+
+IVANOV, PETROV = "DOMAIN\\ivanov", "DOMAIN\\petrov"
+
+
+def _event(record_id: int, at: datetime, event_id: int, user: str, username: str):
+    return Event("srv", record_id, int(at.timestamp() * 1000), event_id, user, username)
+
+
+def _ts(*args) -> int:
+    return int(datetime(*args).timestamp())
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    monkeypatch.setenv("RDP_MAX_OPEN_SESSION_HOURS", "0")
+    pairing.max_open_session.cache_clear()
+    yield EventStore(str(tmp_path / "events.sqlite3"))
+    pairing.max_open_session.cache_clear()
+
+
+def _rows(store: EventStore, query: str) -> list:
+    conn = sqlite3.connect(store.path)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def test_late_logoff_closes_session(store):
+    # Пакет 1: закрытая сессия petrov (user 7) и вход ivanov (user 5) без выхода
+    store.add_events(
+        [
+            _event(1, datetime(2025, 4, 1, 10, 0), 21, "7", PETROV),
+            _event(2, datetime(2025, 4, 1, 11, 0), 23, "7", PETROV),
+            _event(3, datetime(2025, 4, 1, 22, 0), 21, "5", IVANOV),
+        ]
+    )
+    assert refresh_sessions(store) == 2
+    query = "SELECT end_s, logout_server FROM sessions WHERE record_id = 3"
+    assert _rows(store, query) == [(None, None)]
+    assert _rows(store, "SELECT * FROM session_days WHERE record_id = 3") == []
+    petrov_session = _rows(store, "SELECT * FROM sessions WHERE record_id = 1")
+    petrov_days = _rows(store, "SELECT * FROM session_days WHERE record_id = 1")
+    assert len(petrov_days) == 1
+    seq = store.session_seq()
+
+    # Пакет 2: выход ivanov через день
+    store.add_events([_event(4, datetime(2025, 4, 3, 1, 30), 23, "5", IVANOV)])
+    assert store.dirty_servers() == ["srv"]
+    assert refresh_sessions(store) == 1
+    assert store.dirty_servers() == []
+
+    assert _rows(store, "SELECT * FROM sessions WHERE record_id = 3") == [
+        ("srv", 3, "5", IVANOV, _ts(2025, 4, 1, 22, 0), _ts(2025, 4, 3, 1, 30), "srv")
+    ]
+    days = _rows(
+        store,
+        "SELECT day, start_s, end_s, logout_server, continues "
+        "FROM session_days WHERE record_id = 3 ORDER BY day",
+    )
+    assert days == [
+        ("2025-04-01", _ts(2025, 4, 1, 22, 0), _ts(2025, 4, 2), "srv", 1),
+        ("2025-04-02", _ts(2025, 4, 2), _ts(2025, 4, 3), "srv", 1),
+        ("2025-04-03", _ts(2025, 4, 3), _ts(2025, 4, 3, 1, 30), "srv", 0),
+    ]
+    # Изменились только дни ivanov; сессия petrov на том же сервере не затронута
+    changes = store.session_changes(seq)
+    assert sorted(change[:3] for change in changes) == [
+        ("2025-04-01", IVANOV, "srv"),
+        ("2025-04-02", IVANOV, "srv"),
+        ("2025-04-03", IVANOV, "srv"),
+    ]
+    assert _rows(store, "SELECT * FROM sessions WHERE record_id = 1") == petrov_session
+    assert _rows(store, "SELECT * FROM session_days WHERE record_id = 1") == petrov_days
+
+
+def test_refresh_without_new_events(store):
+    store.add_events([_event(1, datetime(2025, 4, 1, 10, 0), 21, "7", PETROV)])
+    assert refresh_sessions(store) == 1
+    seq = store.session_seq()
+    assert refresh_sessions(store) == 0
+    assert store.session_changes(seq) == []
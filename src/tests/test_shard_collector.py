@@ -0,0 +1,52 @@
+import signal
+
+import pytest
+
+from app.services import event_store
+from app.services.shard_collector import run_sharded_collector
+
+SERVERS = ["fake01", "fake02", "fake03", "fake04"]
+
+
+@pytest.fixture
+def fake_servers(monkeypatch, tmp_path):
+    # Сборщик с имитацией серверов (benchmarks.fake_winrm) и временным хранилищем;
+    # процессы-сборщики получают те же переменные окружения
+    env = {
+        "RDP_SESSION_FACTORY": "benchmarks.fake_winrm:FakeSession",
+        "RDP_LOG_USERNAME": "user",
+        "RDP_LOG_PASSWORD": "password",
+        "RDP_SERVERS": ",".join(SERVERS),
+        "RDP_STORE_PATH": str(tmp_path / "events.sqlite3"),
+        "RDP_FAKE_DAYS": "2",
+        "RDP_FAKE_USERS": "5",
+        "RDP_FAKE_LATENCY_MS": "1",
+        "RDP_FAKE_CONNECT_MS": "1",
+        "RDP_SHARD_BATCH": "1",
+        "RDP_SCHEDULER_LOOKBACK_DAYS": "2",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(event_store, "_store", None)
+    handlers = {
+        signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)
+    }
+    yield
+    for signum, handler in handlers.items():
+        signal.signal(signum, handler)
+
+
+def test_sharded_collector_once(fake_servers):
+    crashes = run_sharded_collector(processes=2, once=True)
+    assert crashes == 0
+
+    store = event_store.get_event_store()
+    leases = store.list_leases(SERVERS)
+    assert [lease.server for lease in leases] == SERVERS
+    # Каждый сервер собран ровно один раз, аренда освобождена без ошибок
+    assert all(lease.cycles == 1 for lease in leases), [
+        (lease.server, lease.cycles) for lease in leases
+    ]
+    assert all(lease.owner is None and lease.failures == 0 for lease in leases)
+    for server in SERVERS:
+        assert store.server_bounds(server) is not None
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+CALLERS = 10
+
+
+def _run_concurrently(flight: SingleFlight, key, func):
+    async def main():
+        return await asyncio.gather(
+            *(flight.do(key, func) for _ in range(CALLERS)), return_exceptions=True
+        )
+
+    return asyncio.run(main())
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"report": len(calls)}
+
+    results = _run_concurrently(flight, "report", compute)
+    assert len(calls) == 1
+    assert results == [{"report": 1}] * CALLERS
+    # Все получают один и тот же объект
+    assert all(result is results[0] for result in results)
+    assert len(flight) == 0
+
+
+def test_exception_reaches_every_waiter():
+    flight = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("сервер недоступен")
+
+    results = _run_concurrently(flight, "report", fail)
+    assert len(calls) == 1
+    assert len(results) == CALLERS
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(flight) == 0
+
+
+def test_next_call_after_completion_runs_again():
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        return [await flight.do("report", compute), await flight.do("report", compute)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def main():
+        async def value(x):
+            await asyncio.sleep(0.01)
+            return x
+
+        return await asyncio.gather(
+            flight.do("a", lambda: value("a")), flight.do("b", lambda: value("b"))
+        )
+
+    assert asyncio.run(main()) == ["a", "b"]
+
+
+def test_cancelled_waiter_does_not_cancel_computation():
+    flight = SingleFlight()
+
+    async def main():
+        started = asyncio.Event()
+
+        async def compute():
+            started.set()
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("report", compute))
+        await started.wait()
+        second = asyncio.ensure_future(flight.do("report", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
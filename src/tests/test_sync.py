@@ -0,0 +1,146 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app.services import event_store, sync
+from app.services.collector import load_connection_settings
+from app.services.sync import _split_windows, sync_server
+
+SERVER = "fake01"
+
+
+def _ms(value: datetime) -> int:
+    return int(value.timestamp() * 1000)
+
+
+@pytest.fixture
+def fake_server(monkeypatch, tmp_path):
+    # Имитация сервера (benchmarks.fake_winrm) с журналом за 6 дней и временное
+    # хранилище; скрипты, отправленные серверу, записываются в calls
+    env = {
+        "RDP_SESSION_FACTORY": "benchmarks.fake_winrm:FakeSession",
+        "RDP_LOG_USERNAME": "user",
+        "RDP_LOG_PASSWORD": "password",
+        "RDP_SERVERS": SERVER,
+        "RDP_STORE_PATH": str(tmp_path / "events.sqlite3"),
+        "RDP_FAKE_DAYS": "6",
+        "RDP_FAKE_USERS": "3",
+        "RDP_FAKE_LATENCY_MS": "0",
+        "RDP_FAKE_CONNECT_MS": "0",
+        "RDP_SYNC_WINDOW_DAYS": "2",
+        "RDP_SYNC_WINDOW_RETRIES": "0",
+        "RDP_SYNC_PER_SERVER": "1",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(event_store, "_store", None)
+
+    calls, failing = [], set()
+    stream = sync.stream_ps_on_server
+
+    def recording_stream(server, script, settings):
+        calls.append(script)
+        if len(calls) in failing:
+            raise ConnectionError("имитация: сервер не ответил")
+        return stream(server, script, settings)
+
+    monkeypatch.setattr(sync, "stream_ps_on_server", recording_stream)
+    return calls, failing
+
+
+def _sync(since: datetime):
+    return sync_server(
+        SERVER, since, load_connection_settings(), event_store.get_event_store()
+    )
+
+
+def _max_record_id(store) -> int:
+    return max(event.record_id for event in store.iter_events(0, _ms(datetime.now())))
+
+
+def test_split_windows_on_shared_grid():
+    start = datetime(2025, 4, 2, 15, 30)
+    end = datetime(2025, 4, 9, 12, 0)
+    windows = _split_windows(_ms(start), _ms(end), 3)
+    assert windows[0][0] == _ms(start) and windows[-1][1] == _ms(end)
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    # Внутренние границы — полночь дней, номер которых кратен размеру окна
+    for _, boundary in windows[:-1]:
+        day = datetime.fromtimestamp(boundary / 1000)
+        assert day.time() == datetime.min.time() and day.toordinal() % 3 == 0
+    # Окна другого запроса совпадают с этими на общем участке
+    later = _split_windows(windows[1][0], _ms(end), 3)
+    assert later == windows[1:]
+
+
+def test_split_windows_open_end():
+    start = datetime.combine(date.today() - timedelta(days=5), datetime.min.time())
+    windows = _split_windows(_ms(start), None, 2)
+    assert windows[-1][1] is None
+    assert all(end is not None for _, end in windows[:-1])
+
+
+def test_first_sync_by_windows_then_by_record_id(fake_server):
+    calls, _ = fake_server
+    since = datetime.combine(date.today() - timedelta(days=5), datetime.min.time())
+    result = _sync(since)
+    assert result.ok and result.added > 0
+    windows = _split_windows(_ms(since), None, 2)
+    assert len(calls) == len(windows)
+    assert not any("EventRecordID>" in script for script in calls)
+
+    store = event_store.get_event_store()
+    state = store.get_state(SERVER)
+    assert state.last_record_id == _max_record_id(store)
+    assert state.covered_from_ms == _ms(since)
+    # Окна внутри покрытого участка больше не хранятся
+    assert store.fetched_windows(SERVER) == []
+
+    # Следующая синхронизация запрашивает только события после watermark
+    calls.clear()
+    watermark = state.last_record_id
+    assert _sync(since).ok
+    assert len(calls) == 1
+    assert f"EventRecordID>{watermark}]" in calls[0].replace(" ", "")
+    assert store.get_state(SERVER).last_record_id >= watermark
+
+
+def test_backfill_fetches_only_earlier_windows(fake_server):
+    calls, _ = fake_server
+    since = datetime.combine(date.today() - timedelta(days=2), datetime.min.time())
+    assert _sync(since).ok
+    covered_from = event_store.get_event_store().get_state(SERVER).covered_from_ms
+
+    calls.clear()
+    earlier = since - timedelta(days=3)
+    assert _sync(earlier).ok
+    backfill = _split_windows(_ms(earlier), covered_from, 2)
+    # Новые события по RecordId и окна более раннего периода
+    assert len(calls) == 1 + len(backfill)
+    assert "EventRecordID>" in calls[0].replace(" ", "")
+    state = event_store.get_event_store().get_state(SERVER)
+    assert state.covered_from_ms == _ms(earlier)
+
+
+def test_failed_window_is_retried_alone(fake_server):
+    calls, failing = fake_server
+    since = datetime.combine(date.today() - timedelta(days=5), datetime.min.time())
+    windows = _split_windows(_ms(since), None, 2)
+    assert len(windows) >= 3
+    failing.add(2)
+    result = _sync(since)
+    assert not result.ok
+    assert [failure.start_ms for failure in result.failures] == [windows[1][0]]
+
+    # Последнее окно загружено: watermark известен, покрыт участок после ошибки
+    store = event_store.get_event_store()
+    state = store.get_state(SERVER)
+    assert state.last_record_id is not None
+    assert state.covered_from_ms == windows[2][0]
+
+    calls.clear()
+    failing.clear()
+    assert _sync(since).ok
+    # RecordId после watermark и только окно, которое не загрузилось
+    assert len(calls) == 2
+    assert store.get_state(SERVER).covered_from_ms == _ms(since)
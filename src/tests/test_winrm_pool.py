@@ -0,0 +1,115 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import winrm_pool
+from app.services.winrm_pool import WinRMPool
+
+
+class _Session:
+    # Сессия pywinrm: учитывается только закрытие подключения
+    def __init__(self):
+        self.closed = False
+        self.protocol = SimpleNamespace(
+            transport=SimpleNamespace(close_session=self._close),
+            close_shell=lambda shell_id, close_session=False: None,
+        )
+
+    def _close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Управляемое time.monotonic пула
+    now = [1000.0]
+    monkeypatch.setattr(winrm_pool.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _stats(pool: WinRMPool, server: str = "srv") -> dict:
+    return next(vars(stats) for stats in pool.stats() if stats.server == server)
+
+
+def test_connection_is_reused(clock):
+    pool = WinRMPool(max_per_server=2, idle_timeout=120)
+    with pool.acquire("srv", "fp", _Session, timeout=1) as first:
+        pass
+    with pool.acquire("srv", "fp", _Session, timeout=1) as second:
+        assert second is first
+    assert first.uses == 2
+    stats = _stats(pool)
+    assert (stats["created"], stats["reused"]) == (1, 1)
+    assert (stats["idle"], stats["in_use"]) == (1, 0)
+
+
+def test_failed_block_discards_connection(clock):
+    pool = WinRMPool(max_per_server=1, idle_timeout=120)
+    with pytest.raises(RuntimeError):
+        with pool.acquire("srv", "fp", _Session, timeout=1) as conn:
+            raise RuntimeError("оболочка закрыта сервером")
+    assert conn.session.closed
+    with pool.acquire("srv", "fp", _Session, timeout=1) as fresh:
+        assert fresh is not conn
+    assert _stats(pool)["discarded"] == 1
+
+
+def test_changed_settings_discard_idle_connection(clock):
+    pool = WinRMPool(max_per_server=1, idle_timeout=120)
+    with pool.acquire("srv", "old", _Session, timeout=1) as old:
+        pass
+    with pool.acquire("srv", "new", _Session, timeout=1) as new:
+        assert new is not old
+    assert old.session.closed
+
+
+def test_per_server_cap():
+    pool = WinRMPool(max_per_server=2, idle_timeout=120)
+    held = [pool.acquire("srv", "fp", _Session, timeout=1) for _ in range(2)]
+    conns = [context.__enter__() for context in held]
+    # Третье подключение к тому же серверу не создаётся, другой сервер не ждёт
+    with pytest.raises(TimeoutError):
+        with pool.acquire("srv", "fp", _Session, timeout=0.05):
+            pass
+    with pool.acquire("other", "fp", _Session, timeout=0.05):
+        pass
+    assert _stats(pool)["in_use"] == 2
+
+    # Ожидающий запрос получает освободившееся подключение
+    got = []
+
+    def waiter():
+        with pool.acquire("srv", "fp", _Session, timeout=5) as conn:
+            got.append(conn)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    held[0].__exit__(None, None, None)
+    thread.join(5)
+    held[1].__exit__(None, None, None)
+    assert got and got[0] in conns
+    stats = _stats(pool)
+    assert stats["created"] == 2 and stats["in_use"] == 0 and stats["waits"] >= 1
+
+
+def test_prune_closes_idle_connections(clock):
+    pool = WinRMPool(max_per_server=2, idle_timeout=120)
+    first = pool.acquire("srv", "fp", _Session, timeout=1)
+    second = pool.acquire("srv", "fp", _Session, timeout=1)
+    old, recent = first.__enter__(), second.__enter__()
+    first.__exit__(None, None, None)
+    clock[0] += 100
+    second.__exit__(None, None, None)
+
+    clock[0] += 100
+    assert pool.prune() == 1
+    assert old.session.closed and not recent.session.closed
+    stats = _stats(pool)
+    assert (stats["idle"], stats["discarded"]) == (1, 1)
+    with pool.acquire("srv", "fp", _Session, timeout=1) as conn:
+        assert conn is recent
+
+    pool.close_all()
+    assert recent.session.closed
+    assert _stats(pool)["idle"] == 0